@@ -0,0 +1,77 @@
+'''
+This module serves the GET requests of the purchase order endpoints with
+coroutines under ASGI, see vendor_management/async_api.py
+
+The requests are parsed and the responses built by the helpers of views.py,
+only the database and the cache are read differently.
+'''
+from django.conf import settings
+from django.http import Http404
+from functools import partial
+from rest_framework import status
+from vendor_management.async_api import (
+    async_get, anot_modified, cached_response, json_response)
+from vendor_management.cache import (
+    purchase_order_key, aget_or_load, acurrent_version)
+from vendor_management.pagination import (
+    wants_cursor, acursor_page, wants_exact_count, atotal_count,
+    anumbered_page)
+from .models import PurchaseOrder
+from . import views
+
+
+@async_get(views.create_or_list_purchase)
+async def create_or_list_purchase(request):
+    '''
+    List the purchase orders, see views.create_or_list_purchase.
+    '''
+    vendor_id = request.query_params.get('vendor_id')
+    # select purchases from the vendor
+    vendor = None
+    if vendor_id:
+        vendor = await views.listing_vendors().filter(id=vendor_id).afirst()
+        if vendor is None:
+            raise Http404
+    all_orders, rows, known_count = views.listing_rows(vendor)
+    if wants_cursor(request):
+        try:
+            page, pagination = await acursor_page(request, rows)
+        except ValueError as error:
+            return json_response(
+                f'Error : {error}', status.HTTP_400_BAD_REQUEST)
+    else:
+        count = await atotal_count(
+            all_orders, wants_exact_count(request), known_count)
+        page, pagination = await anumbered_page(request, rows, count)
+    return json_response(views.listing_page(page, pagination))
+
+
+async def aload_purchase_order(purchase_order_id):
+    '''
+    Coroutine version of views.load_purchase_order.
+    '''
+    key = purchase_order_key(purchase_order_id)
+    # read before the row, a change made meanwhile bumps it again
+    version = await acurrent_version(key)
+    return views.purchase_order_payload(
+        await PurchaseOrder.objects.filter(id=purchase_order_id).afirst(),
+        key, version)
+
+
+@async_get(views.get_or_update_purchase_order)
+async def get_or_update_purchase_order(request, purchase_order_id):
+    '''
+    Retrieve the details of a purchase order, see
+        views.get_or_update_purchase_order.
+    '''
+    key = purchase_order_key(purchase_order_id)
+    # the client already holds the current version
+    response = await anot_modified(request, key)
+    if response is not None:
+        return response
+    payload = await aget_or_load(
+        key, partial(aload_purchase_order, purchase_order_id),
+        settings.PURCHASE_ORDER_CACHE_TIMEOUT)
+    if payload is None:
+        raise Http404
+    return cached_response(request, payload)
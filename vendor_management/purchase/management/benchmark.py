@@ -0,0 +1,360 @@
+'''
+This module benchmarks every API endpoint, for the benchmark_api command
+and the query budget test
+
+The database is seeded with a configurable volume of vendors and purchase
+orders, every route of the users, vendors and purchase apps is requested
+through the test client, and the latency percentiles and the number of
+SQL queries of each route are recorded so that runs can be compared.
+QUERY_BUDGETS caps the number of queries of each route, so that a change
+reintroducing a query per row is caught.
+'''
+import statistics
+import time
+import uuid
+from datetime import timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from purchase import metrics
+from purchase.models import PurchaseOrder
+from vendors.models import Vendor
+from vendors import ranking
+
+SEED_BATCH_SIZE = 1000
+# rows sent to the bulk creation endpoint per request
+BULK_ROWS = 100
+PASSWORD = 'benchmark-password'
+
+# highest number of SQL queries a single request of each route issues,
+# as measured; the token is read from the database by the first request
+# only, the BEGIN and COMMIT of a purchase order saved in its own
+# transaction count, and so does the HistoricalPerformance insert of an
+# order changing the metrics of its vendor
+QUERY_BUDGETS = {
+    'users.register': 3,
+    'users.login': 5,
+    'vendors.list': 2,
+    'vendors.list_cursor': 1,
+    'vendors.list_include': 2,
+    'vendors.create': 1,
+    'vendors.retrieve': 1,
+    'vendors.update': 2,
+    'vendors.delete': 9,
+    'vendors.performance': 1,
+    'vendors.performance_live': 1,
+    'vendors.performance_range': 3,
+    'vendors.performance_history': 2,
+    'vendors.performance_export': 2,
+    'vendors.leaderboard': 1,
+    'vendors.rank': 0,
+    'purchase.list': 2,
+    'purchase.list_vendor': 2,
+    'purchase.list_cursor': 1,
+    'purchase.create': 8,
+    'purchase.bulk_create': 10,
+    'purchase.bulk_acknowledge': 11,
+    'purchase.export': 2,
+    'purchase.retrieve': 1,
+    'purchase.update': 9,
+    'purchase.delete': 6,
+    'purchase.acknowledge': 9,
+}
+
+
+def seed(orders, vendors):
+    '''
+    Fill the database with vendors and purchase orders in bulk, then
+        build the performance counters, metrics and rankings of the vendors.
+
+    A third of the orders of every vendor are completed, some late and
+        most rated, and a tenth are canceled.
+
+    Parameters:
+        orders (int): The number of purchase orders.
+        vendors (int): The number of vendors they are spread across.
+
+    Returns:
+        list: The ids of the vendors.
+    '''
+    run = uuid.uuid4().hex[:6].upper()
+    created = Vendor.objects.bulk_create(
+        [Vendor(
+            name=f'Vendor {index}',
+            contact_details=f'vendor{index}@example.com',
+            address=f'{index} Benchmark Street',
+            vendor_code=f'B{run}{index:08d}')
+         for index in range(vendors)],
+        batch_size=SEED_BATCH_SIZE)
+    vendor_ids = [vendor.id for vendor in created]
+
+    now = timezone.now()
+    batch = []
+    for index in range(orders):
+        # the status follows the rank of the order among those of its
+        # vendor, so that every vendor gets all of them
+        rank = index // vendors
+        order_status = PurchaseOrder.PENDING
+        if rank % 3 == 0:
+            order_status = PurchaseOrder.COMPLETED
+        elif rank % 10 == 1:
+            order_status = PurchaseOrder.CANCELED
+        order = PurchaseOrder(
+            po_number=f'B{run}{index:010d}',
+            vendor_id=vendor_ids[index % vendors],
+            delivery_date=now + timedelta(days=index % 7 - 2),
+            items={'item': index % 50},
+            quantity=index % 100 + 1,
+            status=order_status,
+            quality_rating=(index % 5) + 1.0 if index % 4 else None)
+        order.set_generated_fields()
+        batch.append(order)
+        if len(batch) == SEED_BATCH_SIZE:
+            PurchaseOrder.objects.bulk_create(batch)
+            batch = []
+    PurchaseOrder.objects.bulk_create(batch)
+
+    metrics.rebuild_counters(vendor_ids)
+    for start in range(0, len(vendor_ids), SEED_BATCH_SIZE):
+        metrics.refresh_vendor_metrics(
+            vendor_ids[start:start + SEED_BATCH_SIZE])
+    # the vendors were created without signals
+    ranking.get_ranking().rebuild()
+    return vendor_ids
+
+
+def authenticated_client():
+    '''
+    Returns:
+        APIClient: A client logged in as a new benchmark user.
+    '''
+    client = APIClient()
+    username = f'benchmark-{uuid.uuid4().hex[:8]}'
+    client.post(
+        reverse('user-registration'),
+        {'username': username, 'password': PASSWORD}, format='json')
+    token = client.post(
+        reverse('user-login'),
+        {'username': username, 'password': PASSWORD},
+        format='json').data['token']
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+    return client
+
+
+def new_vendor():
+    '''
+    Returns:
+        Vendor: A vendor created for a route that changes or deletes it.
+    '''
+    return Vendor.objects.create(
+        name='Benchmark Vendor',
+        contact_details='benchmark@example.com',
+        address='1 Benchmark Street')
+
+
+def new_order(vendor_id):
+    '''
+    Returns:
+        PurchaseOrder: An order created for a route that changes
+            or deletes it.
+    '''
+    return PurchaseOrder.objects.create(
+        vendor_id=vendor_id,
+        delivery_date=timezone.now() + timedelta(days=1),
+        items={'item': 1},
+        quantity=1)
+
+
+def order_data(vendor_id):
+    '''
+    Returns:
+        dict: The body of a new purchase order.
+    '''
+    return {
+        'vendor': vendor_id,
+        'delivery_date': (timezone.now() + timedelta(days=1)).isoformat(),
+        'items': {'item': 1},
+        'quantity': 1}
+
+
+def routes(vendor_ids):
+    '''
+    The benchmarked routes.
+
+    Each route is a (name, method, prepare) tuple. `prepare` is called
+        before every request, outside of the measure, and returns the
+        path and the data of the request; it creates the rows a request
+        changes or deletes.
+
+    Parameters:
+        vendor_ids (list): The seeded vendors.
+
+    Returns:
+        list: The routes.
+    '''
+    vendor_id = vendor_ids[len(vendor_ids) // 2]
+    vendor_url = reverse('get_or_update_vendor', args=[vendor_id])
+    order_id = PurchaseOrder.objects.filter(
+        vendor_id=vendor_id).values_list('id', flat=True).first()
+    order_url = reverse('get_or_update_purchase_order', args=[order_id])
+    vendors_url = reverse('create_or_list_vendor')
+    orders_url = reverse('create_or_list_purchase')
+
+    def credentials():
+        return {
+            'username': f'benchmark-{uuid.uuid4().hex[:8]}',
+            'password': PASSWORD}
+
+    def login():
+        data = credentials()
+        APIClient().post(reverse('user-registration'), data, format='json')
+        return reverse('user-login'), data
+
+    def pending_orders():
+        orders = [new_order(vendor_id) for _ in range(BULK_ROWS)]
+        return reverse('bulk_update_acknowledgment'), {'orders': [
+            [order.id, PurchaseOrder.COMPLETED] for order in orders]}
+
+    return [
+        ('users.register', 'post',
+         lambda: (reverse('user-registration'), credentials())),
+        ('users.login', 'post', login),
+        ('vendors.list', 'get',
+         lambda: (vendors_url, {'page': 2, 'page_size': 10})),
+        ('vendors.list_cursor', 'get',
+         lambda: (vendors_url, {'cursor': 'true', 'page_size': 10})),
+        ('vendors.list_include', 'get', lambda: (vendors_url, {
+            'include': 'metrics,order_counts',
+            'ordering': '-on_time_delivery_rate',
+            'min_fulfillment_rate': 0.25, 'page_size': 10})),
+        ('vendors.create', 'post', lambda: (vendors_url, {
+            'name': 'Benchmark Vendor',
+            'contact_details': 'benchmark@example.com',
+            'address': '1 Benchmark Street'})),
+        ('vendors.retrieve', 'get', lambda: (vendor_url, None)),
+        ('vendors.update', 'put', lambda: (
+            reverse('get_or_update_vendor', args=[new_vendor().id]),
+            {'name': 'Renamed Vendor'})),
+        ('vendors.delete', 'delete', lambda: (
+            reverse('get_or_update_vendor', args=[new_vendor().id]), None)),
+        ('vendors.performance', 'get', lambda: (
+            reverse('view_performance', args=[vendor_id]), None)),
+        ('vendors.performance_live', 'get', lambda: (
+            reverse('view_performance', args=[vendor_id]),
+            {'live': 'true'})),
+        ('vendors.performance_range', 'get', lambda: (
+            reverse('view_performance', args=[vendor_id]),
+            {'resolution': 'day'})),
+        ('vendors.performance_history', 'get', lambda: (
+            reverse('get_performance', args=[vendor_id]), None)),
+        ('vendors.performance_export', 'get', lambda: (
+            reverse('export_performance', args=[vendor_id]), None)),
+        ('vendors.leaderboard', 'get', lambda: (
+            reverse('leaderboard'),
+            {'metric': 'fulfillment_rate', 'limit': 50})),
+        ('vendors.rank', 'get', lambda: (
+            reverse('vendor_rank', args=[vendor_id]), None)),
+        ('purchase.list', 'get',
+         lambda: (orders_url, {'page': 2, 'page_size': 10})),
+        ('purchase.list_vendor', 'get', lambda: (
+            orders_url, {'vendor_id': vendor_id, 'page_size': 10})),
+        ('purchase.list_cursor', 'get',
+         lambda: (orders_url, {'cursor': 'true', 'page_size': 10})),
+        ('purchase.create', 'post',
+         lambda: (orders_url, order_data(vendor_id))),
+        ('purchase.bulk_create', 'post', lambda: (
+            reverse('bulk_create_purchase'),
+            [order_data(vendor_id) for _ in range(BULK_ROWS)])),
+        ('purchase.bulk_acknowledge', 'post', pending_orders),
+        ('purchase.export', 'get', lambda: (
+            reverse('export_purchase'), {'vendor_id': vendor_id})),
+        ('purchase.retrieve', 'get', lambda: (order_url, None)),
+        ('purchase.update', 'put', lambda: (
+            reverse('get_or_update_purchase_order',
+                    args=[new_order(vendor_id).id]),
+            {'quantity': 5, 'quality_rating': 4.0})),
+        ('purchase.delete', 'delete', lambda: (
+            reverse('get_or_update_purchase_order',
+                    args=[new_order(vendor_id).id]), None)),
+        ('purchase.acknowledge', 'post', lambda: (
+            reverse('update_acknowlegment', args=[new_order(vendor_id).id]),
+            {'status': PurchaseOrder.COMPLETED})),
+    ]
+
+
+def percentile(values, fraction):
+    '''
+    Returns:
+        float: The value below which the fraction of the sorted
+            values falls, by nearest rank.
+    '''
+    values = sorted(values)
+    return values[round((len(values) - 1) * fraction)]
+
+
+def measure(client, method, path, data):
+    '''
+    Send a request, reading a streamed response to its end.
+
+    Returns:
+        tuple: The status code, the seconds taken and the number of
+            SQL queries issued.
+    '''
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, method)(path, data, format='json')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        elapsed = time.perf_counter() - started
+    return response.status_code, elapsed, len(queries)
+
+
+def run(vendor_ids, repeat=20, names=None):
+    '''
+    Request every route `repeat` times.
+
+    Parameters:
+        vendor_ids (list): The seeded vendors.
+        repeat (int): The number of requests per route.
+        names (list): Only run the routes with these names.
+
+    Returns:
+        dict: For each route, the status codes, the p50 and p95 latencies
+            in milliseconds and the median and highest query counts.
+    '''
+    client = authenticated_client()
+    results = {}
+    for name, method, prepare in routes(vendor_ids):
+        if names and name not in names:
+            continue
+        timings, counts, statuses = [], [], set()
+        for _ in range(repeat):
+            path, data = prepare()
+            code, elapsed, queries = measure(client, method, path, data)
+            statuses.add(code)
+            timings.append(elapsed * 1000)
+            counts.append(queries)
+        results[name] = {
+            'method': method.upper(),
+            'status_codes': sorted(statuses),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'queries_median': statistics.median(counts),
+            'queries_max': max(counts),
+        }
+    return results
+
+
+def over_budget(results):
+    '''
+    Returns:
+        list: (route, highest query count, budget) for every route which
+            issued more queries than QUERY_BUDGETS allows.
+    '''
+    return [
+        (name, result['queries_max'], QUERY_BUDGETS[name])
+        for name, result in results.items()
+        if result['queries_max'] > QUERY_BUDGETS.get(name, float('inf'))]
@@ -0,0 +1,108 @@
+'''
+Management command benchmarking the API endpoints
+'''
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment)
+from django.utils import timezone
+from purchase.management import benchmark
+
+
+class Command(BaseCommand):
+    '''
+    Seed a throwaway test database with purchase orders, request every
+        API route through the test client and report the p50 and p95
+        latencies and the SQL query counts of each route as JSON.
+
+    The cache entries written by the run are prefixed so that they do
+        not mix with those of the application.
+
+    Usage Example:
+        ```
+        python manage.py benchmark_api --orders 100000 --vendors 200
+        python manage.py benchmark_api --orders 1000000 --output run.json
+        python manage.py benchmark_api --check --route purchase.create
+        ```
+    '''
+    help = 'Measure the latency and the query count of every API route'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=1000,
+            help='Number of purchase orders seeded')
+        parser.add_argument(
+            '--vendors',
+            type=int,
+            default=10,
+            help='Number of vendors the orders are spread across')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of requests per route')
+        parser.add_argument(
+            '--route',
+            action='append',
+            dest='routes',
+            help='Only run this route, such as purchase.create '
+                 '(can be repeated)')
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file instead of stdout')
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Fail if a route issues more queries than its budget')
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the test database between runs')
+
+    def handle(self, *args, **options):
+        if options['vendors'] < 1 or options['orders'] < 1:
+            raise CommandError('At least one vendor and one order are needed')
+        caches = {
+            alias: dict(config, KEY_PREFIX='benchmark')
+            for alias, config in settings.CACHES.items()}
+        started = timezone.now()
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with override_settings(CACHES=caches):
+                vendor_ids = benchmark.seed(
+                    options['orders'], options['vendors'])
+                results = benchmark.run(
+                    vendor_ids, options['repeat'], options['routes'])
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = json.dumps({
+            'started_at': started.isoformat(),
+            'database': connection.vendor,
+            'orders': options['orders'],
+            'vendors': options['vendors'],
+            'repeat': options['repeat'],
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        exceeded = benchmark.over_budget(results)
+        for name, queries, budget in exceeded:
+            self.stderr.write(
+                f'{name} issued {queries} queries, its budget is {budget}')
+        if options['check'] and exceeded:
+            raise CommandError(
+                f'{len(exceeded)} routes issued more queries than allowed')
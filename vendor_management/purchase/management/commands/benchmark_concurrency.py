@@ -0,0 +1,85 @@
+'''
+Management command measuring the concurrency a running server sustains
+'''
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from purchase.management import concurrency
+
+
+class Command(BaseCommand):
+    '''
+    Request the read-heavy routes of a running server from an increasing
+        number of concurrent clients and report the throughput and the
+        latency percentiles of every level as JSON.
+
+    Run it once against the WSGI server and once against uvicorn, on
+        the same database, to compare the sync and the async views.
+
+    Usage Example:
+        ```
+        gunicorn vendor_management.wsgi -w 4 --threads 8 -b :8000
+        python manage.py benchmark_concurrency --url http://127.0.0.1:8000 \\
+            --label wsgi --output wsgi.json
+        uvicorn vendor_management.asgi:application --workers 4 --port 8001
+        python manage.py benchmark_concurrency --url http://127.0.0.1:8001 \\
+            --label asgi --output asgi.json
+        ```
+    '''
+    help = 'Measure the concurrency a running server sustains'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Base URL of the server')
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='+',
+            default=[1, 8, 32, 128, 256],
+            help='Numbers of concurrent clients, one level each')
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='Seconds each level runs for')
+        parser.add_argument(
+            '--token',
+            help='Token of the clients, a new user is registered otherwise')
+        parser.add_argument(
+            '--latency-budget',
+            type=float,
+            help='p95 latency in milliseconds a level must stay under')
+        parser.add_argument(
+            '--label',
+            help='Name of the server in the report, such as wsgi or asgi')
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file instead of stdout')
+
+    def handle(self, *args, **options):
+        if min(options['concurrency']) < 1 or options['duration'] <= 0:
+            raise CommandError(
+                'The levels need one client at least and a duration')
+        started = timezone.now()
+        try:
+            results = concurrency.run(
+                options['url'], options['concurrency'], options['duration'],
+                options['token'], options['latency_budget'])
+        except (OSError, RuntimeError, ValueError) as error:
+            raise CommandError(f'Could not benchmark the server: {error}')
+
+        report = json.dumps({
+            'started_at': started.isoformat(),
+            'url': options['url'],
+            'label': options['label'],
+            'duration': options['duration'],
+            'latency_budget_ms': options['latency_budget'],
+            **results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
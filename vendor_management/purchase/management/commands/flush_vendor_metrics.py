@@ -0,0 +1,58 @@
+'''
+Management command running the coalesced vendor metrics worker
+'''
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from purchase import metrics
+
+
+class Command(BaseCommand):
+    '''
+    Recompute the metrics of the vendors queued in coalesced mode.
+
+    Every flush writes the metrics and one HistoricalPerformance row
+        per queued vendor, however many of its orders changed since
+        the previous flush.
+
+    Usage Example:
+        ```
+        python manage.py flush_vendor_metrics --interval 10
+        python manage.py flush_vendor_metrics --once
+        ```
+    '''
+    help = 'Recompute the metrics of the vendors queued in coalesced mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=getattr(settings, 'VENDOR_METRICS_FLUSH_INTERVAL', 5),
+            help='Seconds to wait between two flushes')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Maximum number of vendors refreshed per query batch')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Flush the queue once and exit')
+
+    def flush(self, batch_size):
+        total = 0
+        while True:
+            refreshed = metrics.flush_pending(batch_size)
+            total += refreshed
+            if refreshed < batch_size:
+                return total
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed = self.flush(options['batch_size'])
+            if refreshed:
+                self.stdout.write(
+                    f'Refreshed the metrics of {refreshed} vendors')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
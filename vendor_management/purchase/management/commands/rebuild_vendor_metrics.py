@@ -0,0 +1,54 @@
+'''
+Management command rebuilding the vendor performance counters
+'''
+from django.core.management.base import BaseCommand, CommandError
+from purchase import metrics
+
+
+class Command(BaseCommand):
+    '''
+    Recompute the vendor performance counters from the purchase orders.
+
+    The stored counters are first compared with the aggregate computed
+        over the purchase orders and every difference is reported, then
+        the counters are overwritten with the aggregate.
+
+    Usage Example:
+        ```
+        python manage.py rebuild_vendor_metrics
+        python manage.py rebuild_vendor_metrics --check --vendor 1 --vendor 2
+        ```
+    '''
+    help = 'Rebuild the vendor performance counters from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vendor',
+            action='append',
+            type=int,
+            dest='vendor_ids',
+            help='Only process this vendor id (can be repeated)')
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report the counters that differ, do not rebuild')
+
+    def handle(self, *args, **options):
+        vendor_ids = options['vendor_ids']
+        mismatches = metrics.verify_counters(vendor_ids)
+        for vendor_id, field, stored, expected in mismatches:
+            self.stdout.write(
+                f'Vendor {vendor_id}: {field} is {stored}, '
+                f'expected {expected}')
+
+        if options['check']:
+            if mismatches:
+                raise CommandError(
+                    f'{len(mismatches)} counters differ from the aggregate')
+            self.stdout.write(self.style.SUCCESS('All counters match'))
+            return
+
+        counters = metrics.rebuild_counters(vendor_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the counters of {len(counters)} vendors, '
+            f'{len(mismatches)} differences fixed'))
@@ -0,0 +1,220 @@
+'''
+This module measures how many concurrent clients a running server serves
+
+benchmark.py requests the routes in process through the test client; here
+the read-heavy routes are requested over HTTP from a server started
+separately, so that the same routes can be compared under a WSGI server
+(the sync views, e.g. gunicorn) and under uvicorn (ASGI, the async
+views). Each level of concurrency runs that many clients, each one on its
+own keep-alive connection sending requests back to back for a while. The
+throughput and the latency percentiles of every level show where the
+server stops scaling.
+'''
+import http.client
+import json
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+from .benchmark import PASSWORD, percentile
+
+# the read-heavy routes, served by the async views under ASGI
+ROUTES = (
+    'vendors.list', 'vendors.retrieve', 'vendors.performance',
+    'purchase.list', 'purchase.retrieve')
+
+
+class Server:
+    '''
+    The server under test.
+
+    Attributes:
+        host (str): The host name.
+        port (int): The port.
+        prefix (str): The path the API is mounted under, without the
+            trailing slash.
+    '''
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise ValueError(f'Only http:// servers are supported: {url}')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+
+    def connect(self):
+        '''
+        Returns:
+            HTTPConnection: A new keep-alive connection to the server.
+        '''
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def request(self, connection, method, path, token=None, data=None):
+        '''
+        Send a request and read its response.
+
+        Returns:
+            tuple: The status code and the body.
+        '''
+        headers = {'Accept': 'application/json'}
+        body = None
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        connection.request(method, self.prefix + path, body, headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+
+def login(server):
+    '''
+    Returns:
+        str: The token of a new benchmark user.
+    '''
+    connection = server.connect()
+    credentials = {
+        'username': f'benchmark-{uuid.uuid4().hex[:8]}',
+        'password': PASSWORD}
+    try:
+        server.request(
+            connection, 'POST', '/api/user/register/', data=credentials)
+        code, body = server.request(
+            connection, 'POST', '/api/user/login/', data=credentials)
+    finally:
+        connection.close()
+    if code != 200:
+        raise RuntimeError(f'Could not log in, the server answered {code}')
+    return json.loads(body)['token']
+
+
+def paths(server, token):
+    '''
+    Pick a vendor and a purchase order of the server for the routes.
+
+    Returns:
+        dict: The path of every route of ROUTES.
+    '''
+    connection = server.connect()
+    try:
+        code, body = server.request(
+            connection, 'GET', '/api/purchase_orders/?page_size=1', token)
+    finally:
+        connection.close()
+    orders = json.loads(body)['data'] if code == 200 else []
+    if not orders:
+        raise RuntimeError('The server has no purchase order to request')
+    order_id, vendor_id = orders[0]['id'], orders[0]['vendor']
+    page = urlencode({'page': 2, 'page_size': 10})
+    return {
+        'vendors.list': f'/api/vendor/?{page}',
+        'vendors.retrieve': f'/api/vendor/{vendor_id}/',
+        'vendors.performance': f'/api/vendor/{vendor_id}/performance',
+        'purchase.list': f'/api/purchase_orders/?{page}',
+        'purchase.retrieve': f'/api/purchase_orders/{order_id}/',
+    }
+
+
+def run_level(server, token, routes, clients, duration):
+    '''
+    Request the routes in turn from `clients` clients at once.
+
+    Parameters:
+        server (Server): The server under test.
+        token (str): The token of the clients.
+        routes (list): The paths requested.
+        clients (int): The number of concurrent clients.
+        duration (float): Seconds the clients send requests for.
+
+    Returns:
+        dict: The requests per second, the p50, p95 and p99 latencies in
+            milliseconds and the number of failed requests.
+    '''
+    timings = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(clients + 1)
+
+    def client(offset):
+        connection = server.connect()
+        own_timings, own_errors = [], 0
+        start.wait()
+        deadline = time.monotonic() + duration
+        index = offset
+        while time.monotonic() < deadline:
+            path = routes[index % len(routes)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                code, _ = server.request(connection, 'GET', path, token)
+            except (OSError, http.client.HTTPException):
+                # the server dropped the connection, open another one
+                connection.close()
+                connection = server.connect()
+                own_errors += 1
+                continue
+            own_timings.append((time.perf_counter() - started) * 1000)
+            if code >= 400:
+                own_errors += 1
+        connection.close()
+        with lock:
+            timings.extend(own_timings)
+            errors.append(own_errors)
+
+    threads = [
+        threading.Thread(target=client, args=(offset,), daemon=True)
+        for offset in range(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.monotonic()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    if not timings:
+        return {'clients': clients, 'requests': 0, 'errors': sum(errors)}
+    return {
+        'clients': clients,
+        'requests': len(timings),
+        'errors': sum(errors),
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+    }
+
+
+def run(url, levels, duration=10, token=None, latency_budget_ms=None):
+    '''
+    Measure a running server at increasing levels of concurrency.
+
+    Parameters:
+        url (str): The base URL of the server, e.g. http://127.0.0.1:8000.
+        levels (list): The numbers of concurrent clients.
+        duration (float): Seconds each level runs for.
+        token (str): The token of the clients, a new benchmark user
+            is registered when None.
+        latency_budget_ms (float): The p95 latency a level must stay
+            under to count as served.
+
+    Returns:
+        dict: The results of every level and `max_clients`, the highest
+            level served without error (and within the budget).
+    '''
+    server = Server(url)
+    token = token or login(server)
+    routes = list(paths(server, token).values())
+    results = []
+    max_clients = None
+    for clients in sorted(levels):
+        result = run_level(server, token, routes, clients, duration)
+        results.append(result)
+        served = result['requests'] and not result['errors'] and (
+            latency_budget_ms is None or
+            result['p95_ms'] <= latency_budget_ms)
+        if served:
+            max_clients = clients
+    return {'routes': list(ROUTES), 'levels': results,
+            'max_clients': max_clients}
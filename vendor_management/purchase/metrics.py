@@ -0,0 +1,479 @@
+'''
+This module keeps the vendor performance counters in step with the
+purchase orders.
+
+Every purchase order contributes a fixed set of values to the counters of
+its vendor (one order, one completed order, its quality rating, ...).
+When an order is saved the contribution of its previous state is taken
+away and the contribution of its new state is added, so keeping the
+counters up to date costs the same whatever the number of orders.
+'''
+import math
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from vendors.models import (
+    Vendor, PerformanceCounter, PendingPerformanceUpdate)
+from vendors import events, history
+from purchase.models import PurchaseOrder
+from vendor_management.cache import invalidate, purchase_order_key
+
+COUNTER_FIELDS = PerformanceCounter.COUNTER_FIELDS
+METRIC_FIELDS = (
+    'on_time_delivery_rate',
+    'average_response_time',
+    'fulfillment_rate',
+    'quality_rating_avg',
+)
+SYNC = 'sync'
+COALESCED = 'coalesced'
+
+
+def metrics_mode():
+    '''
+    Returns:
+        str: How the vendor metrics are updated, 'sync' or 'coalesced'.
+    '''
+    return getattr(settings, 'VENDOR_METRICS_MODE', SYNC)
+
+
+def _to_datetime(value):
+    '''
+    Convert a value assigned to a datetime field the same way the
+        database layer does before storing it.
+
+    Parameters:
+        value: A datetime, a string or None.
+
+    Returns:
+        datetime: An aware datetime, or None.
+    '''
+    if value is None:
+        return None
+    value = PurchaseOrder._meta.get_field('issue_date').to_python(value)
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def contribution(state):
+    '''
+    Return the values a purchase order adds to the counters of its vendor.
+
+    Parameters:
+        state (dict): The metric state of the purchase order
+            as returned by `PurchaseOrder.metric_state`.
+
+    Returns:
+        dict: The value contributed to each counter field.
+    '''
+    status = state['status']
+    rating = state['quality_rating']
+    delivery_date = _to_datetime(state['delivery_date'])
+    issue_date = _to_datetime(state['issue_date'])
+    acknowledgment_date = _to_datetime(state['acknowledgment_date'])
+
+    completed = status == PurchaseOrder.COMPLETED
+    on_time = (completed and acknowledgment_date is not None and
+               delivery_date is not None and
+               acknowledgment_date <= delivery_date)
+    response_seconds = 0.0
+    if acknowledgment_date is not None and issue_date is not None:
+        response_seconds = (acknowledgment_date - issue_date).total_seconds()
+
+    return {
+        'total_orders': 1,
+        'completed_orders': int(completed),
+        'on_time_orders': int(on_time),
+        'canceled_orders': int(status == PurchaseOrder.CANCELED),
+        'rating_sum': float(rating) if rating is not None else 0.0,
+        'rating_count': int(rating is not None),
+        'acknowledged_orders': int(acknowledgment_date is not None),
+        'response_seconds_sum': response_seconds,
+    }
+
+
+def order_deltas(previous, current):
+    '''
+    Compute the change to the vendor counters caused by a purchase
+        order moving from one state to another.
+
+    Parameters:
+        previous (dict): The state before the change, None for a new order.
+        current (dict): The state after the change, None for a deleted order.
+
+    Returns:
+        dict: The counter deltas keyed by vendor id. An order moved to
+            another vendor yields an entry for both vendors.
+    '''
+    deltas = {}
+    for state, sign in ((previous, -1), (current, 1)):
+        if state is not None:
+            add_contribution(deltas, state, sign)
+    return deltas
+
+
+def add_contribution(deltas, state, sign=1):
+    '''
+    Add (or with a negative sign, take away) the contribution of a
+        purchase order state to the deltas of its vendor.
+
+    Parameters:
+        deltas (dict): The counter deltas keyed by vendor id, updated
+            in place.
+        state (dict): The metric state of the purchase order.
+        sign (int): 1 to add the contribution, -1 to take it away.
+    '''
+    delta = deltas.setdefault(
+        state['vendor_id'], dict.fromkeys(COUNTER_FIELDS, 0))
+    for field, value in contribution(state).items():
+        delta[field] += sign * value
+
+
+def apply_deltas(deltas):
+    '''
+    Add the deltas to the stored counters, one UPDATE per vendor.
+
+    Parameters:
+        deltas (dict): The counter deltas keyed by vendor id.
+
+    Returns:
+        list: The ids of the vendors with a non zero delta
+            but no counters stored yet.
+    '''
+    missing = []
+    for vendor_id, delta in deltas.items():
+        changes = {
+            field: F(field) + value for field, value in delta.items()
+            if value}
+        if not changes:
+            continue
+        updated = PerformanceCounter.objects.filter(
+            vendor_id=vendor_id).update(**changes)
+        if not updated:
+            missing.append(vendor_id)
+    return missing
+
+
+def previous_state(order):
+    '''
+    Return the state of a purchase order as it is stored in the database.
+
+    The row is read rather than the state remembered when the instance
+        was loaded, which is stale when the order was changed since by
+        another request or by `set_orders_status`. It is locked until
+        the transaction of the save commits, so that two saves of the
+        same order adjust the counters one after the other, the second
+        against the state the first one stored.
+
+    Parameters:
+        order (PurchaseOrder): The purchase order about to be saved
+            or deleted, in a transaction.
+
+    Returns:
+        dict: The stored metric state, or None for a new order.
+    '''
+    if order._state.adding or order.pk is None:
+        return None
+    return PurchaseOrder.objects.select_for_update().filter(
+        pk=order.pk).values(*PurchaseOrder.METRIC_FIELDS).first()
+
+
+def record_order_change(order, previous):
+    '''
+    Update the counters of the vendor of a freshly saved purchase order.
+
+    Parameters:
+        order (PurchaseOrder): The purchase order that was saved.
+        previous (dict): The metric state of the order before the save.
+
+    Returns:
+        PerformanceCounter: The up to date counters of the order's vendor.
+    '''
+    current = order.metric_state()
+    missing = apply_deltas(order_deltas(previous, current))
+    order._metric_state = current
+    if missing:
+        return rebuild_counters(missing)[order.vendor_id]
+    counter = PerformanceCounter.objects.filter(
+        vendor_id=order.vendor_id).first()
+    if counter is None:
+        counter = rebuild_counters([order.vendor_id])[order.vendor_id]
+    return counter
+
+
+def record_order_deletion(order):
+    '''
+    Take a deleted purchase order out of the counters of its vendor.
+
+    Parameters:
+        order (PurchaseOrder): The purchase order that was deleted, with
+            the state stored before the deletion when it was read.
+    '''
+    if hasattr(order, '_deleted_metric_state'):
+        state = order._deleted_metric_state
+    else:
+        state = getattr(order, '_metric_state', None) or order.metric_state()
+    if state is not None:
+        apply_deltas(order_deltas(state, None))
+
+
+def record_new_orders(orders):
+    '''
+    Add purchase orders inserted without `save` (with `bulk_create`)
+        to the counters of their vendors, with one UPDATE per vendor.
+
+    Parameters:
+        orders (iterable): The inserted PurchaseOrder instances.
+
+    Returns:
+        list: The ids of the vendors whose counters changed.
+    '''
+    deltas = {}
+    for order in orders:
+        order._metric_state = order.metric_state()
+        add_contribution(deltas, order._metric_state)
+    missing = apply_deltas(deltas)
+    if missing:
+        rebuild_counters(missing)
+    return list(deltas)
+
+
+def set_orders_status(order_ids, status, batch_size=1000):
+    '''
+    Change the status of many purchase orders with one UPDATE per batch
+        of ids, and adjust the counters of their vendors.
+
+    Like `PurchaseOrder.save`, the acknowledgment_date of orders
+        becoming completed or canceled is stamped when not already set
+        and the order_date is refreshed. Signals are not sent and the
+        vendor metrics are not recomputed.
+
+    Parameters:
+        order_ids (iterable): The ids of the purchase orders to change.
+        status (str): The new status.
+        batch_size (int): Maximum number of ids per UPDATE.
+
+    Returns:
+        tuple: The ids of the orders updated and the ids of their vendors.
+    '''
+    now = timezone.now()
+    changes = {'status': status, 'order_date': now}
+    acknowledged = status in (PurchaseOrder.COMPLETED, PurchaseOrder.CANCELED)
+    if acknowledged:
+        changes['acknowledgment_date'] = Coalesce(
+            'acknowledgment_date', Value(now))
+
+    order_ids = list(order_ids)
+    updated = []
+    deltas = {}
+    with transaction.atomic():
+        for start in range(0, len(order_ids), batch_size):
+            orders = PurchaseOrder.objects.filter(
+                id__in=order_ids[start:start + batch_size])
+            rows = list(orders.select_for_update().values(
+                'id', *PurchaseOrder.METRIC_FIELDS))
+            orders.update(**changes)
+            for row in rows:
+                updated.append(row.pop('id'))
+                current = dict(row, status=status)
+                if acknowledged and current['acknowledgment_date'] is None:
+                    current['acknowledgment_date'] = now
+                add_contribution(deltas, row, -1)
+                add_contribution(deltas, current)
+        missing = apply_deltas(deltas)
+        if missing:
+            rebuild_counters(missing)
+        # no signal is sent by update()
+        invalidate(purchase_order_key(order_id) for order_id in updated)
+    return updated, list(deltas)
+
+
+def aggregate_counters(vendor_ids=None):
+    '''
+    Compute the counters from scratch with a single grouped query
+        over the purchase orders.
+
+    Parameters:
+        vendor_ids (iterable): Restrict the computation to these vendors.
+            All the vendors are computed when omitted.
+
+    Returns:
+        dict: The counter values keyed by vendor id.
+    '''
+    vendors = Vendor.objects.all()
+    if vendor_ids is not None:
+        vendors = vendors.filter(id__in=list(vendor_ids))
+    live_fields = [f'live_{field}' for field in COUNTER_FIELDS
+                   if field != 'response_seconds_sum']
+    rows = vendors.with_live_metrics().order_by().values_list(
+        'id', 'live_response_time_sum', *live_fields)
+    counters = {}
+    for vendor_id, response_time, *values in rows:
+        counter = dict(zip(live_fields, values))
+        counter = {name[len('live_'):]: value
+                   for name, value in counter.items()}
+        counter['response_seconds_sum'] = \
+            response_time.total_seconds() if response_time else 0.0
+        counters[vendor_id] = counter
+    return counters
+
+
+def rebuild_counters(vendor_ids=None, batch_size=1000):
+    '''
+    Recompute the counters from scratch and store them.
+
+    Parameters:
+        vendor_ids (iterable): The vendors to rebuild, all when omitted.
+        batch_size (int): Number of counter rows written per query.
+
+    Returns:
+        dict: The stored PerformanceCounter instances keyed by vendor id.
+    '''
+    counters = {
+        vendor_id: PerformanceCounter(vendor_id=vendor_id, **values)
+        for vendor_id, values in aggregate_counters(vendor_ids).items()}
+    PerformanceCounter.objects.bulk_create(
+        counters.values(),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['vendor'],
+        update_fields=COUNTER_FIELDS)
+    return counters
+
+
+def verify_counters(vendor_ids=None):
+    '''
+    Compare the stored counters with the result of the aggregate query.
+
+    Parameters:
+        vendor_ids (iterable): The vendors to check, all when omitted.
+
+    Returns:
+        list: A (vendor_id, field, stored, expected) tuple for every
+            counter that differs from the aggregate.
+    '''
+    stored = PerformanceCounter.objects.all()
+    if vendor_ids is not None:
+        vendor_ids = list(vendor_ids)
+        stored = stored.filter(vendor_id__in=vendor_ids)
+    stored = {counter.vendor_id: counter for counter in stored}
+
+    mismatches = []
+    for vendor_id, values in aggregate_counters(vendor_ids).items():
+        counter = stored.get(vendor_id, PerformanceCounter())
+        for field in COUNTER_FIELDS:
+            actual = getattr(counter, field)
+            wanted = values[field]
+            if not math.isclose(actual, wanted, rel_tol=1e-9, abs_tol=1e-6):
+                mismatches.append((vendor_id, field, actual, wanted))
+    return mismatches
+
+
+def refresh_vendor_metrics(vendor_ids):
+    '''
+    Write the metrics derived from the counters of each vendor and
+        record one HistoricalPerformance row per vendor whose metrics
+        changed, see write_vendor_metrics.
+
+    Parameters:
+        vendor_ids (iterable): The vendors to refresh.
+
+    Returns:
+        int: The number of vendors refreshed.
+    '''
+    vendor_ids = list(vendor_ids)
+    vendors = Vendor.objects.in_bulk(vendor_ids)
+    counters = PerformanceCounter.objects.in_bulk(list(vendors))
+    missing = [vendor_id for vendor_id in vendors if vendor_id not in counters]
+    if missing:
+        counters.update(rebuild_counters(missing))
+
+    for vendor_id, vendor in vendors.items():
+        write_vendor_metrics(vendor, counters[vendor_id])
+    return len(vendors)
+
+
+def write_vendor_metrics(vendor, counter):
+    '''
+    Write the metrics derived from the counters of a vendor and record
+        a HistoricalPerformance row when they changed.
+
+    Every path updating the metrics writes them here, so that they only
+        depend on the orders of the vendor, not on the last one saved.
+        A metric is left untouched when there is nothing to compute it
+        from.
+
+    Parameters:
+        vendor (Vendor): The vendor.
+        counter (PerformanceCounter): Its up to date counters.
+    '''
+    attributes = {'vendor': vendor}
+    for key in METRIC_FIELDS:
+        value = getattr(counter, key)()
+        if value is not None:
+            attributes[key] = value
+            setattr(vendor, key, value)
+    # ranks the vendor without reading its counters again
+    vendor.performance_counter = counter
+    vendor.save()
+    events.publish_performance(history.record_snapshot(**attributes))
+
+
+def mark_pending(vendor_ids):
+    '''
+    Queue vendors for the next flush of the metrics worker.
+
+    Parameters:
+        vendor_ids (iterable): The vendors whose orders changed.
+    '''
+    now = timezone.now()
+    PendingPerformanceUpdate.objects.bulk_create(
+        [PendingPerformanceUpdate(vendor_id=vendor_id, marked_at=now)
+         for vendor_id in set(vendor_ids)],
+        update_conflicts=True,
+        unique_fields=['vendor'],
+        update_fields=['marked_at'])
+
+
+def schedule_refresh(vendor_ids):
+    '''
+    Get the metrics of vendors recomputed according to the metrics mode:
+        immediately in sync mode, or queued once the current transaction
+        commits in coalesced mode.
+
+    Parameters:
+        vendor_ids (iterable): The vendors whose orders changed.
+    '''
+    vendor_ids = list(vendor_ids)
+    if metrics_mode() == COALESCED:
+        transaction.on_commit(lambda: mark_pending(vendor_ids))
+    else:
+        refresh_vendor_metrics(vendor_ids)
+
+
+def flush_pending(batch_size=1000):
+    '''
+    Recompute once the metrics of a batch of queued vendors.
+
+    Entries queued again while the flush runs are kept for the next one.
+
+    Parameters:
+        batch_size (int): Maximum number of vendors refreshed.
+
+    Returns:
+        int: The number of vendors refreshed.
+    '''
+    started = timezone.now()
+    vendor_ids = list(PendingPerformanceUpdate.objects.filter(
+        marked_at__lte=started).order_by('marked_at').values_list(
+        'vendor_id', flat=True)[:batch_size])
+    if not vendor_ids:
+        return 0
+    with transaction.atomic():
+        refreshed = refresh_vendor_metrics(vendor_ids)
+        PendingPerformanceUpdate.objects.filter(
+            vendor_id__in=vendor_ids, marked_at__lte=started).delete()
+    return refreshed
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.10 on 2026-10-17 21:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    replaces = [
+        ('purchase', '0001_initial'),
+        ('purchase', '0002_alter_purchaseorder_issue_date_and_more'),
+    ]
+
+    dependencies = [
+        ('vendors', '0001_squashed_0004_alter_historicalperformance_average_response_time_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('po_number', models.CharField(editable=False, max_length=100, unique=True)),
+                ('order_date', models.DateTimeField(auto_now=True)),
+                ('delivery_date', models.DateTimeField()),
+                ('items', models.JSONField()),
+                ('quantity', models.IntegerField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Completed', 'Completed'), ('Canceled', 'Canceled')], default='Pending', max_length=10)),
+                ('quality_rating', models.FloatField(null=True)),
+                ('issue_date', models.DateTimeField(auto_now_add=True)),
+                ('acknowledgment_date', models.DateTimeField(null=True)),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='vendors.vendor')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.10 on 2026-10-17 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the databases migrated under the former name count it as applied
+    replaces = [('purchase', '0003_vendor_indexes')]
+
+    dependencies = [
+        ('purchase', '0001_squashed_0002_alter_purchaseorder_issue_date_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['vendor', 'status'], name='po_vendor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['vendor', 'id'], name='po_vendor_id_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+'''
+Compute the performance counters of the vendors that already have purchase
+orders, so that their metrics are not derived from empty counters until
+rebuild_vendor_metrics runs.
+
+The migration reads the historical models, the counters are computed with
+the same grouped query as purchase.metrics.aggregate_counters.
+'''
+from django.db import migrations
+from django.db.models import (
+    Count, DurationField, ExpressionWrapper, F, Q, Sum)
+
+BATCH_SIZE = 1000
+
+
+def backfill_counters(apps, schema_editor):
+    Vendor = apps.get_model('vendors', 'Vendor')
+    PerformanceCounter = apps.get_model('vendors', 'PerformanceCounter')
+    using = schema_editor.connection.alias
+    completed = Q(purchaseorder__status='Completed')
+    response_time = ExpressionWrapper(
+        F('purchaseorder__acknowledgment_date') -
+        F('purchaseorder__issue_date'),
+        output_field=DurationField())
+    rows = Vendor.objects.using(using).annotate(
+        total_orders=Count('purchaseorder'),
+        completed_orders=Count('purchaseorder', filter=completed),
+        on_time_orders=Count('purchaseorder', filter=completed & Q(
+            purchaseorder__acknowledgment_date__lte=F(
+                'purchaseorder__delivery_date'))),
+        canceled_orders=Count(
+            'purchaseorder', filter=Q(purchaseorder__status='Canceled')),
+        rating_sum=Sum('purchaseorder__quality_rating', default=0.0),
+        rating_count=Count('purchaseorder__quality_rating'),
+        acknowledged_orders=Count('purchaseorder__acknowledgment_date'),
+        response_time_sum=Sum(response_time),
+    ).order_by().values()
+    counters = []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        response_time_sum = row.pop('response_time_sum')
+        counters.append(PerformanceCounter(
+            vendor_id=row['id'],
+            total_orders=row['total_orders'],
+            completed_orders=row['completed_orders'],
+            on_time_orders=row['on_time_orders'],
+            canceled_orders=row['canceled_orders'],
+            rating_sum=row['rating_sum'],
+            rating_count=row['rating_count'],
+            acknowledged_orders=row['acknowledged_orders'],
+            response_seconds_sum=response_time_sum.total_seconds()
+            if response_time_sum else 0.0))
+    # counters written since the table was created are adjusted in step
+    # with the orders, they are kept
+    PerformanceCounter.objects.using(using).bulk_create(
+        counters, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0003_purchase_order_indexes'),
+        ('vendors', '0005_performance_tables'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_counters, migrations.RunPython.noop, elidable=True),
+    ]
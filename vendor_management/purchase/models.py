@@ -2,7 +2,7 @@
 This module defines the purchase order model
 '''
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
 from vendors.models import Vendor
 import uuid
 
@@ -52,6 +52,59 @@ class PurchaseOrder(models.Model):
     issue_date = models.DateTimeField(auto_now_add=True)
     acknowledgment_date = models.DateTimeField(null=True)
 
+    class Meta:
+        indexes = [
+            # orders of a vendor in a given status, as selected by the
+            # bulk acknowledgment filter
+            models.Index(
+                fields=['vendor', 'status'], name='po_vendor_status_idx'),
+            # orders of a vendor listed or paged by id
+            models.Index(fields=['vendor', 'id'], name='po_vendor_id_idx'),
+        ]
+
+    # fields the vendor performance counters are derived from
+    METRIC_FIELDS = (
+        'vendor_id',
+        'status',
+        'delivery_date',
+        'quality_rating',
+        'issue_date',
+        'acknowledgment_date',
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        '''
+        Create an instance loaded from the database and remember the state
+            the vendor performance counters were computed from, so that
+            the next save can adjust them by difference.
+        '''
+        instance = super().from_db(db, field_names, values)
+        instance._metric_state = instance.metric_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        '''
+        Reload the fields from the database, and the state remembered
+            for the vendor performance counters with them.
+        '''
+        super().refresh_from_db(*args, **kwargs)
+        self._metric_state = self.metric_state()
+
+    def metric_state(self):
+        '''
+        Returns the values of the fields the vendor performance
+            metrics depend on.
+
+        Returns:
+            dict: The metric fields and their values, or None when
+                one of them has been deferred.
+        '''
+        deferred = self.get_deferred_fields()
+        if any(field in deferred for field in self.METRIC_FIELDS):
+            return None
+        return {field: getattr(self, field) for field in self.METRIC_FIELDS}
+
     def __str__(self):
         '''
         Returns a string representation of the purchase order.
@@ -86,11 +139,23 @@ class PurchaseOrder(models.Model):
         ```
         '''
 
+        self.set_generated_fields()
+        # the stored state is read and locked by the pre_save signal and
+        # the counters adjusted by post_save in the same transaction
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super(PurchaseOrder, self).save(*args, **kwargs)
+
+    def set_generated_fields(self):
+        '''
+        Generate the 'po_number' when it is not set and stamp the
+            acknowledgment_date of completed or canceled orders.
+
+        This is done by `save`, and must be called on instances
+            inserted with `bulk_create`, which does not call `save`.
+        '''
         if not self.po_number:
             self.po_number = str(uuid.uuid4()).replace("-", "")[:10].upper()
 
         if (self.status == 'Completed' or self.status ==
                 'Canceled') and not self.acknowledgment_date:
             self.acknowledgment_date = timezone.now()
-
-        super(PurchaseOrder, self).save(*args, **kwargs)
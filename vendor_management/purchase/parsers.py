@@ -0,0 +1,37 @@
+'''
+Module defining the request parsers of the purchase endpoints
+'''
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from vendor_management.renderers import loads
+
+
+class NDJSONParser(BaseParser):
+    '''
+    Parser for newline delimited JSON, one object per line.
+
+    The body is read line by line, so the whole document is never
+        held in memory as a single string.
+
+    Returns:
+        list: The parsed objects, blank lines are skipped.
+    '''
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        rows = []
+        if stream is None:
+            return rows
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(
+                    f'NDJSON parse error on line {number} - {exc}')
+        return rows
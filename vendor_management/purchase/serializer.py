@@ -63,3 +63,21 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
                 setattr(instance, attr, value)
         instance.save()
         return instance
+
+
+class BulkPurchaseOrderSerializer(PurchaseOrderSerializer):
+    '''
+    Serializer validating the rows of a bulk purchase order import.
+
+    The vendor is validated as a plain id so that a single instance can
+        validate thousands of rows without a query per row; the vendors
+        are then resolved all at once by the caller.
+
+    Usage Example:
+        ```python
+        serializer = BulkPurchaseOrderSerializer()
+        validated_data = serializer.run_validation(row)
+        vendor_id = validated_data['vendor']
+        ```
+    '''
+    vendor = serializers.IntegerField()
@@ -2,135 +2,61 @@
 create a signals to update the database
 
 '''
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import (
+    post_save, pre_save, pre_delete, post_delete)
 from django.dispatch import receiver
-import datetime
-from vendors.models import Vendor, HistoricalPerformance
-from django.db.models import F, Avg, Sum, Count, Case, When
+from vendors.models import Vendor
 from purchase.models import PurchaseOrder
+from purchase import metrics
+from vendor_management import prometheus
+from vendor_management.cache import (
+    invalidate, purchase_order_key, count_key)
 
 
-def update_vendor_delivery_rate(
-        instance: PurchaseOrder,
-        vendor: Vendor) -> float:
+@receiver(pre_save, sender=PurchaseOrder)
+def remember_previous_state(sender, instance, raw, **kwargs):
     '''
-    Calculate the on-time delivery rate whenever a
-        purchase order is updated.
+    Keep the stored state of a purchase order about to be saved so that
+        the vendor counters can be adjusted by difference after the save.
 
     Parameters:
-        instance (PurchaseOrder): The instance of the purchase
-            order being updated.
-        vendor (Vendor): The vendor associated with
-            the purchase order.
-
-    Returns:
-        float: The delivery rate as a percentage .
-    '''
-
-    if instance.status == 'Completed':
-        # get all the vendor from the purchse ordr
-        completed_orders = PurchaseOrder.objects.filter(
-            vendor=vendor, status='Completed')
-        # Initialize counters for all orders and delivered on time
-
-        delivered_on_time = len(completed_orders.filter(
-            acknowledgment_date__lte=F('delivery_date')
-        ))
-        all_orders = len(completed_orders)
-        # Calculate delivery rate (avoid division by zero)
-        if all_orders:
-            delivery_rate = (delivered_on_time / all_orders)
-            delivery_rate = delivered_on_time / all_orders
-            return round(delivery_rate, 2)
-    return 0.0
-
-
-def calculate_quality_rating(vendor, instance):
-    ''''
-    Calculate the average rating of quality when a new purchase order.
-
-    Parameters:
-        instance (PurchaseOrder): The instance of the purchase order
-            being updated.
-        vendor (Vendor): The vendor associated with the purchase order.
-
-    Returns:
-        float: The average quality rating.
-    '''
-    if instance.quality_rating and instance.status == 'Completed':
-
-        rating = PurchaseOrder.objects.filter(
-            vendor=vendor,
-            quality_rating__isnull=False).aggregate(
-            Avg('quality_rating', default=0.0))
-        return round(rating['quality_rating__avg'], 1)
-
-
-def calculate_average_response_time(vendor, instance):
+        sender: The sender of the signal.
+        instance (PurchaseOrder): The purchase order being saved.
     '''
-    Calculate the average response time for a vendor.
+    instance._previous_metric_state = metrics.previous_state(instance)
 
-    Parameters:
-        instance (PurchaseOrder): The instance of the purchase order
-            being updated.
-        vendor (Vendor): The vendor associated with the purchase order.
 
-    Returns:
-        float: The average quality rating.
-    '''
-    if instance.acknowledgment_date:
-        # Filter acknowledged PurchaseOrders for the vendor
-        acknowledged_orders = PurchaseOrder.objects.filter(
-            vendor=vendor,
-            acknowledgment_date__isnull=False
-        )
-
-        # Calculate the total response time directly in the database
-        total_response_time = acknowledged_orders.aggregate(
-            total_seconds=Sum(F('acknowledgment_date') - F('issue_date'))
-        )['total_seconds']
-        total_orders = len(acknowledged_orders)
-        # Calculate the average response time
-        if total_orders:
-            average_response_time = \
-                total_response_time.total_seconds() / total_orders
-            return average_response_time
-
-# use post save to update the database
-
-
-def calculate_fullfillment_rate(instance, vendor):
+@receiver(pre_delete, sender=PurchaseOrder)
+def remember_deleted_state(sender, instance, **kwargs):
     '''
-    Calculate the fulfillment rate for a
-        vendor's Purchase Orders before saving.
+    Keep the stored state of a purchase order about to be deleted, the
+        instance may be older than the row.
 
     Parameters:
-        insatance The sender of the signal.
-        vendor: the vendor of the instance
+        sender: The sender of the signal.
+        instance (PurchaseOrder): The purchase order being deleted.
     '''
-
-    if instance.status == 'Completed' or instance.status == 'Canceled':
-        # Check if the status has changed :
-        # calculate the total number of PO of that vendor
-        completed_orders, total_orders = PurchaseOrder.objects.filter(
-            vendor=vendor).aggregate(
-            completed_orders=Count(
-                Case(
-                    When(
-                        status='Completed', then=1))),
-            total_orders=Count('id')).values()
-        if total_orders:
-            fulfillment_rate = completed_orders / total_orders
-        # Update the vendor's fulfillment ra
-            return round(fulfillment_rate, 2)
+    if isinstance(kwargs.get('origin'), Vendor):
+        # the counters are deleted along with the vendor
+        return
+    instance._deleted_metric_state = metrics.previous_state(instance)
 
 
 @receiver(post_save, sender=PurchaseOrder)
+@prometheus.observed('update_performance')
 def update_performance(sender, instance, raw, **kwargs):
     '''
     Update vendor performance metrics when a
         new purchase order is created or updated.
 
+    The vendor counters are adjusted with the change made to the
+        purchase order and the metrics are derived from them, so the
+        cost does not grow with the number of orders of the vendor.
+        The metrics are written as by the bulk endpoints and the flush
+        of the coalesced metrics, see metrics.write_vendor_metrics.
+    In coalesced mode the vendor is only queued, and its metrics are
+        written once per flush by the flush_vendor_metrics worker.
+
     Parameters:
         sender: The sender of the signal.
         instance (PurchaseOrder): The instance of the
@@ -142,23 +68,47 @@ def update_performance(sender, instance, raw, **kwargs):
         None
     '''
 
-    vendor = instance.vendor
-    attributes = {'vendor': vendor}
+    counter = metrics.record_order_change(
+        instance, getattr(instance, '_previous_metric_state', None))
+    if metrics.metrics_mode() == metrics.COALESCED:
+        # an order moved to another vendor changes both vendors
+        previous = getattr(instance, '_previous_metric_state', None) or {}
+        vendor_ids = {instance.vendor_id}
+        vendor_ids.add(previous.get('vendor_id', instance.vendor_id))
+        metrics.schedule_refresh(vendor_ids)
+        return
 
-    data = {
-        'on_time_delivery_rate': update_vendor_delivery_rate(instance, vendor),
-        'average_response_time':
-            calculate_average_response_time(vendor, instance),
-        'fulfillment_rate': calculate_fullfillment_rate(instance, vendor),
-        'quality_rating_avg': calculate_quality_rating(vendor, instance),
-    }
+    metrics.write_vendor_metrics(instance.vendor, counter)
 
-    for key, value in data.items():
-        if value is not None:
-            attributes.update({key: value})
-            setattr(vendor, key, value)
 
-    vendor.save()
+@receiver(post_delete, sender=PurchaseOrder)
+def discount_deleted_order(sender, instance, **kwargs):
+    '''
+    Remove a deleted purchase order from the counters of its vendor.
 
-    # Save historical performance
-    HistoricalPerformance.objects.create(**attributes)
+    Parameters:
+        sender: The sender of the signal.
+        instance (PurchaseOrder): The purchase order that was deleted.
+    '''
+    if isinstance(kwargs.get('origin'), Vendor):
+        # the counters are deleted along with the vendor
+        return
+    metrics.record_order_deletion(instance)
+
+
+@receiver(post_save, sender=PurchaseOrder)
+@receiver(post_delete, sender=PurchaseOrder)
+def evict_purchase_order(sender, instance, **kwargs):
+    '''
+    Evict the cached details of a purchase order that was saved or
+        deleted, and the order count when one is created or deleted.
+
+    Parameters:
+        sender: The sender of the signal.
+        instance (PurchaseOrder): The purchase order that changed.
+    '''
+    keys = [purchase_order_key(instance.pk)]
+    # post_delete sends no created flag
+    if kwargs.get('created', True):
+        keys.append(count_key(PurchaseOrder))
+    invalidate(keys)
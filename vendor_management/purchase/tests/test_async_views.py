@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from vendor_management.cache import purchase_order_key
+from vendor_management.testing import AsyncViewTestMixin
+from purchase.models import PurchaseOrder, Vendor
+from purchase import async_views
+from datetime import timedelta
+
+
+class PurchaseOrderAsyncViewsTest(AsyncViewTestMixin, TestCase):
+    '''
+    test that the async views answer as the sync views
+    '''
+
+    def setUp(self):
+        cache.clear()
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            address="123 Test Street",
+            contact_details=701056056)
+        for index in range(3):
+            self.order = PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                delivery_date=timezone.now() + timedelta(days=1),
+                items={"item1": "Test Item"},
+                quantity=index + 1,
+                status='Completed' if index else 'Pending',
+                quality_rating=4.0 if index else None)
+        user = User.objects.create_user(username='bon', password='pass')
+        token = Token.objects.create(user=user).key
+        self.headers = {'Authorization': f'Token {token}'}
+
+    def test_list(self):
+        """Test the listings, of all the orders and of a vendor."""
+        url = reverse('create_or_list_purchase')
+        for params in (
+                {}, {'page': 2, 'page_size': 2}, {'exact_count': 'false'},
+                {'vendor_id': self.vendor.id, 'page_size': 1},
+                {'vendor_id': 0}, {'cursor': 'true', 'page_size': 2},
+                {'cursor': 'true', 'vendor_id': self.vendor.id},
+                {'page_size': 'abc'}, {'page_size': 0}):
+            self.assertSameResponse(
+                async_views.create_or_list_purchase, url, params,
+                self.headers)
+
+    def test_detail(self):
+        """Test the details and their conditional requests."""
+        url = reverse(
+            'get_or_update_purchase_order', args=[self.order.id])
+        response = self.assertSameResponse(
+            async_views.get_or_update_purchase_order, url,
+            headers=self.headers, evict=[purchase_order_key(self.order.id)],
+            purchase_order_id=self.order.id)
+        for conditional in (
+                {'If-None-Match': response['ETag']},
+                {'If-Modified-Since': response['Last-Modified']}):
+            response = self.assertSameResponse(
+                async_views.get_or_update_purchase_order, url,
+                headers=dict(self.headers, **conditional),
+                purchase_order_id=self.order.id)
+            self.assertEqual(response.status_code, 304)
+        missing = reverse('get_or_update_purchase_order', args=[0])
+        response = self.assertSameResponse(
+            async_views.get_or_update_purchase_order, missing,
+            headers=self.headers, purchase_order_id=0)
+        self.assertEqual(response.status_code, 404)
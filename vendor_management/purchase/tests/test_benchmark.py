@@ -0,0 +1,21 @@
+from django.test import TransactionTestCase
+from purchase.management import benchmark
+
+
+class QueryBudgetTest(TransactionTestCase):
+    '''
+    test that no API route issues more queries than its budget,
+    outside of a test transaction like the requests in production
+    '''
+
+    def test_routes_within_budget(self):
+        """Test every route succeeds within its query budget, with
+        several orders per vendor so that a query per row shows."""
+        vendor_ids = benchmark.seed(orders=60, vendors=3)
+        results = benchmark.run(vendor_ids, repeat=2)
+        self.assertEqual(set(results), set(benchmark.QUERY_BUDGETS))
+        for name, result in results.items():
+            self.assertTrue(
+                all(code < 400 for code in result['status_codes']),
+                f'{name} failed with {result["status_codes"]}')
+        self.assertEqual(benchmark.over_budget(results), [])
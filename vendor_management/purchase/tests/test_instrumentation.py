@@ -0,0 +1,94 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from purchase.models import Vendor
+from vendor_management.instrumentation import RequestTimingMiddleware
+import json
+
+
+class RequestTimingTest(TestCase):
+    '''
+    test the timing middleware
+    '''
+
+    def setUp(self):
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            address="123 Test Street",
+            contact_details=701056056)
+        self.data = {
+            'vendor': self.vendor.id,
+            'delivery_date': timezone.now().isoformat(),
+            'items': {'item1': 10},
+            'quantity': 10,
+        }
+
+        client = APIClient()
+        client.post(
+            reverse('user-registration'),
+            {'username': 'bon', 'password': 'firefox123'}, format='json')
+        self.token = client.post(
+            reverse('user-login'),
+            {'username': 'bon', 'password': 'firefox123'},
+            format='json').data['token']
+
+    def client_for(self):
+        # the middleware is set up by the first request of a client
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        return client
+
+    def test_disabled(self):
+        """Test that no header is added when the timing is disabled."""
+        response = self.client_for().post(
+            reverse('create_or_list_purchase'), self.data, format='json')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(
+        REQUEST_TIMING=True,
+        REQUEST_TIMING_SLOW_MS=0,
+        REQUEST_TIMING_SLOW_SAMPLE_RATE=1.0)
+    def test_enabled(self):
+        """Test the header, the log line and the slow request dump."""
+        client = self.client_for()
+        with self.assertLogs('vendor_management.requests') as logs:
+            response = client.post(
+                reverse('create_or_list_purchase'), self.data,
+                format='json')
+        timing = response['Server-Timing']
+        for part in ('db;', 'cache;', 'signals;', 'total;'):
+            self.assertIn(part, timing)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['url_name'], 'create_or_list_purchase')
+        self.assertEqual(line['status'], 201)
+        self.assertGreater(line['db_calls'], 1)
+        self.assertGreater(line['signals_calls'], 0)
+        self.assertGreater(line['signals_ms'], 0)
+        dump = json.loads(logs.records[1].getMessage())
+        self.assertEqual(len(dump['queries']), line['db_calls'])
+        self.assertTrue(any(
+            query['sql'].startswith('INSERT INTO "purchase_purchaseorder"')
+            for query in dump['queries']))
+
+    @override_settings(REQUEST_TIMING=True)
+    def test_async_chain(self):
+        """Test that the middleware serves an async chain without a
+        thread, timing the queries run by the view in a thread."""
+        async def get_response(request):
+            count = await sync_to_async(Vendor.objects.count)()
+            return HttpResponse(str(count))
+
+        middleware = RequestTimingMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/api/vendors/')
+        request.resolver_match = None
+        with self.assertLogs('vendor_management.requests') as logs:
+            response = async_to_sync(middleware)(request)
+        self.assertEqual(response.content, b'1')
+        self.assertIn('Server-Timing', response)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['db_calls'], 1)
@@ -0,0 +1,273 @@
+from django.apps import apps as global_apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from purchase.models import PurchaseOrder
+from purchase import metrics
+from vendors.models import (
+    Vendor, PerformanceCounter, HistoricalPerformance,
+    PendingPerformanceUpdate)
+
+
+class PerformanceCounterTest(TestCase):
+    '''
+    test that the running counters agree with the aggregate over the orders
+    '''
+
+    def setUp(self):
+        """Set up non-modified objects used by all test methods."""
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            contact_details="test@example.com",
+            address="123 Test Street",
+        )
+        self.other_vendor = Vendor.objects.create(
+            name="Other Vendor",
+            contact_details="other@example.com",
+            address="456 Other Street",
+        )
+
+    def create_order(self, **kwargs):
+        data = {
+            'vendor': self.vendor,
+            'delivery_date': timezone.now() + timedelta(days=2),
+            'items': {"item1": 10},
+            'quantity': 10,
+        }
+        data.update(kwargs)
+        return PurchaseOrder.objects.create(**data)
+
+    def test_counters_follow_changes(self):
+        """Test creations, updates, moves and deletions keep
+        the counters equal to the aggregate."""
+        order = self.create_order(quality_rating=4.0)
+        self.create_order(status='Completed', quality_rating=3.0)
+        late = self.create_order(
+            delivery_date=timezone.now() - timedelta(days=2))
+        late.status = 'Completed'
+        late.save()
+        order.status = 'Canceled'
+        order.quality_rating = None
+        order.save()
+
+        counter = PerformanceCounter.objects.get(vendor=self.vendor)
+        self.assertEqual(counter.total_orders, 3)
+        self.assertEqual(counter.completed_orders, 2)
+        self.assertEqual(counter.on_time_orders, 1)
+        self.assertEqual(counter.canceled_orders, 1)
+        self.assertEqual(counter.rating_count, 1)
+        self.assertEqual(counter.rating_sum, 3.0)
+        self.assertEqual(counter.acknowledged_orders, 3)
+        self.assertEqual(metrics.verify_counters(), [])
+
+        loaded = PurchaseOrder.objects.get(id=late.id)
+        loaded.vendor = self.other_vendor
+        loaded.save()
+        order.delete()
+        self.assertEqual(metrics.verify_counters(), [])
+        counter.refresh_from_db()
+        self.assertEqual(counter.total_orders, 1)
+
+    def test_refreshed_order_after_bulk_status(self):
+        """Test an order refreshed after set_orders_status and saved
+        is not counted twice."""
+        order = self.create_order()
+        metrics.set_orders_status([order.id], PurchaseOrder.COMPLETED)
+        order.refresh_from_db()
+        self.assertEqual(order._metric_state['status'], 'Completed')
+        order.quantity = 5
+        order.save()
+        self.assertEqual(metrics.verify_counters(), [])
+
+    def test_stale_copies(self):
+        """Test saves and deletions of stale copies of an order adjust
+        the counters against the stored state."""
+        order = self.create_order(quality_rating=4.0)
+        first = PurchaseOrder.objects.get(id=order.id)
+        second = PurchaseOrder.objects.get(id=order.id)
+        first.status = 'Completed'
+        first.save()
+        second.status = 'Completed'
+        second.quality_rating = 2.0
+        second.save()
+        self.assertEqual(metrics.verify_counters(), [])
+        counter = PerformanceCounter.objects.get(vendor=self.vendor)
+        self.assertEqual(counter.completed_orders, 1)
+        self.assertEqual(counter.rating_sum, 2.0)
+
+        first.delete()
+        self.assertEqual(metrics.verify_counters(), [])
+        counter.refresh_from_db()
+        self.assertEqual(counter.total_orders, 0)
+        self.assertEqual(counter.completed_orders, 0)
+
+    def test_update_queries_do_not_grow(self):
+        """Test that the cost of a save does not depend
+        on the number of orders of the vendor."""
+        order = self.create_order()
+        # the stored state is read under a row lock, the new rating
+        # changes the average and a history record is written
+        order.quality_rating = 1.0
+        with self.assertNumQueries(7):
+            order.save()
+        for _ in range(20):
+            self.create_order(status='Completed', quality_rating=2.0)
+        order.quality_rating = 9.0
+        with self.assertNumQueries(7):
+            order.save()
+
+    def test_missing_counters_are_rebuilt(self):
+        """Test that a vendor without counters gets them
+        from the aggregate on the next save."""
+        order = self.create_order(status='Completed')
+        self.create_order()
+        PerformanceCounter.objects.all().delete()
+        order.quantity = 5
+        order.save()
+        counter = PerformanceCounter.objects.get(vendor=self.vendor)
+        self.assertEqual(counter.total_orders, 2)
+        self.assertEqual(counter.completed_orders, 1)
+
+    def test_paths_agree(self):
+        """Test the metrics written on save are those the bulk
+        endpoints and the flush of the coalesced metrics write."""
+        self.create_order(status='Completed', quality_rating=4.0)
+        order = self.create_order(
+            delivery_date=timezone.now() - timedelta(days=2))
+        order.status = 'Completed'
+        order.save()
+        self.create_order(acknowledgment_date=timezone.now())
+        self.vendor.refresh_from_db()
+        saved = {
+            field: getattr(self.vendor, field)
+            for field in metrics.METRIC_FIELDS}
+        self.assertEqual(saved['on_time_delivery_rate'], 0.5)
+        self.assertEqual(saved['quality_rating_avg'], 4.0)
+        self.assertEqual(saved['fulfillment_rate'], 0.67)
+        self.assertGreater(saved['average_response_time'], 0.0)
+
+        Vendor.objects.filter(id=self.vendor.id).update(
+            on_time_delivery_rate=0.0, quality_rating_avg=0.0,
+            average_response_time=0.0, fulfillment_rate=0.0)
+        metrics.refresh_vendor_metrics([self.vendor.id])
+        self.vendor.refresh_from_db()
+        self.assertEqual({
+            field: getattr(self.vendor, field)
+            for field in metrics.METRIC_FIELDS}, saved)
+
+    def test_rebuild_command(self):
+        """Test the command reports drift and rebuilds the counters."""
+        self.create_order(status='Completed', quality_rating=5.0)
+        PerformanceCounter.objects.filter(vendor=self.vendor).update(
+            total_orders=10)
+
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuild_vendor_metrics', '--check', stdout=StringIO())
+
+        out = StringIO()
+        call_command('rebuild_vendor_metrics', stdout=out)
+        self.assertIn('total_orders is 10', out.getvalue())
+        self.assertEqual(metrics.verify_counters(), [])
+        self.assertTrue(
+            PerformanceCounter.objects.filter(
+                vendor=self.other_vendor).exists())
+
+    def test_backfill_migration(self):
+        """Test that the data migration computes the counters of the
+        vendors which have none and keeps the existing ones."""
+        self.create_order(status='Completed', quality_rating=4.0)
+        self.create_order(
+            vendor=self.other_vendor, acknowledgment_date=timezone.now())
+        PerformanceCounter.objects.filter(vendor=self.vendor).delete()
+        PerformanceCounter.objects.filter(
+            vendor=self.other_vendor).update(canceled_orders=3)
+        migration = import_module(
+            'purchase.migrations.0004_backfill_performance_counters')
+
+        migration.backfill_counters(
+            global_apps, SimpleNamespace(connection=connection))
+        counter = PerformanceCounter.objects.get(vendor=self.vendor)
+        self.assertEqual(counter.total_orders, 1)
+        self.assertEqual(counter.rating_sum, 4.0)
+        self.assertEqual(
+            PerformanceCounter.objects.get(
+                vendor=self.other_vendor).canceled_orders, 3)
+
+    def test_stored_metrics_migration(self):
+        """Test that the migration indexing the stored metrics writes
+        them again from the counters, as the metric writers do."""
+        self.create_order(status='Completed', quality_rating=4.0)
+        self.create_order()
+        expected = Vendor.objects.get(id=self.vendor.id)
+        Vendor.objects.filter(id=self.vendor.id).update(
+            on_time_delivery_rate=0.0, quality_rating_avg=0.0,
+            fulfillment_rate=0.0)
+        migration = import_module(
+            'vendors.migrations.0006_vendor_metric_indexes')
+
+        migration.write_stored_metrics(
+            global_apps, SimpleNamespace(connection=connection))
+        vendor = Vendor.objects.get(id=self.vendor.id)
+        for field in metrics.METRIC_FIELDS:
+            self.assertEqual(
+                getattr(vendor, field), getattr(expected, field), field)
+        self.assertEqual(vendor.fulfillment_rate, 0.5)
+
+
+@override_settings(VENDOR_METRICS_MODE='coalesced')
+class CoalescedMetricsTest(TestCase):
+    '''
+    test that bursts of order changes are written once per vendor
+    '''
+
+    def setUp(self):
+        """Set up non-modified objects used by all test methods."""
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            contact_details="test@example.com",
+            address="123 Test Street",
+        )
+
+    def test_burst_is_coalesced(self):
+        """Test that many saves queue the vendor once and the flush
+        writes the metrics and one history row."""
+        with self.captureOnCommitCallbacks(execute=True):
+            for rating in (2.0, 4.0, 6.0):
+                PurchaseOrder.objects.create(
+                    vendor=self.vendor,
+                    delivery_date=timezone.now() + timedelta(days=1),
+                    items={"item1": 10},
+                    quantity=10,
+                    status='Completed',
+                    quality_rating=rating)
+        self.assertEqual(PendingPerformanceUpdate.objects.count(), 1)
+        self.assertEqual(HistoricalPerformance.objects.count(), 0)
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.quality_rating_avg, 0.0)
+
+        call_command('flush_vendor_metrics', '--once', stdout=StringIO())
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.quality_rating_avg, 4.0)
+        self.assertEqual(self.vendor.fulfillment_rate, 1.0)
+        self.assertEqual(self.vendor.on_time_delivery_rate, 1.0)
+        self.assertEqual(HistoricalPerformance.objects.count(), 1)
+        self.assertEqual(PendingPerformanceUpdate.objects.count(), 0)
+
+    def test_nothing_queued_before_commit(self):
+        """Test that the vendor is only queued once the
+        transaction commits."""
+        with self.captureOnCommitCallbacks(execute=True):
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                delivery_date=timezone.now(),
+                items={"item1": 10},
+                quantity=10)
+            self.assertEqual(PendingPerformanceUpdate.objects.count(), 0)
+        self.assertEqual(PendingPerformanceUpdate.objects.count(), 1)
@@ -0,0 +1,224 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from purchase.models import Vendor
+from vendor_management import prometheus
+import json
+import os
+import subprocess
+import tempfile
+
+
+class PrometheusMetricsTest(TestCase):
+    '''
+    test the metrics collection and the /metrics endpoint
+    '''
+
+    def setUp(self):
+        prometheus._samples.clear()
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            address="123 Test Street",
+            contact_details=701056056)
+        self.data = {
+            'vendor': self.vendor.id,
+            'delivery_date': timezone.now().isoformat(),
+            'items': {'item1': 10},
+            'quantity': 10,
+        }
+        client = APIClient()
+        client.post(
+            reverse('user-registration'),
+            {'username': 'bon', 'password': 'firefox123'}, format='json')
+        self.token = client.post(
+            reverse('user-login'),
+            {'username': 'bon', 'password': 'firefox123'},
+            format='json').data['token']
+
+    def client_for(self):
+        # the middleware is set up by the first request of a client
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        return client
+
+    def test_disabled(self):
+        """Test that nothing is collected or served when disabled."""
+        self.client_for().post(
+            reverse('create_or_list_purchase'), self.data, format='json')
+        self.assertEqual(prometheus._samples, {})
+        response = self.client_for().get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics(self):
+        """Test the samples collected across two processes."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # the file left by another worker
+        with open(os.path.join(
+                directory.name, 'metrics_1.json'), 'w') as output:
+            json.dump(
+                [['historical_performance_inserts_total', {}, 2]], output)
+
+        with override_settings(
+                PROMETHEUS_METRICS=True,
+                PROMETHEUS_MULTIPROC_DIR=directory.name):
+            client = self.client_for()
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post(
+                    reverse('create_or_list_purchase'), self.data,
+                    format='json')
+            vendor_url = reverse(
+                'get_or_update_vendor', args=[self.vendor.id])
+            client.get(vendor_url)
+            client.get(vendor_url)
+            response = client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE http_requests_total counter', body)
+        self.assertIn(
+            'http_requests_total{method="POST",status="201",'
+            'url_name="create_or_list_purchase"} 1\n', body)
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            '{url_name="get_or_update_vendor"} 2\n', body)
+        self.assertIn(
+            'http_request_duration_seconds_bucket'
+            '{le="+Inf",url_name="get_or_update_vendor"} 2\n', body)
+        self.assertIn('update_performance_calls_total 1\n', body)
+        self.assertIn('update_performance_duration_seconds_count 1\n', body)
+        self.assertIn(
+            'cache_requests_total{prefix="Vendor",result="miss"} 1\n', body)
+        self.assertIn(
+            'cache_requests_total{prefix="Vendor",result="hit"} 1\n', body)
+        # one insert here, two in the other worker
+        self.assertIn('historical_performance_inserts_total 3\n', body)
+
+    def test_scrape_access(self):
+        """Test that only the allowed addresses, or the holders of the
+        bearer token, read the metrics."""
+        url = reverse('metrics')
+        with override_settings(
+                PROMETHEUS_METRICS=True,
+                PROMETHEUS_ALLOWED_IPS=('10.0.0.0/8',),
+                PROMETHEUS_BEARER_TOKEN='secret'):
+            response = self.client.get(url, REMOTE_ADDR='10.1.2.3')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(url, REMOTE_ADDR='192.0.2.1')
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(
+                url, REMOTE_ADDR='192.0.2.1',
+                headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(
+                url, REMOTE_ADDR='192.0.2.1',
+                headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+            # the API tokens do not open it
+            response = self.client.get(
+                url, REMOTE_ADDR='192.0.2.1',
+                headers={'Authorization': f'Token {self.token}'})
+            self.assertEqual(response.status_code, 403)
+
+    def test_reused_pid(self):
+        """Test that a worker reusing the pid of an exited one carries its
+        samples on rather than overwriting its file."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, f'metrics_{os.getpid()}.json')
+        with open(path, 'w') as output:
+            json.dump(
+                [['historical_performance_inserts_total', {}, 2]], output)
+        prometheus._owner_pid = None
+
+        with override_settings(
+                PROMETHEUS_METRICS=True,
+                PROMETHEUS_MULTIPROC_DIR=directory.name):
+            prometheus.inc('historical_performance_inserts_total')
+            samples = prometheus.collect()
+        self.assertEqual(
+            samples[('historical_performance_inserts_total', ())], 3)
+        self.assertEqual(
+            sorted(os.listdir(directory.name)),
+            [prometheus.LOCK_FILE, os.path.basename(path)])
+
+    def test_exited_workers(self):
+        """Test that the files of the workers that exited are merged
+        into the archive, their samples still counted once."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for _ in range(2):
+            exited = subprocess.Popen(['true'])
+            exited.wait()
+            with open(os.path.join(
+                    directory.name, f'metrics_{exited.pid}.json'),
+                    'w') as output:
+                json.dump(
+                    [['historical_performance_inserts_total', {}, 2]],
+                    output)
+
+        with override_settings(
+                PROMETHEUS_METRICS=True,
+                PROMETHEUS_MULTIPROC_DIR=directory.name):
+            prometheus.inc('historical_performance_inserts_total')
+            for _ in range(2):
+                samples = prometheus.collect()
+                self.assertEqual(samples[(
+                    'historical_performance_inserts_total', ())], 5)
+        self.assertEqual(sorted(os.listdir(directory.name)), sorted([
+            prometheus.LOCK_FILE, prometheus.ARCHIVE_FILE,
+            f'metrics_{os.getpid()}.json']))
+
+    def test_bucket_order(self):
+        """Test that the buckets are exposed by ascending bound."""
+        with override_settings(PROMETHEUS_METRICS=True):
+            prometheus.observe('update_performance_duration_seconds', 0.3)
+            body = prometheus.exposition(prometheus.collect())
+        bounds = [
+            line.split('"')[1] for line in body.splitlines()
+            if line.startswith('update_performance_duration_seconds_bucket')]
+        self.assertEqual(
+            bounds, [str(bound) for bound in prometheus.BUCKETS] + ['+Inf'])
+
+    def test_idle_worker(self):
+        """Test that the samples held by a worker which stops serving
+        requests are written once the interval is over."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, f'metrics_{os.getpid()}.json')
+
+        with override_settings(
+                PROMETHEUS_METRICS=True,
+                PROMETHEUS_MULTIPROC_DIR=directory.name,
+                PROMETHEUS_FLUSH_INTERVAL=0.05):
+            prometheus.inc('historical_performance_inserts_total')
+            prometheus.inc('historical_performance_inserts_total')
+            timer = prometheus._timer
+            self.assertIsNotNone(timer)
+            timer.join(1)
+        with open(path) as source:
+            self.assertEqual(
+                json.load(source),
+                [['historical_performance_inserts_total', {}, 2]])
+
+    def test_async_chain(self):
+        """Test that the middleware serves an async chain without a
+        thread."""
+        async def get_response(request):
+            return HttpResponse(status=204)
+
+        with override_settings(PROMETHEUS_METRICS=True):
+            middleware = prometheus.PrometheusMiddleware(get_response)
+            self.assertTrue(iscoroutinefunction(middleware))
+            request = RequestFactory().get('/api/vendors/')
+            request.resolver_match = None
+            response = async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(prometheus._samples[(
+            'http_requests_total',
+            (('method', 'GET'), ('status', '204'),
+             ('url_name', 'unresolved')))], 1)
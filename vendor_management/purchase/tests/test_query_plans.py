@@ -0,0 +1,27 @@
+from django.test import TestCase
+from purchase.models import PurchaseOrder
+from vendors.models import Vendor
+from vendor_management.testing import QueryPlanTestMixin
+
+
+class PurchaseOrderQueryPlanTest(QueryPlanTestMixin, TestCase):
+    '''
+    test that the hot purchase order queries search an index
+    '''
+
+    def test_vendor_listing(self):
+        """Test the orders of a vendor are paged by id from an index."""
+        orders = PurchaseOrder.objects.filter(vendor_id=1).order_by('id')
+        self.assertUsesIndex(orders[:10])
+        self.assertUsesIndex(orders.filter(id__gt=10)[:11])
+
+    def test_vendor_status_filter(self):
+        """Test the bulk acknowledgment filter."""
+        self.assertUsesIndex(
+            PurchaseOrder.objects.filter(
+                vendor_id=1, status='Pending').values_list('id', 'status'),
+            'po_vendor_status_idx')
+
+    def test_live_metrics(self):
+        """Test the live metrics of a vendor only read its orders."""
+        self.assertUsesIndex(Vendor.objects.filter(id=1).with_live_metrics())
@@ -0,0 +1,102 @@
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from vendor_management import renderers
+from vendor_management.parsers import FastJSONParser
+from vendor_management.renderers import FastJSONRenderer, PreEncoded
+from purchase.models import PurchaseOrder, Vendor
+from purchase.serializer import PurchaseOrderSerializer
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+import uuid
+
+
+class FastJSONRendererTest(SimpleTestCase):
+    '''
+    test that the renderer and the parser match DRF's
+    '''
+
+    def setUp(self):
+        self.data = {
+            'date': timezone.now(),
+            'day': timezone.now().date(),
+            'amount': Decimal('1.50'),
+            'id': uuid.uuid4(),
+            'items': {'item1': 'café', 'nested': [1, 2.5, None, True]},
+            'separator': 'a\u2028b\u2029c',
+            3: 'integer key',
+        }
+
+    def test_render_matches_drf(self):
+        """Test the output with and without orjson."""
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        # integers orjson cannot encode are left to JSONRenderer
+        self.assertEqual(
+            FastJSONRenderer().render({'big': 2 ** 70}),
+            JSONRenderer().render({'big': 2 ** 70}))
+        self.assertEqual(
+            FastJSONRenderer().render(
+                self.data, 'application/json; indent=4'),
+            JSONRenderer().render(self.data, 'application/json; indent=4'))
+
+    def test_pre_encoded(self):
+        """Test that pre-encoded payloads are written as they are."""
+        payload = PreEncoded(b'{"po_number":"PO1"}')
+        self.assertEqual(
+            FastJSONRenderer().render(payload), b'{"po_number":"PO1"}')
+        self.assertEqual(payload['po_number'], 'PO1')
+        self.assertEqual(payload, {'po_number': 'PO1'})
+
+    def test_parse(self):
+        """Test the parser and its errors."""
+        body = '{"items": {"item1": "café"}, "quantity": 1}'.encode()
+        for orjson in (renderers.orjson, None):
+            with mock.patch('vendor_management.parsers.orjson', orjson):
+                self.assertEqual(
+                    FastJSONParser().parse(BytesIO(body)),
+                    {'items': {'item1': 'café'}, 'quantity': 1})
+                with self.assertRaises(ParseError):
+                    FastJSONParser().parse(BytesIO(b'{"quantity": NaN}'))
+
+
+class FastJSONResponseTest(TestCase):
+    '''
+    test the responses of the API rendered by FastJSONRenderer
+    '''
+
+    def test_detail(self):
+        client = APIClient()
+        client.post(
+            reverse('user-registration'),
+            {'username': 'bon', 'password': 'firefox123'}, format='json')
+        token = client.post(
+            reverse('user-login'),
+            {'username': 'bon', 'password': 'firefox123'},
+            format='json').data['token']
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        vendor = Vendor.objects.create(
+            name="Test Vendor",
+            address="123 Test Street",
+            contact_details=701056056)
+        order = PurchaseOrder.objects.create(
+            vendor=vendor,
+            delivery_date=timezone.now() + timedelta(days=1),
+            items={"item1": "café"},
+            quantity=10)
+
+        response = client.get(reverse(
+            'get_or_update_purchase_order',
+            kwargs={'purchase_order_id': order.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render(PurchaseOrderSerializer(order).data))
@@ -1,11 +1,18 @@
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
 from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from datetime import timedelta
 from purchase.models import PurchaseOrder, Vendor
 from purchase.serializer import PurchaseOrderSerializer
+from purchase import metrics
+from vendor_management.cache import purchase_order_key
+from vendors.models import HistoricalPerformance
+from vendor_management.encoders import encode_values, serializer_fields
+import gzip
 import json
 
 
@@ -246,3 +253,338 @@ class PurchaseOrderAPITestCase(TestCase):
                     'purchase_order_id': 10}), {
                 'acknowledgment_date': -23234234})
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_create_purchase(self):
+        other_vendor = Vendor.objects.create(**self.vendor_data)
+        order = {
+            "delivery_date": "2023-05-15T10:00:00Z",
+            "items": {"item1": 10},
+            "quantity": 10,
+            "status": "Completed",
+            "quality_rating": 4.0,
+        }
+        rows = [
+            dict(order, vendor=self.vendor.id),
+            dict(order, vendor=other_vendor.id, quality_rating=2.0),
+            dict(order, vendor=self.vendor.id, status='Home'),
+            dict(order, vendor=34343434),
+            dict(order, vendor=self.vendor.id, quality_rating=5.0),
+        ]
+        history = HistoricalPerformance.objects.count()
+        response = self.client.post(
+            reverse('bulk_create_purchase'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(
+            [error['row'] for error in response.data['errors']], [2, 3])
+        self.assertIn('status', response.data['errors'][0]['errors'])
+        self.assertIn('vendor', response.data['errors'][1]['errors'])
+
+        self.assertEqual(self.vendor.purchaseorder_set.count(), 3)
+        # one history record per vendor, not per order
+        self.assertEqual(HistoricalPerformance.objects.count(), history + 2)
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.quality_rating_avg, 4.5)
+        self.assertEqual(metrics.verify_counters(), [])
+        for created in self.vendor.purchaseorder_set.filter(
+                status='Completed'):
+            self.assertTrue(created.po_number)
+            self.assertIsNotNone(created.acknowledgment_date)
+
+    def test_bulk_create_purchase_ndjson(self):
+        rows = [
+            {"vendor": self.vendor.id,
+             "delivery_date": "2023-05-15T10:00:00Z",
+             "items": {"item1": n},
+             "quantity": n} for n in range(1, 4)]
+        body = '\n'.join(json.dumps(row) for row in rows) + '\n'
+        response = self.client.post(
+            reverse('bulk_create_purchase'), body,
+            content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(self.vendor.purchaseorder_set.count(), 4)
+
+    def test_bulk_create_purchase_invalid(self):
+        response = self.client.post(
+            reverse('bulk_create_purchase'), {'vendor': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            reverse('bulk_create_purchase'), [{'vendor': 1}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], 0)
+
+    def test_bulk_update_acknowledgment(self):
+        orders = [
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                delivery_date=timezone.now() + timedelta(days=1),
+                items={"item1": 10},
+                quantity=10) for _ in range(3)]
+        history = HistoricalPerformance.objects.count()
+        response = self.client.post(
+            reverse('bulk_update_acknowledgment'),
+            {'orders': [
+                {'id': orders[0].id, 'status': 'Completed'},
+                [orders[1].id, 'Canceled'],
+                [orders[2].id, 'Home'],
+                [4545, 'Completed']]},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(
+            [error['row'] for error in response.data['errors']], [2, 3])
+
+        for order in orders:
+            order.refresh_from_db()
+        self.assertEqual(orders[0].status, 'Completed')
+        self.assertEqual(orders[1].status, 'Canceled')
+        self.assertEqual(orders[2].status, 'Pending')
+        self.assertAlmostEqual(
+            orders[0].acknowledgment_date, timezone.now(),
+            delta=timedelta(seconds=1))
+        self.assertIsNotNone(orders[1].acknowledgment_date)
+        self.assertIsNone(orders[2].acknowledgment_date)
+        # the vendor metrics are recomputed once
+        self.assertEqual(HistoricalPerformance.objects.count(), history + 1)
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.on_time_delivery_rate, 1.0)
+        self.assertEqual(self.vendor.fulfillment_rate, 0.25)
+        self.assertEqual(metrics.verify_counters(), [])
+
+    def test_bulk_update_acknowledgment_filter(self):
+        response = self.client.post(
+            reverse('bulk_update_acknowledgment'),
+            {'filter': {'vendor_id': self.vendor.id, 'status': 'PENDING'},
+             'status': 'Completed'},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 1)
+        self.purchase_order.refresh_from_db()
+        self.assertEqual(self.purchase_order.status, 'Completed')
+        self.assertIsNotNone(self.purchase_order.acknowledgment_date)
+
+        response = self.client.post(
+            reverse('bulk_update_acknowledgment'),
+            {'filter': {'quantity': 10}, 'status': 'Completed'},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cached_purchase_order_is_evicted(self):
+        url = reverse(
+            'get_or_update_purchase_order',
+            kwargs={'purchase_order_id': self.purchase_order.id})
+        self.assertEqual(self.client.get(url).data['quantity'], 10)
+        self.client.put(url, data={'quantity': 555}, format='json')
+        self.assertEqual(self.client.get(url).data['quantity'], 555)
+
+        self.client.post(
+            reverse('bulk_update_acknowledgment'),
+            {'orders': [[self.purchase_order.id, 'Canceled']]},
+            format='json')
+        self.assertEqual(self.client.get(url).data['status'], 'Canceled')
+
+    def test_get_purchase_order_from_cache(self):
+        url = reverse(
+            'get_or_update_purchase_order',
+            kwargs={'purchase_order_id': self.purchase_order.id})
+        self.client.get(url)
+        # the token and the row are both cached
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('po_number'), 'wewe')
+
+        missing = reverse(
+            'get_or_update_purchase_order',
+            kwargs={'purchase_order_id': 4545})
+        self.assertEqual(
+            self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+        with self.assertNumQueries(0):
+            response = self.client.get(missing)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_purchase_order_cached_bytes(self):
+        url = reverse(
+            'get_or_update_purchase_order',
+            kwargs={'purchase_order_id': self.purchase_order.id})
+        first = self.client.get(url)
+        second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(
+            json.loads(second.content),
+            PurchaseOrderSerializer(
+                PurchaseOrder.objects.get(id=self.purchase_order.id)).data)
+
+        cache.delete(purchase_order_key(self.purchase_order.id))
+        with self.settings(CACHE_COMPRESS_MIN_BYTES=1):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(gzip.decompress(response.content), first.content)
+            self.assertNotEqual(response['ETag'], first['ETag'])
+            # clients not accepting gzip get the document decompressed
+            response = self.client.get(url)
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(response.content, first.content)
+            self.assertEqual(response['ETag'], first['ETag'])
+            # nor does the browsable API, which reads the document
+            response = self.client.get(
+                url, HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('Content-Encoding', response)
+            self.assertIn(b'wewe', response.content)
+
+    def test_get_purchase_order_conditional(self):
+        url = reverse(
+            'get_or_update_purchase_order',
+            kwargs={'purchase_order_id': self.purchase_order.id})
+        response = self.client.get(url)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+        # answered from the version alone
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(url, {'quantity': 5})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['quantity'], 5)
+
+    def test_list_purchase_cursor(self):
+        other_vendor = Vendor.objects.create(**self.vendor_data)
+        for vendor in (self.vendor, other_vendor, self.vendor):
+            PurchaseOrder.objects.create(
+                vendor=vendor,
+                delivery_date=timezone.now(),
+                items={"item1": 10},
+                quantity=10)
+        url = reverse('create_or_list_purchase')
+        response = self.client.get(url, {
+            'cursor': 'true', 'page_size': 2, 'vendor_id': self.vendor.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['data']), 2)
+        next_cursor = response.data['next_cursor']
+        response = self.client.get(url, {
+            'after': next_cursor, 'page_size': 2,
+            'vendor_id': self.vendor.id})
+        self.assertEqual(len(response.data['data']), 1)
+        self.assertEqual(response.data['data'][0]['vendor'], self.vendor.id)
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_list_purchase_invalid_page_size(self):
+        """Test that the pages of an invalid size have the default size
+        with both paginations."""
+        for _ in range(12):
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                delivery_date=timezone.now(),
+                items={"item1": 10},
+                quantity=10)
+        url = reverse('create_or_list_purchase')
+        for page_size in ('abc', '0', '-1'):
+            for params in ({}, {'cursor': 'true'}):
+                response = self.client.get(
+                    url, {'page_size': page_size, **params})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['page_size'], 10)
+
+    def test_list_purchase_total_count(self):
+        url = reverse('create_or_list_purchase')
+        for _ in range(2):
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                delivery_date=timezone.now(),
+                items={"item1": 10},
+                quantity=10)
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.data['total_pages'], 2)
+        # the count and the token are cached: page
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'page_size': 2, 'page': 2})
+        self.assertEqual(len(response.data['data']), 1)
+        # the vendor counter gives the count: vendor, page
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {
+                'page_size': 2, 'vendor_id': self.vendor.id})
+        self.assertEqual(response.data['total_pages'], 2)
+
+        PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            delivery_date=timezone.now(),
+            items={"item1": 10},
+            quantity=10)
+        PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            delivery_date=timezone.now(),
+            items={"item1": 10},
+            quantity=10)
+        # an estimate may lag behind the inserts
+        response = self.client.get(url, {
+            'page_size': 2, 'exact_count': 'false'})
+        self.assertEqual(response.data['total_pages'], 2)
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.data['total_pages'], 3)
+        response = self.client.get(url, {
+            'page_size': 2, 'vendor_id': self.vendor.id})
+        self.assertEqual(response.data['total_pages'], 3)
+
+    def test_export_purchase(self):
+        PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            delivery_date=timezone.now(),
+            items={"item1": "café"},
+            quantity=10,
+            status='Completed')
+        url = reverse('export_purchase')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        expected = PurchaseOrderSerializer(
+            PurchaseOrder.objects.order_by('id'), many=True).data
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+        response = self.client.get(url, {
+            'export_format': 'csv', 'vendor_id': self.vendor.id})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'po_number'])
+        self.assertEqual(len(lines), 3)
+
+        response = self.client.get(url, {'export_format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_encoding_matches_serializer(self):
+        PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            delivery_date=timezone.now() + timedelta(microseconds=1),
+            items={"item1": "café", "nested": [1, 2.5, None]},
+            quantity=3,
+            status='Completed',
+            quality_rating=None,
+            acknowledgment_date=timezone.now())
+        orders = PurchaseOrder.objects.order_by('id')
+        for time_zone in ('UTC', 'Africa/Nairobi', 'America/New_York'):
+            with self.settings(TIME_ZONE=time_zone):
+                expected = JSONRenderer().render(
+                    PurchaseOrderSerializer(orders, many=True).data)
+                encoded = JSONRenderer().render(encode_values(
+                    PurchaseOrderSerializer,
+                    orders.values(*serializer_fields(
+                        PurchaseOrderSerializer))))
+                self.assertEqual(encoded, expected)
+
+        response = self.client.get(reverse('create_or_list_purchase'))
+        self.assertEqual(
+            response.data['data'],
+            PurchaseOrderSerializer(orders, many=True).data)
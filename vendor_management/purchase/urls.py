@@ -2,15 +2,28 @@
 This module regiister endpoints to view fuctions
 '''
 
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# the GET requests are served by coroutines under ASGI
+api = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # list all vendors or create purchaseOrder
-    path('', views.create_or_list_purchase, name='create_or_list_purchase'),
+    path('', api.create_or_list_purchase, name='create_or_list_purchase'),
+    # create many purchase orders at once
+    path('bulk/', views.bulk_create_purchase, name='bulk_create_purchase'),
+    # stream all the purchase orders
+    path('export/', views.export_purchase, name='export_purchase'),
+    # update the status of many purchase orders at once
+    path(
+        'acknowledge/',
+        views.bulk_update_acknowledgment,
+        name='bulk_update_acknowledgment'),
     # update, delete or get  a vendor with a given id
     path('<int:purchase_order_id>/',
-         views.get_or_update_purchase_order,
+         api.get_or_update_purchase_order,
          name='get_or_update_purchase_order'),
     path(
         '<int:purchase_order_id>/acknowledge/',
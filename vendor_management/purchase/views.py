@@ -2,17 +2,92 @@
 This module defines end point for the class Purchse
 '''
 from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.db import transaction
 from .models import PurchaseOrder
 from vendors.models import Vendor, HistoricalPerformance
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import (
+    api_view, permission_classes, parser_classes)
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from .serializer import PurchaseOrderSerializer
+from rest_framework.relations import PrimaryKeyRelatedField
+from .serializer import PurchaseOrderSerializer, BulkPurchaseOrderSerializer
+from .parsers import NDJSONParser
+from vendor_management.parsers import FastJSONParser
+from vendor_management.pagination import (
+    wants_cursor, cursor_page, wants_exact_count, total_count,
+    numbered_page)
+from . import metrics
 import uuid
-from django.core.cache import cache
+from django.conf import settings
+from vendor_management.cache import (
+    purchase_order_key, count_key, get_or_load, invalidate, rendered,
+    current_version, version_etag)
+from vendor_management.conditional import cached_response, not_modified
+from functools import partial
 from django.utils import timezone
+from vendor_management.encoders import (
+    CONTENT_TYPES, export_response, encode_values, serializer_fields)
+
+# number of rows written per query by the bulk endpoints
+BULK_BATCH_SIZE = 1000
+# number of rows read per query by the export endpoint
+EXPORT_CHUNK_SIZE = 2000
+# columns of the export, in the order of PurchaseOrderSerializer
+EXPORT_FIELDS = (
+    'id', 'po_number', 'order_date', 'delivery_date', 'items', 'quantity',
+    'status', 'quality_rating', 'issue_date', 'acknowledgment_date',
+    'vendor')
+
+
+def listing_vendors():
+    '''
+    Returns:
+    - The query of the vendor whose purchase orders are listed, with the
+        counters giving their number.
+    '''
+    return Vendor.objects.select_related('performance_counter')
+
+
+def listing_rows(vendor):
+    '''
+    Build the purchase orders of the listing, for the sync and the async
+        views.
+
+    Parameters:
+    - vendor: The vendor whose orders are listed, None for all the
+        orders.
+
+    Returns:
+    - The orders, the rows read for a page of them and their number
+        when the counters of the vendor already hold it.
+    '''
+    known_count = None
+    if vendor is None:
+        # select all purchaseorder
+        all_orders = PurchaseOrder.objects.all().order_by('id')
+    else:
+        all_orders = PurchaseOrder.objects.filter(
+            vendor=vendor).order_by('id')
+        # the order counter of the vendor is kept exact on every change
+        counter = getattr(vendor, 'performance_counter', None)
+        if counter is not None:
+            known_count = counter.total_orders
+    # the page is read as dicts and encoded without the serializer
+    rows = all_orders.values(*serializer_fields(PurchaseOrderSerializer))
+    return all_orders, rows, known_count
+
+
+def listing_page(page, pagination):
+    '''
+    Returns:
+    - The body of a page of the listing, from its rows and its
+        pagination information.
+    '''
+    return {
+        'data': encode_values(PurchaseOrderSerializer, page), **pagination}
 
 
 @api_view(['GET', 'POST'])
@@ -26,6 +101,11 @@ def create_or_list_purchase(request):
     - Lists all purchase orders.
     - Pagination is supported,
     allowing the client to specify the page size for the results.
+    - With `cursor=true`, or `after=<next_cursor of the previous page>`,
+    keyset pagination is used instead: no count is made and every page
+    costs the same whatever its depth.
+    - The total is read from the order counter of the vendor or from the
+    cached count of the orders, `exact_count=false` accepts an estimate.
 
     POST Request:
     - Creates a new purchase order based on the provided data.
@@ -40,40 +120,20 @@ def create_or_list_purchase(request):
     if request.method == 'GET':
         vendor_id = request.query_params.get('vendor_id')
         # select purchases from the vendor
-        if vendor_id:
-            vendor = get_object_or_404(Vendor, id=vendor_id)
-            all_orders = PurchaseOrder.objects.filter(
-                vendor=vendor).order_by('id')
+        vendor = get_object_or_404(
+            listing_vendors(), id=vendor_id) if vendor_id else None
+        all_orders, rows, known_count = listing_rows(vendor)
+        if wants_cursor(request):
+            try:
+                page, pagination = cursor_page(request, rows)
+            except ValueError as error:
+                return Response(
+                    f'Error : {error}', status.HTTP_400_BAD_REQUEST)
         else:
-            # select all purchaseorder
-            all_orders = PurchaseOrder.objects.all().order_by('id')
-        try:
-            page_number = request.query_params.get('page', 1)
-            page_size = request.query_params.get('page_size', 10)
-            p = Paginator(all_orders, page_size)
-
-            page_obj = p.get_page(int(page_number))
-
-        # if page is empty then return last page
-        except EmptyPage:
-            page_obj = p.page(p.num_pages)
-        # if page_number is not an integer then assign the first page
-        except (PageNotAnInteger, Exception):
-            page_obj = p.page(1)
-        finally:
-
-            serialise = PurchaseOrderSerializer(page_obj, many=True)
-            results = {
-                'data': serialise.data,
-                "next_page": page_obj.next_page_number() if
-                page_obj.has_next() else None,
-                "page": page_obj.number,
-                "page_size": len(
-                    page_obj.object_list),
-                "prev_page": page_obj.previous_page_number() if
-                page_obj.has_previous() else None,
-                "total_pages": p.num_pages}
-            return Response(results, status.HTTP_200_OK)
+            count = total_count(
+                all_orders, wants_exact_count(request), known_count)
+            page, pagination = numbered_page(request, rows, count)
+        return Response(listing_page(page, pagination), status.HTTP_200_OK)
     # if the request method is POST
     # deserialiser from pyhton to django object with exception set to true
     vendor_id = request.data.get('vendor')
@@ -83,7 +143,6 @@ def create_or_list_purchase(request):
     except Exception as error:
         return Response(f'Error : {error}', status.HTTP_400_BAD_REQUEST)
 
-    vendor = get_object_or_404(Vendor, id=vendor_id)
     data = request.data
 
     serializer = PurchaseOrderSerializer(data=data)
@@ -94,9 +153,154 @@ def create_or_list_purchase(request):
         return Response(
             f'Purchase Order PO number {po_number} created successfully',
             status.HTTP_201_CREATED)
+    # the serializer already looked the vendor up
+    vendor_errors = serializer.errors.get('vendor', [])
+    if any(error.code == 'does_not_exist' for error in vendor_errors):
+        raise Http404
     return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([FastJSONParser, NDJSONParser])
+def bulk_create_purchase(request):
+    '''
+    Create many purchase orders in a single request.
+
+    The body is either a JSON array of purchase orders or an NDJSON
+    stream (`Content-Type: application/x-ndjson`) with one purchase
+    order per line, each with the same fields as for
+    `create_or_list_purchase`.
+
+    All the rows are validated in one pass, the vendors are resolved
+    with a single query and the valid rows are inserted in batches.
+    The vendor metrics are then recomputed once per affected vendor
+    instead of once per order.
+
+    Parameters:
+    - `request`: The HTTP request object.
+
+    Returns:
+    - The number of orders created and, for every rejected row,
+    its position in the input and the validation errors.
+    '''
+    rows = request.data
+    if not isinstance(rows, list):
+        return Response(
+            'A list of purchase orders must be passed',
+            status.HTTP_400_BAD_REQUEST)
+
+    serializer = BulkPurchaseOrderSerializer()
+    errors = []
+    validated = []
+    for index, row in enumerate(rows):
+        try:
+            validated.append((index, serializer.run_validation(row)))
+        except ValidationError as error:
+            errors.append({'row': index, 'errors': error.detail})
+
+    vendors = Vendor.objects.in_bulk(
+        {data['vendor'] for _, data in validated})
+    does_not_exist = PrimaryKeyRelatedField.default_error_messages[
+        'does_not_exist']
+    orders = []
+    for index, data in validated:
+        vendor_id = data.pop('vendor')
+        if vendor_id not in vendors:
+            errors.append({'row': index, 'errors': {
+                'vendor': [does_not_exist.format(pk_value=vendor_id)]}})
+            continue
+        order = PurchaseOrder(vendor=vendors[vendor_id], **data)
+        order.set_generated_fields()
+        orders.append(order)
+
+    with transaction.atomic():
+        PurchaseOrder.objects.bulk_create(orders, batch_size=BULK_BATCH_SIZE)
+        metrics.schedule_refresh(metrics.record_new_orders(orders))
+        # the new ids may have been cached as missing
+        keys = [purchase_order_key(order.pk) for order in orders]
+        invalidate(keys + [count_key(PurchaseOrder)])
+
+    errors.sort(key=lambda error: error['row'])
+    results = {'created': len(orders), 'errors': errors}
+    if errors and not orders:
+        return Response(results, status.HTTP_400_BAD_REQUEST)
+    return Response(results, status.HTTP_201_CREATED)
+
+
+def purchase_order_payload(order, key, version):
+    '''
+    Render a purchase order for the cache.
+
+    Parameters:
+    - order: The purchase order, None if it does not exist.
+    - key: Its cache key.
+    - version: The version of the key, read before the order.
+
+    Returns:
+    - The rendered purchase order (see cache.rendered),
+        or None if it does not exist.
+    '''
+    if order:
+        return rendered(
+            PurchaseOrderSerializer(order).data,
+            version_etag(key, version), order.order_date)
+
+
+def load_purchase_order(purchase_order_id):
+    '''
+    Serialize a purchase order for the cache.
+
+    Parameters:
+    - purchase_order_id: The unique identifier of the purchaseorder.
+
+    Returns:
+    - The rendered purchase order (see cache.rendered),
+        or None if it does not exist.
+    '''
+    key = purchase_order_key(purchase_order_id)
+    # read before the row, a change made meanwhile bumps it again
+    version = current_version(key)
+    return purchase_order_payload(
+        PurchaseOrder.objects.filter(id=purchase_order_id).first(),
+        key, version)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_purchase(request):
+    '''
+    Stream all the purchase orders, optionally those of a vendor
+        with `vendor_id`, for loads into the data warehouse.
+
+    The rows are read in chunks of EXPORT_CHUNK_SIZE and encoded while
+        they are sent, so memory does not grow with the number of orders.
+
+    Parameters:
+    - `request`: The HTTP request object, with the optional
+    `export_format` (`ndjson`, the default, or `csv`) and `vendor_id`
+    query parameters.
+
+    Returns:
+    - A streamed file with one purchase order per line, with the same
+    fields as PurchaseOrderSerializer.
+    '''
+    export_format = request.query_params.get('export_format', 'ndjson')
+    if export_format not in CONTENT_TYPES:
+        return Response(
+            f'Error : Unsupported export format {export_format}',
+            status.HTTP_400_BAD_REQUEST)
+    orders = PurchaseOrder.objects.order_by('id')
+    vendor_id = request.query_params.get('vendor_id')
+    if vendor_id:
+        vendor = get_object_or_404(Vendor, id=vendor_id)
+        orders = orders.filter(vendor=vendor)
+    rows = orders.values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE)
+    return export_response(
+        export_format, EXPORT_FIELDS, rows, 'purchase_orders')
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def get_or_update_purchase_order(request, purchase_order_id):
@@ -118,25 +322,35 @@ def get_or_update_purchase_order(request, purchase_order_id):
     a success message upon update or deletion,
     or an error message if the operation fails.
 
+    The details are served from the cache without querying the
+    database, missing ids included. They carry an ETag and a
+    Last-Modified date, and conditional requests get a 304 when the
+    order did not change.
+
     Raises:
     - Http404: If the specified purchaseorder does not exist.
     - PermissionDenied: If the user does not have the
     required permissions to perform the operation.
     """
-    # rettrive detail of a specified order
-    order = get_object_or_404(PurchaseOrder, id=purchase_order_id)
-    cached_data = cache.get(f'PO_{purchase_order_id}')
-    
     if request.method == 'GET':
-        # retrive the data of that order
-        if cached_data:
-            return Response(cached_data, status.HTTP_200_OK)
-        serialise = PurchaseOrderSerializer(order)
-        data = serialise.data
-        cache.set(f'PO_{purchase_order_id}', data, timeout=600)
-        print(data)
-        return Response(data, status.HTTP_200_OK)
-    elif request.method == 'PUT':
+        # retrive the data of that order, from the cache when possible
+        key = purchase_order_key(purchase_order_id)
+        # the client already holds the current version
+        response = not_modified(request, key)
+        if response is not None:
+            return response
+        payload = get_or_load(
+            key, partial(load_purchase_order, purchase_order_id),
+            settings.PURCHASE_ORDER_CACHE_TIMEOUT)
+        if payload is None:
+            raise Http404
+        return cached_response(request, payload)
+
+    # rettrive detail of a specified order, with the vendor whose
+    # metrics the signals update
+    order = get_object_or_404(
+        PurchaseOrder.objects.select_related('vendor'), id=purchase_order_id)
+    if request.method == 'PUT':
         # update the object
         serialise = PurchaseOrderSerializer(
             order, data=request.data, partial=True)
@@ -169,7 +383,8 @@ def update_acknowlegment(request, purchase_order_id):
     Returns:
     - A JSON response indicating success or failure of the update operation.
     """
-    order = PurchaseOrder.objects.filter(id=purchase_order_id).first()
+    order = PurchaseOrder.objects.select_related('vendor').filter(
+        id=purchase_order_id).first()
     if not order:
         return Response(
             f'Order with ID {purchase_order_id} does not exist.',
@@ -186,3 +401,108 @@ def update_acknowlegment(request, purchase_order_id):
                 status.HTTP_200_OK)
         return Response(serialise.errors, status.HTTP_400_BAD_REQUEST)
     return Response("Status must be passed", status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_update_acknowledgment(request):
+    """
+    Update the status of many purchase orders at once.
+
+    The body either lists the orders to update as `[id, status]` pairs
+    or objects:
+    `{"orders": [{"id": 1, "status": "Completed"}, [2, "Canceled"]]}`
+    or selects them with a filter on the vendor and the current status:
+    `{"filter": {"vendor_id": 1, "status": "Pending"}, "status": "Completed"}`
+
+    Orders moving to the same status are updated with a single UPDATE
+    statement, the acknowledgment date being stamped in SQL like when
+    a single order is saved, and the metrics of every affected vendor
+    are recomputed once.
+
+    Parameters:
+    - request: The HTTP request object.
+
+    Returns:
+    - The number of orders updated and, for every rejected entry,
+    its position in the list and the error.
+    """
+    data = request.data
+    if not isinstance(data, dict):
+        return Response(
+            'Orders or a filter must be passed', status.HTTP_400_BAD_REQUEST)
+    valid_statuses = dict(PurchaseOrder.STATUS_CHOICES)
+    errors = []
+    # ids to update grouped by their new status, with their entry index
+    by_status = {}
+
+    if 'filter' in data:
+        filters = data['filter']
+        status_ = data.get('status')
+        if (not isinstance(filters, dict) or not filters or
+                set(filters) - {'vendor_id', 'status'}):
+            return Response(
+                "The filter accepts 'vendor_id' and 'status'",
+                status.HTTP_400_BAD_REQUEST)
+        if status_ not in valid_statuses:
+            return Response(
+                f'"{status_}" is not a valid choice.',
+                status.HTTP_400_BAD_REQUEST)
+        try:
+            order_ids = PurchaseOrder.objects.filter(
+                **filters).values_list('id', flat=True)
+            by_status[status_] = {order_id: None for order_id in order_ids}
+        except (TypeError, ValueError) as error:
+            return Response(
+                f'Error : {error}', status.HTTP_400_BAD_REQUEST)
+    else:
+        orders = data.get('orders')
+        if not isinstance(orders, list):
+            return Response(
+                'Orders or a filter must be passed',
+                status.HTTP_400_BAD_REQUEST)
+        for index, entry in enumerate(orders):
+            if isinstance(entry, dict):
+                entry = (entry.get('id'), entry.get('status'))
+            if not isinstance(entry, (list, tuple)) or len(entry) != 2:
+                errors.append({
+                    'row': index,
+                    'error': 'Expected an id and a status'})
+                continue
+            order_id, status_ = entry
+            if status_ not in valid_statuses:
+                errors.append({
+                    'row': index,
+                    'error': f'"{status_}" is not a valid choice.'})
+                continue
+            try:
+                order_id = int(order_id)
+            except (TypeError, ValueError):
+                errors.append({
+                    'row': index,
+                    'error': f'"{order_id}" is not a valid id.'})
+                continue
+            by_status.setdefault(status_, {})[order_id] = index
+
+    updated = 0
+    vendor_ids = set()
+    with transaction.atomic():
+        for status_, entries in by_status.items():
+            order_ids, vendors = metrics.set_orders_status(
+                entries, status_, batch_size=BULK_BATCH_SIZE)
+            updated += len(order_ids)
+            vendor_ids.update(vendors)
+            for order_id in set(entries) - set(order_ids):
+                if entries[order_id] is None:
+                    # deleted since it matched the filter
+                    continue
+                errors.append({
+                    'row': entries[order_id],
+                    'error': f'Order with ID {order_id} does not exist.'})
+        metrics.schedule_refresh(vendor_ids)
+
+    errors.sort(key=lambda error: error['row'])
+    results = {'updated': updated, 'errors': errors}
+    if errors and not updated:
+        return Response(results, status.HTTP_400_BAD_REQUEST)
+    return Response(results, status.HTTP_200_OK)
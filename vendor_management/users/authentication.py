@@ -0,0 +1,161 @@
+'''
+This module authenticates the API requests with cached tokens
+
+Looking a token up costs a query joining the token and its user on every
+request. The tokens and their users are kept in a small in-process LRU for
+TOKEN_LOCAL_CACHE_TIMEOUT seconds. The shared cache keeps, for
+TOKEN_CACHE_TIMEOUT seconds, the fields of the user authentication and
+the permissions read (AUTH_FIELDS), so that another process builds the
+user without a query; the other fields, the password hash first, are not
+written to it and are read from the database if a view uses them. Both
+are evicted when the token is deleted or one of these fields of its user
+changes, deactivated for instance (see users/signals.py). Other
+processes drop their local copy within TOKEN_LOCAL_CACHE_TIMEOUT
+seconds.
+The async views authenticate from the local LRU without leaving the event
+loop, and in a thread otherwise.
+'''
+import copy
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    TokenAuthentication, get_authorization_header)
+from vendor_management.cache import store, token_key
+
+# fields of the user kept in the shared cache with its primary key, a
+# change of one of them evicts the tokens of the user
+AUTH_FIELDS = ('username', 'is_active', 'is_staff', 'is_superuser')
+
+_lock = threading.Lock()
+# cache key -> (token, monotonic time it expires), least recently used first
+_local = OrderedDict()
+
+
+def local_get(key):
+    '''
+    Returns:
+        Token: The token cached in this process, with its user, or
+            None.
+    '''
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return entry[0]
+
+
+def local_set(key, token):
+    '''
+    Cache a token in this process, dropping the least recently used
+        token when TOKEN_LOCAL_CACHE_SIZE are cached.
+    '''
+    with _lock:
+        _local[key] = (
+            token, time.monotonic() + settings.TOKEN_LOCAL_CACHE_TIMEOUT)
+        _local.move_to_end(key)
+        while len(_local) > settings.TOKEN_LOCAL_CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def cached_fields(model):
+    '''
+    Returns:
+        list: The fields of the user model kept in the shared cache, in
+            the order of its concrete fields.
+    '''
+    return [
+        field.attname for field in model._meta.concrete_fields
+        if field.primary_key or field.attname in AUTH_FIELDS]
+
+
+def evict(keys):
+    '''
+    Drop tokens from the cache of this process.
+
+    Parameters:
+        keys (iterable): The cache keys of the tokens.
+    '''
+    with _lock:
+        for key in keys:
+            _local.pop(key, None)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    Token authentication reading the tokens and their users from the
+        local and the shared cache before the database.
+    '''
+
+    def shared_token(self, key, cache_key):
+        '''
+        Read a token from the shared cache, which holds the cached_fields
+            of its user, or from the database.
+
+        Returns:
+            Token: The token, with its user, whose other fields are
+                deferred when read from the shared cache.
+
+        Raises:
+            AuthenticationFailed: An invalid token or an inactive user.
+        '''
+        model = get_user_model()
+        fields = cached_fields(model)
+        values = cache.get(cache_key)
+        # the entries cached with other fields are read again
+        if values is not None and len(values) == len(fields):
+            user = model.from_db(router.db_for_read(model), fields, values)
+            return self.get_model()(key=key, user=user)
+        token = super().authenticate_credentials(key)[1]
+        store(
+            cache_key, [getattr(token.user, field) for field in fields],
+            settings.TOKEN_CACHE_TIMEOUT)
+        return token
+
+    def authenticate_credentials(self, key):
+        cache_key = token_key(key)
+        token = local_get(cache_key)
+        if token is None:
+            token = self.shared_token(key, cache_key)
+            local_set(cache_key, token)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # the cached instances are shared by the threads of the process
+        user = copy.copy(token.user)
+        return (user, token)
+
+    async def aauthenticate_credentials(self, key):
+        '''
+        Coroutine version of authenticate_credentials, which only runs
+            in a thread when the token is not cached in this process.
+        '''
+        token = local_get(token_key(key))
+        if token is None or not token.user.is_active:
+            return await sync_to_async(self.authenticate_credentials)(key)
+        return (copy.copy(token.user), token)
+
+    async def aauthenticate(self, request):
+        '''
+        Coroutine version of authenticate.
+        '''
+        auth = get_authorization_header(request).split()
+        if (len(auth) == 2 and
+                auth[0].lower() == self.keyword.lower().encode()):
+            try:
+                key = auth[1].decode()
+            except UnicodeError:
+                key = None
+            if key:
+                return await self.aauthenticate_credentials(key)
+        # the missing and the malformed headers
+        return self.authenticate(request)
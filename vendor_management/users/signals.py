@@ -0,0 +1,54 @@
+'''
+This module evicts the cached authentication tokens which no longer
+authenticate their user
+'''
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from vendor_management.cache import invalidate, token_key
+from .authentication import AUTH_FIELDS, evict
+
+# fields of the user whose change evicts its tokens
+EVICTING_FIELDS = frozenset(('password', *AUTH_FIELDS))
+
+
+def evict_tokens(keys):
+    '''
+    Evict tokens from the shared cache and from the cache of this
+        process, now and once the transaction commits.
+
+    Parameters:
+        keys (list): The cache keys of the tokens.
+    '''
+    invalidate(keys)
+    evict(keys)
+    transaction.on_commit(lambda: evict(keys))
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    '''
+    Evict a token deleted, by itself or with its user.
+    '''
+    evict_tokens([token_key(instance.key)])
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens(sender, instance, created, update_fields=None,
+                      **kwargs):
+    '''
+    Evict the tokens of a user changed, deactivated for instance, so
+        that the next requests read the user again.
+
+    The saves of other fields only, such as the last_login written on
+        every login, keep them without querying the tokens.
+    '''
+    if created or (
+            update_fields is not None and
+            EVICTING_FIELDS.isdisjoint(update_fields)):
+        return
+    evict_tokens([
+        token_key(key) for key in Token.objects.filter(
+            user=instance).values_list('key', flat=True)])
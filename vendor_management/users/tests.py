@@ -1,3 +1,100 @@
+from django.contrib.auth.models import User, update_last_login
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from vendor_management.cache import token_key
+from vendors.models import Vendor
+from .authentication import CachedTokenAuthentication, evict
 
-# Create your tests here.
+
+class CachedTokenAuthenticationTest(TestCase):
+    '''
+    test the cached token authentication
+    '''
+
+    def setUp(self):
+        cache.clear()
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            contact_details="test@example.com",
+            address="123 Test Street",
+        )
+        self.url = reverse('get_or_update_vendor', args=[self.vendor.id])
+        client = APIClient()
+        client.post(
+            reverse('user-registration'),
+            {'username': 'bon', 'password': 'firefox123'}, format='json')
+        self.token = client.post(
+            reverse('user-login'),
+            {'username': 'bon', 'password': 'firefox123'},
+            format='json').data['token']
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(self.url)
+
+    def test_cached_token(self):
+        """Test that a cached token is not read from the database."""
+        self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+
+    def test_deleted_token(self):
+        """Test that a deleted token no longer authenticates."""
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.filter(key=self.token).delete()
+        self.assertEqual(
+            self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user(self):
+        """Test that the token of a deactivated user
+        no longer authenticates."""
+        self.get()
+        user = User.objects.get(username='bon')
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(
+            self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_shared_cache_holds_the_auth_fields(self):
+        """Test that the shared cache holds the fields authentication
+        reads, not the password hash, and that another process builds
+        the user from them without a query."""
+        self.get()
+        user = User.objects.get(username='bon')
+        cache_key = token_key(self.token)
+        self.assertEqual(
+            cache.get(cache_key), [user.id, False, 'bon', False, True])
+
+        # another process, without the token in its local cache
+        evict([cache_key])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+        cached, token = CachedTokenAuthentication().authenticate_credentials(
+            self.token)
+        self.assertEqual(cached, user)
+        self.assertIn('password', cached.get_deferred_fields())
+        # the other fields are read when used
+        with self.assertNumQueries(1):
+            self.assertEqual(cached.date_joined, user.date_joined)
+
+    def test_last_login_keeps_the_tokens(self):
+        """Test that saving fields authentication does not read, such
+        as the last login, neither queries nor evicts the tokens."""
+        self.get()
+        user = User.objects.get(username='bon')
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                update_last_login(None, user)
+        self.assertIsNotNone(cache.get(token_key(self.token)))
+        user.is_staff = True
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['is_staff'])
+        self.assertIsNone(cache.get(token_key(self.token)))
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vendor_management.settings')
+# serve the read-heavy endpoints with the async views of the apps
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
@@ -0,0 +1,193 @@
+'''
+This module serves the read-heavy API endpoints with coroutines
+
+Under ASGI a sync view runs in the thread pool of sync_to_async and holds
+a thread for the whole request, cache and database round trips included.
+The GET requests of the vendor and purchase order details, of the
+listings and of the performance metrics are served by the coroutines of
+vendors/async_views.py and purchase/async_views.py instead: they read the
+cache with vendor_management.async_cache, the database with the async
+ORM, and render the JSON themselves, with the response contract of the
+sync views. The other methods, the browsable API and the queries the
+coroutines do not cover are handed to the sync views.
+
+settings.ASYNC_VIEWS routes the endpoints to the coroutines; asgi.py
+turns it on, and the WSGI server keeps the sync views.
+'''
+import functools
+from asgiref.sync import sync_to_async
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from users.authentication import CachedTokenAuthentication
+from .cache import version_key
+from .async_cache import aget
+from .conditional import conditional_content, request_etags, version_headers
+from .renderers import dumps
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    '''
+    Returns:
+        HttpResponse: The data rendered as FastJSONRenderer does.
+    '''
+    return HttpResponse(
+        dumps(data), status=status_code, headers=headers,
+        content_type='application/json')
+
+
+def not_modified_response(headers):
+    '''
+    Returns:
+        HttpResponse: A 304 response without a body, as DRF sends it.
+    '''
+    response = HttpResponse(
+        status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    del response['Content-Type']
+    return response
+
+
+async def anot_modified(request, key):
+    '''
+    Coroutine version of conditional.not_modified.
+
+    Returns:
+        HttpResponse: A 304 response, or None if the request is not
+            conditional or the version changed or is unknown.
+    '''
+    etags = request_etags(request)
+    if etags is None:
+        return None
+    headers = version_headers(etags, key, await aget(version_key(key)))
+    if headers is None:
+        return None
+    return not_modified_response(headers)
+
+
+def cached_response(request, payload):
+    '''
+    Respond with a payload of the cache, see
+        conditional.conditional_content.
+
+    Returns:
+        HttpResponse: The response writing the content as it is,
+            or a 304 response.
+    '''
+    headers, content, content_encoding = conditional_content(
+        request, payload)
+    if content is None:
+        return not_modified_response(headers)
+    return HttpResponse(
+        content, headers=headers, content_type='application/json')
+
+
+def error_response(error):
+    '''
+    Render an error as DRF's exception handler does.
+
+    Parameters:
+        error (APIException): The error.
+
+    Returns:
+        HttpResponse: The response of the error.
+    '''
+    headers = {}
+    if isinstance(error, (
+            exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers['WWW-Authenticate'] = CachedTokenAuthentication.keyword
+    if isinstance(error.detail, (list, dict)):
+        data = error.detail
+    else:
+        data = {'detail': error.detail}
+    return json_response(data, error.status_code, headers)
+
+
+def renders_json(request):
+    '''
+    Returns:
+        bool: True if DRF would render the response of the request as
+            JSON, rather than with the browsable API.
+    '''
+    renderers = [
+        renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+    try:
+        renderer, media_type = DefaultContentNegotiation().select_renderer(
+            request, renderers)
+    except (exceptions.NotAcceptable, Http404):
+        # let the sync view answer
+        return False
+    return isinstance(renderer, JSONRenderer)
+
+
+def allowed_methods(sync_view):
+    '''
+    Returns:
+        str: The Allow header of the responses of an @api_view view.
+    '''
+    view = sync_view.cls()
+    if hasattr(view, 'get') and not hasattr(view, 'head'):
+        view.head = view.get
+    return ', '.join(view.allowed_methods)
+
+
+def async_get(sync_view, delegate_if=None):
+    '''
+    Serve the GET requests of an @api_view view with a coroutine.
+
+    The coroutine is given the request wrapped in DRF's Request, its
+        user authenticated with CachedTokenAuthentication, and returns
+        an HttpResponse. APIException and Http404 are rendered as DRF
+        does. The other methods, the requests for the browsable API and
+        those matching `delegate_if` are handed to the sync view.
+
+    Parameters:
+        sync_view: The @api_view view.
+        delegate_if (callable): Tells from the request whether the sync
+            view serves it.
+
+    Returns:
+        The decorator of the coroutine.
+    '''
+    delegate = sync_to_async(sync_view)
+    authentication = CachedTokenAuthentication()
+
+    def decorator(handler):
+        allow = None
+
+        @functools.wraps(handler)
+        async def view(request, *args, **kwargs):
+            nonlocal allow
+            drf_request = Request(request)
+            if (request.method not in ('GET', 'HEAD') or
+                    not renders_json(drf_request) or
+                    (delegate_if is not None and delegate_if(drf_request))):
+                return await delegate(request, *args, **kwargs)
+            if allow is None:
+                allow = allowed_methods(sync_view)
+            try:
+                authenticated = await authentication.aauthenticate(
+                    drf_request)
+                if authenticated is None:
+                    raise exceptions.NotAuthenticated()
+                drf_request.user, drf_request.auth = authenticated
+                try:
+                    response = await handler(drf_request, *args, **kwargs)
+                except Http404:
+                    raise exceptions.NotFound()
+                except PermissionDenied:
+                    raise exceptions.PermissionDenied()
+            except exceptions.APIException as error:
+                response = error_response(error)
+            response['Allow'] = allow
+            patch_vary_headers(response, ['Accept'])
+            return response
+
+        # as @api_view, tokens are not subject to CSRF checks
+        view.csrf_exempt = True
+        return view
+    return decorator
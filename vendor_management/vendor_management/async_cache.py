@@ -0,0 +1,162 @@
+'''
+This module reads and writes the cache from coroutines
+
+Django's async cache methods run the sync client in a thread. When the
+default cache is django-redis, the coroutines here talk to Redis with
+redis.asyncio instead, with the keys and the encoding of django-redis so
+that the sync and the async clients share the entries. Its connections
+are made from the same CACHES entry, OPTIONS included. Other caches, such
+as the local memory cache of the tests, are used through Django's async
+methods.
+'''
+import asyncio
+import weakref
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+try:
+    import redis.asyncio as aioredis
+    from django_redis.client import DefaultClient
+    from django_redis.pool import get_connection_factory
+except ImportError:
+    aioredis = DefaultClient = get_connection_factory = None
+
+# event loop -> its redis.asyncio client, a connection being bound to
+# the loop which opened it
+_clients = weakref.WeakKeyDictionary()
+
+
+def redis_client():
+    '''
+    Build a redis.asyncio client of the primary server of the default
+        cache, the one django-redis writes to, connected as django-redis
+        connects: with the PASSWORD, SOCKET_TIMEOUT and
+        SOCKET_CONNECT_TIMEOUT of its OPTIONS, their
+        CONNECTION_POOL_KWARGS (max_connections, the ssl_ options of a
+        rediss:// LOCATION...) and their REDIS_CLIENT_KWARGS.
+
+    Returns:
+        Redis: The client, connecting on its first command.
+    '''
+    config = settings.CACHES[DEFAULT_CACHE_ALIAS]
+    options = config.get('OPTIONS', {})
+    location = config['LOCATION']
+    if isinstance(location, str):
+        location = location.split(',')
+    params = get_connection_factory(
+        options=options).make_connection_params(location[0])
+    # the parser of the sync connections
+    params.pop('parser_class', None)
+    pool = aioredis.ConnectionPool.from_url(
+        **params, **options.get('CONNECTION_POOL_KWARGS', {}))
+    return aioredis.Redis(
+        connection_pool=pool, **options.get('REDIS_CLIENT_KWARGS', {}))
+
+
+def native_client():
+    '''
+    Returns:
+        tuple: The django-redis client of the default cache, which makes
+            the keys and encodes the values, and the redis.asyncio client
+            of the running loop; None if the cache is not django-redis.
+    '''
+    if DefaultClient is None:
+        return None
+    client = getattr(cache, 'client', None)
+    # the sharded and herd clients lay their keys out differently
+    if type(client) is not DefaultClient:
+        return None
+    loop = asyncio.get_running_loop()
+    redis = _clients.get(loop)
+    if redis is None:
+        redis = _clients[loop] = redis_client()
+    return client, redis
+
+
+def milliseconds(timeout):
+    '''
+    Returns:
+        int: The expiry in milliseconds, None for no expiry.
+    '''
+    if timeout is DEFAULT_TIMEOUT:
+        timeout = cache.default_timeout
+    return None if timeout is None else int(timeout * 1000)
+
+
+async def aget(key):
+    '''
+    Returns:
+        The cached value of a key, or None.
+    '''
+    native = native_client()
+    if native is None:
+        return await cache.aget(key)
+    client, redis = native
+    value = await redis.get(client.make_key(key))
+    return None if value is None else client.decode(value)
+
+
+async def aset(key, value, timeout=DEFAULT_TIMEOUT, nx=False):
+    '''
+    Cache a value, only if the key is not cached with `nx`.
+
+    Returns:
+        bool: True if the value was cached.
+    '''
+    native = native_client()
+    if native is None:
+        if nx:
+            return await cache.aadd(key, value, timeout)
+        await cache.aset(key, value, timeout)
+        return True
+    client, redis = native
+    px = milliseconds(timeout)
+    if px is not None and px <= 0:
+        # as django-redis, a value which expired already is not cached
+        if nx:
+            return not await redis.exists(client.make_key(key))
+        await redis.delete(client.make_key(key))
+        return False
+    return bool(await redis.set(
+        client.make_key(key), client.encode(value), px=px, nx=nx))
+
+
+async def aadd(key, value, timeout=DEFAULT_TIMEOUT):
+    '''
+    Returns:
+        bool: True if the value was cached, False if the key was already.
+    '''
+    return await aset(key, value, timeout, nx=True)
+
+
+async def aset_many(values, timeout=DEFAULT_TIMEOUT):
+    '''
+    Cache several values in a single round trip.
+
+    Parameters:
+        values (dict): The values by key.
+        timeout (int): Seconds the values stay cached.
+    '''
+    native = native_client()
+    if native is None:
+        await cache.aset_many(values, timeout)
+        return
+    client, redis = native
+    px = milliseconds(timeout)
+    async with redis.pipeline(transaction=False) as pipeline:
+        for key, value in values.items():
+            pipeline.set(client.make_key(key), client.encode(value), px=px)
+        await pipeline.execute()
+
+
+async def adelete(key):
+    '''
+    Evict a key.
+    '''
+    native = native_client()
+    if native is None:
+        await cache.adelete(key)
+        return
+    client, redis = native
+    await redis.delete(client.make_key(key))
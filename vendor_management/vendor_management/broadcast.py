@@ -0,0 +1,188 @@
+'''
+This module fans events out to the streams open in the process
+
+Code running in any thread publishes an event on a channel, and every
+subscriber of the channel, an asyncio queue read by a stream served
+through ASGI, receives it. BROADCAST_BACKEND picks how events travel:
+'local' delivers them to the subscribers of the publishing process only,
+'redis' publishes them with Redis pub/sub at BROADCAST_REDIS_URL, and
+each process listening relays them to its own subscribers, so that a
+stream sees the events of every worker.
+'''
+import asyncio
+import json
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    '''
+    The events of a channel received by one stream.
+
+    Attributes:
+        queue (asyncio.Queue): The events not read yet; when the stream
+            falls behind by BROADCAST_QUEUE_SIZE events the oldest ones
+            are dropped.
+    '''
+
+    def __init__(self, broadcaster, channel):
+        self.broadcaster = broadcaster
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(settings.BROADCAST_QUEUE_SIZE)
+
+    def offer(self, event):
+        # runs in the event loop of the subscriber
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class LocalBroadcaster:
+    '''
+    Broadcaster delivering the events to the subscribers of the process.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, channel):
+        '''
+        Start receiving the events of a channel, from a coroutine.
+
+        Returns:
+            Subscription: The subscription, to close when done.
+        '''
+        subscription = Subscription(self, channel)
+        with self.lock:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscriptions.pop(subscription.channel, None)
+
+    def deliver(self, channel, event):
+        '''
+        Hand an event to the subscribers of the process, from any thread.
+        '''
+        with self.lock:
+            subscribers = list(self.subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.offer, event)
+            except RuntimeError:
+                # the event loop of the subscriber is closed
+                self.unsubscribe(subscription)
+
+    def publish(self, channel, event):
+        '''
+        Publish an event to the subscribers of a channel.
+
+        Parameters:
+            channel (str): The channel.
+            event (dict): The event, encodable as JSON.
+        '''
+        self.deliver(channel, event)
+
+
+class RedisBroadcaster(LocalBroadcaster):
+    '''
+    Broadcaster publishing the events with Redis pub/sub.
+
+    A single connection per process, opened by the first subscriber,
+        listens to the channels and relays their events.
+    '''
+
+    def __init__(self, url):
+        super().__init__()
+        import redis
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.listener = None
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        if self.listener is None or self.listener.done():
+            self.listener = subscription.loop.create_task(self.listen())
+        return subscription
+
+    async def listen(self):
+        '''
+        Relay the events of Redis to the subscribers of the process,
+            reconnecting when the connection is lost.
+        '''
+        import redis.asyncio
+        prefix = len(settings.BROADCAST_CHANNEL_PREFIX)
+        while True:
+            client = redis.asyncio.Redis.from_url(self.url)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(
+                    f'{settings.BROADCAST_CHANNEL_PREFIX}*')
+                async for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    self.deliver(
+                        message['channel'].decode()[prefix:],
+                        json.loads(message['data']))
+            except Exception:
+                logger.exception('Lost the Redis broadcast connection')
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+                await client.close()
+
+    def publish(self, channel, event):
+        self.client.publish(
+            f'{settings.BROADCAST_CHANNEL_PREFIX}{channel}',
+            json.dumps(event))
+
+
+_broadcaster = None
+_lock = threading.Lock()
+
+
+def get_broadcaster():
+    '''
+    Returns:
+        LocalBroadcaster: The broadcaster of the process, of the type
+            set by BROADCAST_BACKEND.
+    '''
+    global _broadcaster
+    with _lock:
+        if _broadcaster is None:
+            if settings.BROADCAST_BACKEND == 'redis':
+                _broadcaster = RedisBroadcaster(settings.BROADCAST_REDIS_URL)
+            else:
+                _broadcaster = LocalBroadcaster()
+        return _broadcaster
+
+
+def publish(channel, event):
+    '''
+    Publish an event, failures are logged rather than raised so that
+        the change that caused the event is not affected.
+
+    Parameters:
+        channel (str): The channel.
+        event (dict): The event, encodable as JSON.
+    '''
+    try:
+        get_broadcaster().publish(channel, event)
+    except Exception:
+        logger.exception('Could not publish an event on %s', channel)
@@ -0,0 +1,311 @@
+'''
+This module defines the cache keys of the vendor and purchase order
+endpoints and keeps the cached entries in step with the database
+'''
+import asyncio
+import gzip
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from vendor_management import async_cache, prometheus
+from vendor_management.renderers import dumps
+
+# cached in place of rows that do not exist
+MISSING = '__missing__'
+# seconds a missing row stays cached
+NEGATIVE_TIMEOUT = 30
+# keys whose changes are tracked by a version, to build their ETags
+VERSIONED_PREFIXES = ('Vendor_', 'PO_', 'Performance_')
+# seconds a version is kept after the key last changed or was loaded
+VERSION_TIMEOUT = 60 * 60 * 24
+# seconds after which the lock of a request loading a key is released
+LOCK_TIMEOUT = 10
+# seconds a request waits for another request to load a key
+LOCK_WAIT = 2
+LOCK_POLL_INTERVAL = 0.05
+# format of the payloads `rendered` returns, part of the keys caching them
+# so that the entries cached in another format by an earlier release are
+# never read; bump it whenever the payload changes
+PAYLOAD_FORMAT = 2
+
+
+def payload_key(key):
+    '''
+    Returns:
+        str: The cache key of a rendered payload, in PAYLOAD_FORMAT.
+    '''
+    return f'{key}:format{PAYLOAD_FORMAT}'
+
+
+def vendor_key(vendor_id):
+    '''
+    Returns:
+        str: The cache key of the details of a vendor.
+    '''
+    return payload_key(f'Vendor_{vendor_id}')
+
+
+def purchase_order_key(purchase_order_id):
+    '''
+    Returns:
+        str: The cache key of the details of a purchase order.
+    '''
+    return payload_key(f'PO_{purchase_order_id}')
+
+
+def invalidate(keys):
+    '''
+    Evict cached entries whose data changed.
+
+    The keys are deleted straight away and, inside a transaction, again
+        once it commits, so that a request reading the old rows before
+        the commit cannot put a stale entry back in the cache. The
+        versions of the keys are bumped at the same times.
+
+    Parameters:
+        keys (iterable): The cache keys to evict.
+    '''
+    keys = list(keys)
+    if not keys:
+        return
+
+    def evict():
+        cache.delete_many(keys)
+        bump_versions(keys)
+    evict()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(evict)
+
+
+def performance_key(vendor_id):
+    '''
+    Returns:
+        str: The cache key of the performance metrics of a vendor.
+    '''
+    return payload_key(f'Performance_{vendor_id}')
+
+
+def get_or_load(key, loader, timeout):
+    '''
+    Return the cached value of a key, loading and caching it on a miss.
+
+    Rows that do not exist are cached too, for NEGATIVE_TIMEOUT seconds,
+        so repeated requests for a missing id do not reach the database.
+    Only one request loads an expired key: the others wait up to
+        LOCK_WAIT seconds for the value to be cached before loading it
+        themselves, so a hot entry expiring does not send a burst of
+        identical queries to the database.
+
+    Parameters:
+        key (str): The cache key.
+        loader (callable): Returns the value to cache,
+            or None when the row does not exist.
+        timeout (int): Seconds the loaded value stays cached.
+
+    Returns:
+        The cached or loaded value, or None when the row does not exist.
+    '''
+    value = cache.get(key)
+    prometheus.inc(
+        'cache_requests_total', prefix=key.split('_', 1)[0],
+        result='miss' if value is None else 'hit')
+    if value is not None:
+        return None if value == MISSING else value
+
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if not locked:
+        # another request is loading the value, wait for it
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return None if value == MISSING else value
+    try:
+        value = loader()
+        if value is None:
+            cache.set(key, MISSING, NEGATIVE_TIMEOUT)
+        else:
+            cache.set(key, value, timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+async def aget_or_load(key, loader, timeout):
+    '''
+    Coroutine version of get_or_load, for the async views.
+
+    Parameters:
+        key (str): The cache key.
+        loader (coroutine function): Returns the value to cache,
+            or None when the row does not exist.
+        timeout (int): Seconds the loaded value stays cached.
+
+    Returns:
+        The cached or loaded value, or None when the row does not exist.
+    '''
+    value = await async_cache.aget(key)
+    prometheus.inc(
+        'cache_requests_total', prefix=key.split('_', 1)[0],
+        result='miss' if value is None else 'hit')
+    if value is not None:
+        return None if value == MISSING else value
+
+    lock_key = f'{key}:lock'
+    locked = await async_cache.aadd(lock_key, 1, LOCK_TIMEOUT)
+    if not locked:
+        # another request is loading the value, wait for it
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            value = await async_cache.aget(key)
+            if value is not None:
+                return None if value == MISSING else value
+    try:
+        value = await loader()
+        if value is None:
+            await async_cache.aset(key, MISSING, NEGATIVE_TIMEOUT)
+        else:
+            await async_cache.aset(key, value, timeout)
+        return value
+    finally:
+        if locked:
+            await async_cache.adelete(lock_key)
+
+
+def version_key(key):
+    '''
+    Returns:
+        str: The cache key of the version of a cached entry.
+    '''
+    return f'Version_{key}'
+
+
+def version_etag(key, version):
+    '''
+    Returns:
+        str: The strong ETag of a version of a cached entry.
+    '''
+    return f'"{key}-{version}"'
+
+
+def bump_versions(keys):
+    '''
+    Give new versions to the cached entries whose data changed.
+
+    A version is the time in nanoseconds it was bumped at, so it is
+        never given twice to a key, even once an older version was
+        evicted, and all the keys are bumped with a single cache call.
+
+    Parameters:
+        keys (list): The cache keys, those which are not versioned
+            are skipped.
+    '''
+    version = time.time_ns()
+    versions = {
+        version_key(key): version for key in keys
+        if key.startswith(VERSIONED_PREFIXES)}
+    if versions:
+        cache.set_many(versions, VERSION_TIMEOUT)
+
+
+def current_version(key):
+    '''
+    Returns:
+        int: The version of a cached entry, a new one if it has none.
+    '''
+    versioned = version_key(key)
+    version = cache.get(versioned)
+    if version is None:
+        cache.add(versioned, time.time_ns(), VERSION_TIMEOUT)
+        version = cache.get(versioned)
+    return version
+
+
+async def acurrent_version(key):
+    '''
+    Coroutine version of current_version.
+    '''
+    versioned = version_key(key)
+    version = await async_cache.aget(versioned)
+    if version is None:
+        await async_cache.aadd(versioned, time.time_ns(), VERSION_TIMEOUT)
+        version = await async_cache.aget(versioned)
+    return version
+
+
+def rendered(data, etag=None, last_modified=None):
+    '''
+    Render data for the cache, so that a hit is written out without
+        being decoded and encoded again.
+
+    Parameters:
+        data: The data of the response.
+        etag (str): The ETag of the data, a hash of the document
+            when None.
+        last_modified (datetime): When the data last changed, if known.
+
+    Returns:
+        tuple: The ETag, the content encoding ('gzip' or None), the
+            JSON document, compressed when it is CACHE_COMPRESS_MIN_BYTES
+            long or longer, and the last modification time.
+    '''
+    content = dumps(data)
+    if etag is None:
+        etag = f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+    threshold = settings.CACHE_COMPRESS_MIN_BYTES
+    if threshold is not None and len(content) >= threshold:
+        return (
+            etag, 'gzip', gzip.compress(content, mtime=0), last_modified)
+    return etag, None, content, last_modified
+
+
+def count_key(model):
+    '''
+    Returns:
+        str: The cache key of the number of rows of a model.
+    '''
+    return f'Count_{model._meta.label}'
+
+
+def history_key(vendor_id):
+    '''
+    Returns:
+        str: The cache key of the metrics of the last historical
+            performance record of a vendor.
+    '''
+    return f'History_{vendor_id}'
+
+
+def token_key(key):
+    '''
+    Returns:
+        str: The cache key of the user of an authentication token, the
+            token itself hashed so it is not readable from the cache.
+    '''
+    return f'TokenAuth_{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def store(key, value, timeout):
+    '''
+    Cache a value read or written by the current transaction.
+
+    Outside a transaction the value is cached straight away. Inside one
+        the key is evicted and the value is only cached once the
+        transaction commits, so a rollback cannot leave it in the cache.
+
+    Parameters:
+        key (str): The cache key.
+        value: The value to cache.
+        timeout (int): Seconds the value stays cached.
+    '''
+    if transaction.get_connection().in_atomic_block:
+        cache.delete(key)
+        transaction.on_commit(lambda: cache.set(key, value, timeout))
+    else:
+        cache.set(key, value, timeout)
@@ -0,0 +1,189 @@
+'''
+This module answers the conditional requests of the detail endpoints
+
+The cached details carry a strong ETag built from the version of their
+cache key, which invalidate() bumps whenever the row changes, so a
+request whose If-None-Match holds the current ETag gets a 304 after a
+single cache read: the details are neither loaded nor serialized and the
+database is not queried. If-Modified-Since is answered from the
+Last-Modified date of the cached details.
+'''
+import gzip
+import re
+from django.core.cache import cache
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from .cache import version_etag, version_key
+from .renderers import PreEncoded
+
+accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def gzip_etag(etag):
+    '''
+    Returns:
+        str: The ETag of the gzip-compressed content, a strong ETag being
+            specific to the encoding of the content.
+    '''
+    return f'{etag[:-1]}-gzip"'
+
+
+def request_etags(request):
+    '''
+    Returns:
+        set: The ETags of If-None-Match, weak ones compared as strong
+            ones as RFC 9110 asks, or None without the header.
+    '''
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return None
+    return {etag.removeprefix('W/') for etag in parse_etags(header)}
+
+
+def not_modified_headers(etag, last_modified=None, vary=False):
+    '''
+    Returns:
+        dict: The headers of a 304 response.
+    '''
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+    if vary:
+        headers['Vary'] = 'Accept-Encoding'
+    return headers
+
+
+def not_modified_response(etag, last_modified=None, vary=False):
+    '''
+    Returns:
+        Response: A 304 response without a body.
+    '''
+    return Response(
+        status=status.HTTP_304_NOT_MODIFIED,
+        headers=not_modified_headers(etag, last_modified, vary))
+
+
+def version_headers(etags, key, version):
+    '''
+    Compare the ETags of If-None-Match to the version of a cached entry.
+
+    Parameters:
+        etags (set): The ETags of If-None-Match.
+        key (str): The cache key of the details.
+        version (int): The current version of the key, None if unknown.
+
+    Returns:
+        dict: The headers of a 304 response, or None if the version
+            is unknown or not among the ETags.
+    '''
+    if version is None:
+        return None
+    etag = version_etag(key, version)
+    if etag in etags or '*' in etags:
+        return not_modified_headers(etag)
+    if gzip_etag(etag) in etags:
+        return not_modified_headers(gzip_etag(etag), vary=True)
+    return None
+
+
+def not_modified(request, key):
+    '''
+    Answer a request whose If-None-Match holds the current version of
+        a cached entry, reading the version only.
+
+    Parameters:
+        request: The HTTP request object.
+        key (str): The cache key of the details.
+
+    Returns:
+        Response: A 304 response, or None if the request is not
+            conditional or the version changed or is unknown.
+    '''
+    etags = request_etags(request)
+    if etags is None:
+        return None
+    headers = version_headers(etags, key, cache.get(version_key(key)))
+    if headers is None:
+        return None
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def conditional_content(request, payload, as_is=True):
+    '''
+    Select what to send of a payload of the cache, see cache.rendered.
+
+    A compressed payload is sent compressed to the clients accepting
+        gzip, and decompressed for the others. Nothing is sent when the
+        client holds the payload, by its ETag or, without If-None-Match,
+        by its Last-Modified date.
+
+    Parameters:
+        request: The HTTP request object.
+        payload (tuple): The ETag, the content encoding, the content and
+            the last modification time.
+        as_is (bool): False when the content is not written out as it
+            is but read by another renderer, such as the browsable API,
+            in which case it is always decompressed.
+
+    Returns:
+        tuple: The headers, the content, None for a 304, and its
+            encoding, 'gzip' if it is sent compressed.
+    '''
+    etag, content_encoding, content, last_modified = payload
+    compressed = False
+    if content_encoding == 'gzip':
+        if as_is and accepts_gzip.search(
+                request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            etag = gzip_etag(etag)
+            compressed = True
+        else:
+            content = gzip.decompress(content)
+
+    etags = request_etags(request)
+    if etags is not None:
+        if etag in etags or '*' in etags:
+            return not_modified_headers(
+                etag, last_modified, content_encoding is not None), None, None
+    elif last_modified is not None:
+        since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if since is not None and int(last_modified.timestamp()) <= since:
+            return not_modified_headers(
+                etag, last_modified, content_encoding is not None), None, None
+
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+    if content_encoding is not None:
+        headers['Vary'] = 'Accept-Encoding'
+    if compressed:
+        headers['Content-Encoding'] = 'gzip'
+        return headers, content, 'gzip'
+    return headers, content, None
+
+
+def cached_response(request, payload):
+    '''
+    Respond with a payload of the cache, see conditional_content.
+
+    Parameters:
+        request: The HTTP request object.
+        payload (tuple): The payload, see cache.rendered.
+
+    Only the JSON renderer writes the content as it is, the stored gzip
+        bytes are decompressed for the others.
+
+    Returns:
+        Response: The response writing the content as it is,
+            or a 304 response.
+    '''
+    headers, content, content_encoding = conditional_content(
+        request, payload,
+        isinstance(getattr(request, 'accepted_renderer', None),
+                   JSONRenderer))
+    if content is None:
+        return Response(
+            status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(PreEncoded(content, content_encoding), headers=headers)
@@ -0,0 +1,211 @@
+'''
+This module encodes database rows for the export and the list endpoints
+without going through DRF serializers
+
+Rows come from `values_list()` as tuples and are written one line at a
+time, so an export of any size is streamed with constant memory.
+Pages of the list endpoints come from `values()` and only the fields
+which the serializer would change, the datetimes, are converted.
+Values are formatted the way the serializers of the API format them.
+'''
+import csv
+import datetime
+import json
+from functools import lru_cache
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+# content type of each export format
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def format_value(value):
+    '''
+    Format a value like the DRF fields do.
+
+    Parameters:
+        value: A value read from the database.
+
+    Returns:
+        The value ready to be encoded, datetimes as ISO 8601 strings
+            in the current time zone.
+    '''
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+    return value
+
+
+# serializer fields whose representation is the value read from the database
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField, serializers.CharField, serializers.ChoiceField,
+    serializers.FloatField, serializers.IntegerField, serializers.JSONField,
+    serializers.PrimaryKeyRelatedField)
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class):
+    '''
+    Work out once how to encode the rows of a serializer.
+
+    Parameters:
+        serializer_class: A ModelSerializer whose fields are read
+            from the model fields of the same name.
+
+    Returns:
+        tuple: The names of the fields in the order of the serializer,
+            and the names of the fields to convert with format_value.
+
+    Raises:
+        ValueError: If a field cannot be encoded without the serializer.
+    '''
+    names, converted = [], []
+    for name, field in serializer_class().fields.items():
+        if field.write_only:
+            continue
+        if field.source != name:
+            raise ValueError(f'{name} is not read from a field of its name')
+        if isinstance(field, serializers.DateTimeField):
+            output_format = getattr(
+                field, 'format', api_settings.DATETIME_FORMAT)
+            if str(output_format).lower() != 'iso-8601':
+                raise ValueError(f'{name} is not formatted as ISO 8601')
+            converted.append(name)
+        elif not isinstance(field, PASSTHROUGH_FIELDS):
+            raise ValueError(
+                f'{name} is a {type(field).__name__}, which is not supported')
+        names.append(name)
+    return tuple(names), tuple(converted)
+
+
+def serializer_fields(serializer_class):
+    '''
+    Returns:
+        tuple: The fields to read with `values()` for encode_values.
+    '''
+    return compile_serializer(serializer_class)[0]
+
+
+def encode_values(serializer_class, rows):
+    '''
+    Encode rows as the serializer would, without building model
+        instances or running the fields of the serializer.
+
+    Parameters:
+        serializer_class: The serializer the output must match.
+        rows (iterable): The rows as dicts, from
+            `values(*serializer_fields(serializer_class))`.
+
+    Returns:
+        list: The rows ready to be rendered.
+    '''
+    converted = compile_serializer(serializer_class)[1]
+    # looked up once per page rather than once per value
+    current_timezone = timezone.get_current_timezone()
+    data = []
+    for row in rows:
+        for name in converted:
+            value = row[name]
+            if value is None:
+                continue
+            if value.tzinfo is None:
+                row[name] = format_value(value)
+                continue
+            value = value.astimezone(current_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            row[name] = value
+        data.append(row)
+    return data
+
+
+def ndjson_line(fields, row):
+    '''
+    Returns:
+        str: The row as a JSON object on its own line.
+    '''
+    data = {
+        field: format_value(value) for field, value in zip(fields, row)}
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class _Line:
+    '''
+    A file-like object handing back the line the csv writer wrote.
+    '''
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    '''
+    Encode rows as CSV, starting with a header line.
+
+    Parameters:
+        fields (list): The names of the columns.
+        rows (iterable): The rows as tuples.
+
+    Yields:
+        str: One line per row.
+    '''
+    writer = csv.writer(_Line())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([
+            json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+            if isinstance(value, (dict, list)) else format_value(value)
+            for value in row])
+
+
+def encode_rows(export_format, fields, rows):
+    '''
+    Encode rows in an export format.
+
+    Parameters:
+        export_format (str): 'ndjson' or 'csv'.
+        fields (list): The names of the columns.
+        rows (iterable): The rows as tuples, read lazily.
+
+    Yields:
+        str: The encoded lines.
+
+    Raises:
+        ValueError: If the format is not supported.
+    '''
+    if export_format == 'ndjson':
+        return (ndjson_line(fields, row) for row in rows)
+    if export_format == 'csv':
+        return csv_lines(fields, rows)
+    raise ValueError(f'Unsupported export format {export_format}')
+
+
+def export_response(export_format, fields, rows, filename):
+    '''
+    Stream rows as a file download.
+
+    Parameters:
+        export_format (str): 'ndjson' or 'csv'.
+        fields (list): The names of the columns.
+        rows (iterable): The rows as tuples, read lazily.
+        filename (str): The name of the file without its extension.
+
+    Returns:
+        StreamingHttpResponse: The response encoding the rows while
+            they are sent.
+    '''
+    response = StreamingHttpResponse(
+        encode_rows(export_format, fields, rows),
+        content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}.{export_format}"')
+    return response
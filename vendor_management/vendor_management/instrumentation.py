@@ -0,0 +1,245 @@
+'''
+This module times the parts of every request: SQL queries, cache calls
+and model signal handlers
+
+It is enabled with the REQUEST_TIMING setting. When it is disabled the
+middleware removes itself from the chain at startup and nothing is
+wrapped, so requests pay nothing for it.
+
+The middleware serves the sync and the async requests. The timings of a
+request live in a context variable, which the ORM calls an async view
+runs in a thread see as well: the queries are timed by a wrapper every
+connection gets when it is opened, whichever thread opens it.
+'''
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import signals
+
+logger = logging.getLogger('vendor_management.requests')
+
+# cache methods that are timed
+CACHE_METHODS = (
+    'get', 'set', 'add', 'delete', 'get_many', 'set_many', 'delete_many',
+    'incr', 'decr', 'touch', 'has_key')
+# model signals whose handlers are timed
+TIMED_SIGNALS = (
+    signals.pre_save, signals.post_save, signals.pre_delete,
+    signals.post_delete)
+
+# timings of the request being served, None outside of a request
+current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    '''
+    Time spent and number of calls per part of a request.
+
+    Attributes:
+        parts (dict): [calls, seconds] for db, cache and signals.
+        queries (list): The SQL and the seconds of each query, when the
+            request is sampled for a slow request dump, otherwise None.
+    '''
+
+    def __init__(self, capture_sql):
+        self.parts = {'db': [0, 0.0], 'cache': [0, 0.0], 'signals': [0, 0.0]}
+        self.queries = [] if capture_sql else None
+        # nesting of the timed calls in progress, per part
+        self.depth = {'cache': 0, 'signals': 0}
+
+    def add(self, part, seconds):
+        entry = self.parts[part]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def execute(self, execute, sql, params, many, context):
+        '''
+        Execute wrapper timing a database query.
+        '''
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.add('db', elapsed)
+            if self.queries is not None:
+                self.queries.append(
+                    {'sql': sql, 'ms': round(elapsed * 1000, 3)})
+
+    def server_timing(self, total):
+        '''
+        Returns:
+            str: The value of the Server-Timing header.
+        '''
+        metrics = [
+            f'{part};dur={seconds * 1000:.2f};desc="{calls} calls"'
+            for part, (calls, seconds) in self.parts.items()]
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(metrics)
+
+
+def timed(part, function):
+    '''
+    Wrap a function so its calls are timed as a part of the request
+        being served, counting nested calls once.
+
+    Parameters:
+        part (str): 'cache' or 'signals'.
+        function (callable): The function to wrap.
+
+    Returns:
+        callable: The wrapped function.
+    '''
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        timings = current.get()
+        if timings is None or timings.depth[part]:
+            return function(*args, **kwargs)
+        timings.depth[part] += 1
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings.depth[part] -= 1
+            timings.add(part, time.perf_counter() - started)
+    wrapper.timed = True
+    return wrapper
+
+
+def execute_timed(execute, sql, params, many, context):
+    '''
+    Execute wrapper timing the queries of the request being served.
+    '''
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.execute(execute, sql, params, many, context)
+
+
+def wrap_connection(connection, **kwargs):
+    '''
+    Time the queries of a connection, once. The wrapper goes first so
+        that the wrappers pushed and popped around it by execute_wrapper
+        are left in place.
+    '''
+    if execute_timed not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_timed)
+
+
+def instrument():
+    '''
+    Wrap the database connections, the cache backends and the model
+        signals, once.
+    '''
+    connection_created.connect(
+        wrap_connection, dispatch_uid='request_timing')
+    for connection in connections.all():
+        wrap_connection(connection)
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        for name in CACHE_METHODS:
+            method = getattr(backend, name)
+            if not getattr(method, 'timed', False):
+                setattr(backend, name, timed('cache', method))
+    for signal in TIMED_SIGNALS:
+        if not getattr(signal.send, 'timed', False):
+            signal.send = timed('signals', signal.send)
+
+
+class RequestTimingMiddleware:
+    '''
+    Time the SQL queries, the cache calls and the signal handlers of
+        every request.
+
+    Each response gets a Server-Timing header and a JSON line is logged
+        to the `vendor_management.requests` logger. A share of the
+        requests slower than REQUEST_TIMING_SLOW_MS, set with
+        REQUEST_TIMING_SLOW_SAMPLE_RATE, are logged with their SQL.
+    '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        instrument()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = self.start()
+        token = current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(
+            request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        '''
+        Coroutine version of __call__, for the async middleware chain.
+        '''
+        timings = self.start()
+        token = current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(
+            request, response, timings, time.perf_counter() - started)
+
+    def start(self):
+        '''
+        Returns:
+            RequestTimings: The timings of a new request, capturing its
+                SQL for a share of REQUEST_TIMING_SLOW_SAMPLE_RATE.
+        '''
+        return RequestTimings(
+            random.random() < settings.REQUEST_TIMING_SLOW_SAMPLE_RATE)
+
+    def finish(self, request, response, timings, total):
+        '''
+        Add the Server-Timing header to the response and log the request.
+
+        Parameters:
+            request (HttpRequest): The request served.
+            response (HttpResponse): Its response.
+            timings (RequestTimings): The timings of the request.
+            total (float): The seconds taken to serve it.
+
+        Returns:
+            HttpResponse: The response.
+        '''
+        response['Server-Timing'] = timings.server_timing(total)
+        match = request.resolver_match
+        line = {
+            'method': request.method,
+            'path': request.path,
+            'url_name': match.url_name if match else None,
+            'status': response.status_code,
+            'ms': round(total * 1000, 3),
+        }
+        for part, (calls, seconds) in timings.parts.items():
+            line[f'{part}_calls'] = calls
+            line[f'{part}_ms'] = round(seconds * 1000, 3)
+        logger.info(json.dumps(line))
+        if (timings.queries is not None and
+                total * 1000 >= settings.REQUEST_TIMING_SLOW_MS):
+            logger.warning(json.dumps(dict(line, queries=timings.queries)))
+        return response
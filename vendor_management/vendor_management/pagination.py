@@ -0,0 +1,314 @@
+'''
+This module implements the pagination of the list endpoints
+
+Keyset (cursor) pages are selected with `id > last id of the previous page`
+instead of an OFFSET and no COUNT is run, so every page costs the same
+however deep it is.
+The page numbered listings get their total from `total_count`, which
+avoids a COUNT(*) per request whenever a cheaper accurate source exists.
+'''
+import base64
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from . import async_cache
+from .cache import count_key
+
+DEFAULT_PAGE_SIZE = 10
+
+
+def wants_cursor(request):
+    '''
+    Tell whether a list request asks for keyset pagination, with
+        `cursor=true` for the first page or `after=<token>` for the next.
+
+    Parameters:
+        request: The HTTP request object.
+
+    Returns:
+        bool: True for keyset pagination.
+    '''
+    params = request.query_params
+    return 'after' in params or params.get('cursor') == 'true'
+
+
+def encode_cursor(last_id):
+    '''
+    Returns:
+        str: The opaque token pointing after the row with this id.
+    '''
+    return base64.urlsafe_b64encode(f'id:{last_id}'.encode()).decode()
+
+
+def decode_cursor(token):
+    '''
+    Decode a token made by `encode_cursor`.
+
+    Parameters:
+        token (str): The token, an empty token stands for the first page.
+
+    Returns:
+        int: The id after which the page starts, or None for the first page.
+
+    Raises:
+        ValueError: If the token is not valid.
+    '''
+    if not token:
+        return None
+    try:
+        prefix, last_id = base64.urlsafe_b64decode(
+            token.encode()).decode().split(':')
+    except (ValueError, UnicodeError):
+        raise ValueError(f'Invalid cursor {token}')
+    if prefix != 'id':
+        raise ValueError(f'Invalid cursor {token}')
+    return int(last_id)
+
+
+def page_size_of(request):
+    '''
+    Returns:
+        int: The page size asked for with `page_size`,
+            the default one when it is missing or not a positive integer.
+    '''
+    try:
+        page_size = int(request.query_params.get(
+            'page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return page_size if page_size > 0 else DEFAULT_PAGE_SIZE
+
+
+def cursor_page(request, queryset):
+    '''
+    Select a page of rows ordered by id.
+
+    One more row than the page size is fetched to know whether
+        there is a next page.
+
+    Parameters:
+        request: The HTTP request object, with the optional
+            `after` and `page_size` query parameters.
+        queryset: The rows to paginate, as instances or as dicts
+            from `values()` including the id.
+
+    Returns:
+        tuple: The rows of the page and the pagination information
+            (`next_cursor` is None on the last page).
+
+    Raises:
+        ValueError: If the `after` token is not valid.
+    '''
+    queryset, page_size = cursor_query(request, queryset)
+    return cursor_result(list(queryset), page_size)
+
+
+async def acursor_page(request, queryset):
+    '''
+    Coroutine version of cursor_page.
+    '''
+    queryset, page_size = cursor_query(request, queryset)
+    return cursor_result([row async for row in queryset], page_size)
+
+
+def cursor_query(request, queryset):
+    '''
+    Returns:
+        tuple: The query of a keyset page and its page size.
+    '''
+    after = decode_cursor(request.query_params.get('after'))
+    page_size = page_size_of(request)
+    queryset = queryset.order_by('id')
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    return queryset[:page_size + 1], page_size
+
+
+def cursor_result(rows, page_size):
+    '''
+    Returns:
+        tuple: The rows of a keyset page and its pagination information.
+    '''
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            last['id'] if isinstance(last, dict) else last.id)
+    return rows, {'next_cursor': next_cursor, 'page_size': len(rows)}
+
+
+def wants_exact_count(request):
+    '''
+    Returns:
+        bool: False if the request accepts an estimated total
+            with `exact_count=false`.
+    '''
+    return request.query_params.get('exact_count') != 'false'
+
+
+def estimated_count(model):
+    '''
+    Read the number of rows of a table from the statistics of the
+        database, without scanning it.
+
+    Parameters:
+        model: The model of the table.
+
+    Returns:
+        int: The estimated number of rows, or None if the database
+            keeps no such statistics.
+    '''
+    connection = connections[model.objects.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table])
+        row = cursor.fetchone()
+    # reltuples is negative for a table that was never analyzed
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def total_count(queryset, exact=True, known=None):
+    '''
+    Count the rows of a listing from the cheapest source.
+
+    - A count already known by the caller (such as the order counter
+    of a vendor) is used as is.
+    - A filtered queryset is counted by the database.
+    - An unfiltered queryset is counted once and the count is cached
+    until a row of the table is inserted or deleted.
+    - With `exact` False, the last count of the table is used even when
+    rows changed since, then the statistics of the database.
+
+    Parameters:
+        queryset: The rows of the listing.
+        exact (bool): False to accept an estimate.
+        known (int): The count when the caller already has it.
+
+    Returns:
+        int: The number of rows.
+    '''
+    if known is not None:
+        return known
+    if queryset.query.has_filters():
+        return queryset.count()
+    key = count_key(queryset.model)
+    estimate_key = f'{key}_estimate'
+    count = cache.get(key)
+    if count is None and not exact:
+        count = cache.get(estimate_key)
+        if count is None:
+            count = estimated_count(queryset.model)
+    if count is None:
+        count = queryset.count()
+        cache.set_many(
+            {key: count, estimate_key: count},
+            settings.LIST_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+async def atotal_count(queryset, exact=True, known=None):
+    '''
+    Coroutine version of total_count.
+    '''
+    if known is not None:
+        return known
+    if queryset.query.has_filters():
+        return await queryset.acount()
+    key = count_key(queryset.model)
+    estimate_key = f'{key}_estimate'
+    count = await async_cache.aget(key)
+    if count is None and not exact:
+        count = await async_cache.aget(estimate_key)
+        if count is None:
+            count = await sync_to_async(estimated_count)(queryset.model)
+    if count is None:
+        count = await queryset.acount()
+        await async_cache.aset_many(
+            {key: count, estimate_key: count},
+            settings.LIST_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def numbered_page(request, rows, count):
+    '''
+    Read a page of a page numbered listing: the page asked for with
+        `page`, the last one past the end and the first one when the
+        number is not valid.
+
+    Parameters:
+        request: The HTTP request object, with the optional
+            `page` and `page_size` query parameters.
+        rows: The rows to paginate.
+        count (int): Their number, see total_count.
+
+    Returns:
+        tuple: The rows of the page and the pagination information.
+    '''
+    paginator, page = numbered_query(request, rows, count)
+    return numbered_result(paginator, page, list(page.object_list))
+
+
+async def anumbered_page(request, rows, count):
+    '''
+    Coroutine version of numbered_page.
+    '''
+    paginator, page = numbered_query(request, rows, count)
+    return numbered_result(
+        paginator, page, [row async for row in page.object_list])
+
+
+def numbered_query(request, rows, count):
+    '''
+    Returns:
+        tuple: The paginator of a page numbered listing and the page
+            asked for, whose rows are not read yet.
+    '''
+    paginator = CountedPaginator(rows, page_size_of(request), count)
+    try:
+        page = paginator.get_page(int(request.query_params.get('page', 1)))
+    # if page is empty then return last page
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+    # if page_number is not an integer then assign the first page
+    except Exception:
+        page = paginator.page(1)
+    return paginator, page
+
+
+def numbered_result(paginator, page, object_list):
+    '''
+    Returns:
+        tuple: The rows of a numbered page and its pagination
+            information.
+    '''
+    return object_list, {
+        'next_page': page.next_page_number() if page.has_next() else None,
+        'page': page.number,
+        'page_size': len(object_list),
+        'prev_page':
+            page.previous_page_number() if page.has_previous() else None,
+        'total_pages': paginator.num_pages}
+
+
+class CountedPaginator(Paginator):
+    '''
+    A paginator which takes the number of rows from `total_count`
+        instead of running its own COUNT(*).
+    '''
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        return self._count
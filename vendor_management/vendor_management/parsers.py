@@ -0,0 +1,32 @@
+'''
+This module parses the JSON request bodies with orjson when it is
+installed, and with DRF's JSONParser otherwise
+'''
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from .renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    '''
+    JSONParser decoding with orjson when it is installed.
+
+    orjson rejects NaN and Infinity, as JSONParser does with the default
+        STRICT_JSON setting; with it disabled the body is left to
+        JSONParser.
+    '''
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        content = stream.read()
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                content = content.decode(encoding)
+            return orjson.loads(content)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,435 @@
+'''
+This module collects the metrics of the application and serves them at
+/metrics in the Prometheus text exposition format
+
+Metrics are collected in process when PROMETHEUS_METRICS is enabled.
+With several worker processes (gunicorn), set PROMETHEUS_MULTIPROC_DIR to
+a directory shared by the workers: each worker writes its samples to its
+own file there at most every PROMETHEUS_FLUSH_INTERVAL seconds, and the
+samples of all the files are summed when /metrics is scraped. A worker
+that goes idle writes the samples it holds back once the interval is
+over, and when it exits. The files of workers that exited are merged
+into one archive file when /metrics is scraped, so that counters never
+go backwards while the files do not pile up; a worker reusing the pid of
+one of them before then carries its samples on in the same file. The
+directory lock keeps the two from reading the same file.
+
+/metrics is only served to the addresses of PROMETHEUS_ALLOWED_IPS, or
+with the PROMETHEUS_BEARER_TOKEN in its Authorization header.
+
+The middleware serves the sync and the async requests.
+'''
+import atexit
+import fcntl
+import glob
+import ipaddress
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# the samples of the workers that exited, and the lock of the directory
+ARCHIVE_FILE = 'metrics_archive.json'
+LOCK_FILE = 'metrics.lock'
+# upper bounds in seconds of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help) of every metric, in the order they are exposed
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests served, per URL name, method and status.'),
+    'http_request_duration_seconds': (
+        'histogram', 'Time taken to serve a request, per URL name.'),
+    'update_performance_calls_total': (
+        'counter', 'Calls of the update_performance signal handler.'),
+    'update_performance_duration_seconds': (
+        'histogram', 'Time taken by the update_performance signal handler.'),
+    'cache_requests_total': (
+        'counter', 'Cache reads per key prefix, by result (hit or miss).'),
+    'historical_performance_inserts_total': (
+        'counter', 'HistoricalPerformance records inserted.'),
+}
+
+_lock = threading.Lock()
+# (sample name, labels) -> value, counters and histograms both only add
+_samples = {}
+_last_flush = 0.0
+# the pid whose file holds the samples, once written
+_owner_pid = None
+# writes the samples held by an idle worker, once the interval is over
+_timer = None
+
+
+def enabled():
+    '''
+    Returns:
+        bool: True if the metrics are collected.
+    '''
+    return settings.PROMETHEUS_METRICS
+
+
+def _add(name, labels, amount):
+    global _timer
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _samples[key] = _samples.get(key, 0) + amount
+        if not settings.PROMETHEUS_MULTIPROC_DIR:
+            return
+        wait = settings.PROMETHEUS_FLUSH_INTERVAL - (
+            time.monotonic() - _last_flush)
+        if wait > 0:
+            if _timer is None or not _timer.is_alive():
+                _timer = threading.Timer(wait, flush)
+                _timer.daemon = True
+                _timer.start()
+            return
+    flush()
+
+
+def _forget():
+    '''
+    Drop the state a forked worker inherits from its parent, which
+        writes its own samples, and whose timer thread is not forked.
+    '''
+    global _lock, _last_flush, _owner_pid, _timer
+    _lock = threading.Lock()
+    _samples.clear()
+    _last_flush = 0.0
+    _owner_pid = None
+    _timer = None
+
+
+@contextmanager
+def _directory_lock(directory):
+    '''
+    Hold the lock of the shared directory, across the processes.
+    '''
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read(path):
+    '''
+    Returns:
+        list: The [name, labels, value] samples of a file, none when it
+            is missing or being replaced.
+    '''
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return []
+
+
+def _merge(totals, samples):
+    for name, labels, value in samples:
+        key = (name, tuple(sorted(labels.items())))
+        totals[key] = totals.get(key, 0) + value
+
+
+def _write(path, totals):
+    '''
+    Replace a file of samples atomically.
+    '''
+    samples = [
+        [name, dict(labels), value] for (name, labels), value in
+        totals.items()]
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(samples, output)
+    os.replace(temporary, path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process of another user
+        return True
+    return True
+
+
+def _adopt(directory, path):
+    '''
+    Carry on the samples left in the file of an exited worker whose pid
+        this process reuses, so that its counters do not go backwards.
+    '''
+    with _directory_lock(directory):
+        _merge(_samples, _read(path))
+
+
+def archive_exited(directory):
+    '''
+    Merge the files of the workers that exited into the archive file and
+        remove them, so that a scrape reads one file per live worker.
+    '''
+    with _directory_lock(directory):
+        exited = []
+        for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+            pid = os.path.basename(path)[len('metrics_'):-len('.json')]
+            if pid.isdigit() and not _alive(int(pid)):
+                exited.append(path)
+        if not exited:
+            return
+        archive = os.path.join(directory, ARCHIVE_FILE)
+        totals = {}
+        for path in (archive, *exited):
+            _merge(totals, _read(path))
+        _write(archive, totals)
+        for path in exited:
+            os.remove(path)
+
+
+def inc(name, amount=1, **labels):
+    '''
+    Increase a counter.
+
+    Parameters:
+        name (str): The name of the counter, from METRICS.
+        amount (float): The increase.
+        **labels: The labels of the sample.
+    '''
+    if enabled():
+        _add(name, labels, amount)
+
+
+def observe(name, value, **labels):
+    '''
+    Record a value, such as a duration in seconds, in a histogram.
+
+    Parameters:
+        name (str): The name of the histogram, from METRICS.
+        value (float): The value observed.
+        **labels: The labels of the sample.
+    '''
+    if not enabled():
+        return
+    # every bucket is exposed, those below the value included
+    for bound in BUCKETS:
+        _add(
+            f'{name}_bucket', dict(labels, le=str(bound)),
+            1 if value <= bound else 0)
+    _add(f'{name}_bucket', dict(labels, le='+Inf'), 1)
+    _add(f'{name}_sum', labels, value)
+    _add(f'{name}_count', labels, 1)
+
+
+def observed(name):
+    '''
+    Decorator counting the calls of a function in `<name>_calls_total`
+        and timing them in `<name>_duration_seconds`.
+    '''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                inc(f'{name}_calls_total')
+                observe(
+                    f'{name}_duration_seconds',
+                    time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def flush():
+    '''
+    Write the samples of this process to its file of the shared
+        directory, replacing the file atomically.
+    '''
+    global _last_flush, _owner_pid, _timer
+    directory = settings.PROMETHEUS_MULTIPROC_DIR
+    if not directory:
+        return
+    pid = os.getpid()
+    path = os.path.join(directory, f'metrics_{pid}.json')
+    with _lock:
+        if _owner_pid != pid:
+            _adopt(directory, path)
+            _owner_pid = pid
+        samples = dict(_samples)
+        _last_flush = time.monotonic()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    _write(path, samples)
+
+
+os.register_at_fork(after_in_child=_forget)
+atexit.register(flush)
+
+
+def collect():
+    '''
+    Returns:
+        dict: The samples of all the processes summed,
+            keyed by (sample name, labels).
+    '''
+    directory = settings.PROMETHEUS_MULTIPROC_DIR
+    if not directory:
+        with _lock:
+            return dict(_samples)
+    flush()
+    archive_exited(directory)
+    totals = {}
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        _merge(totals, _read(path))
+    return totals
+
+
+def family(sample_name):
+    '''
+    Returns:
+        str: The metric a sample belongs to.
+    '''
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = sample_name[:-len(suffix)]
+        if sample_name.endswith(suffix) and base in METRICS:
+            return base
+    return sample_name
+
+
+def sample_order(item):
+    '''
+    Returns:
+        tuple: The sort key of a sample, which puts the buckets of a
+            histogram in the ascending order of their bounds, +Inf last.
+    '''
+    (name, labels), value = item
+    bound = dict(labels).get('le')
+    return (
+        name, tuple(label for label in labels if label[0] != 'le'),
+        0.0 if bound is None else float(bound))
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace(
+        '\n', r'\n').replace('"', r'\"')
+
+
+def exposition(samples):
+    '''
+    Returns:
+        str: The samples in the Prometheus text exposition format.
+    '''
+    lines = []
+    by_family = {}
+    for (name, labels), value in sorted(samples.items(), key=sample_order):
+        by_family.setdefault(family(name), []).append((name, labels, value))
+    for metric, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, labels, value in by_family.get(metric, []):
+            label_text = ','.join(
+                f'{key}="{escape(label)}"' for key, label in labels)
+            if label_text:
+                label_text = '{' + label_text + '}'
+            lines.append(f'{name}{label_text} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def scrape_allowed(request):
+    '''
+    Returns:
+        bool: True if the request carries the bearer token of the
+            scrapes or comes from an allowed address.
+    '''
+    token = settings.PROMETHEUS_BEARER_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if (token and len(header) == 2 and header[0].lower() == 'bearer' and
+            constant_time_compare(header[1], token)):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.PROMETHEUS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    '''
+    Serve the metrics of all the processes to Prometheus.
+
+    Parameters:
+    - request: The HTTP request object.
+
+    Returns:
+    - The metrics in the text exposition format, 404 when the metrics
+        are not collected, or 403 to the other clients than Prometheus.
+    '''
+    if not enabled():
+        raise Http404
+    if not scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(collect()), content_type=CONTENT_TYPE)
+
+
+class PrometheusMiddleware:
+    '''
+    Count the requests and time them per URL name.
+
+    The middleware removes itself at startup when PROMETHEUS_METRICS
+        is disabled.
+    '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        return self.record(request, response, started)
+
+    async def __acall__(self, request):
+        '''
+        Coroutine version of __call__, for the async middleware chain.
+        '''
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        return self.record(request, response, started)
+
+    def record(self, request, response, started):
+        '''
+        Count a request served and time it from `started`.
+
+        Returns:
+            HttpResponse: The response.
+        '''
+        match = request.resolver_match
+        url_name = match.url_name if match else 'unresolved'
+        inc(
+            'http_requests_total', url_name=url_name,
+            method=request.method, status=str(response.status_code))
+        observe(
+            'http_request_duration_seconds',
+            time.perf_counter() - started, url_name=url_name)
+        return response
@@ -0,0 +1,109 @@
+'''
+This module renders the API responses as JSON with orjson when it is
+installed, and with DRF's JSONRenderer otherwise
+
+The output is the one of DRF's renderer: datetimes, decimals, UUIDs and
+the other types DRF knows are converted by DRF's encoder, and \\u2028 and
+\\u2029 are escaped. Only the spelling of some floats differs (1e-05 is
+written 0.00001). Payloads encoded beforehand, such as cached responses,
+are wrapped in PreEncoded and written out as they are.
+'''
+import gzip
+import json
+from collections.abc import Mapping
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # datetimes are left to DRF's encoder, which formats them its own way
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    loads = orjson.loads
+else:
+    loads = json.loads
+
+_encoder = JSONEncoder()
+
+
+class PreEncoded(Mapping):
+    '''
+    A JSON object already encoded, rendered without being decoded.
+
+    Views return it as the data of a Response; it is only decoded when
+        its keys are read, by the tests for instance.
+
+    Attributes:
+        content (bytes): The JSON document.
+        content_encoding (str): 'gzip' if the document is compressed.
+    '''
+
+    def __init__(self, content, content_encoding=None):
+        self.content = content
+        self.content_encoding = content_encoding
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            content = self.content
+            if self.content_encoding == 'gzip':
+                content = gzip.decompress(content)
+            self._data = loads(content)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+def dumps(data):
+    '''
+    Encode data as compact JSON, like FastJSONRenderer does.
+
+    Parameters:
+        data: The data to encode.
+
+    Returns:
+        bytes: The JSON document.
+    '''
+    if isinstance(data, PreEncoded):
+        return data.content
+    return FastJSONRenderer().render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''
+    JSONRenderer encoding with orjson when it is installed.
+
+    Indented output (the browsable API, `Accept: application/json;
+        indent=4`), the ASCII and non compact settings, and the data
+        orjson rejects, such as integers over 64 bits, are left to
+        JSONRenderer.
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, PreEncoded):
+            return data.content
+        if (orjson is None or data is None or self.ensure_ascii or
+                not self.compact or self.get_indent(
+                    accepted_media_type, renderer_context or {})):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        # as JSONRenderer, keep the output a strict subset of javascript
+        return content.replace(
+            b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
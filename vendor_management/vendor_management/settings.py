@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'vendor_management.instrumentation.RequestTimingMiddleware',
+    'vendor_management.prometheus.PrometheusMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -133,10 +136,32 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # adding token based authenitcation 
 REST_FRAMEWORK = {
             'DEFAULT_AUTHENTICATION_CLASSES': [
-                'rest_framework.authentication.TokenAuthentication',  
+                'users.authentication.CachedTokenAuthentication',
+            ],
+            # encode and decode with orjson when it is installed
+            'DEFAULT_RENDERER_CLASSES': [
+                'vendor_management.renderers.FastJSONRenderer',
+                'rest_framework.renderers.BrowsableAPIRenderer',
+            ],
+            'DEFAULT_PARSER_CLASSES': [
+                'vendor_management.parsers.FastJSONParser',
+                'rest_framework.parsers.FormParser',
+                'rest_framework.parsers.MultiPartParser',
             ],
     }
 
+# cached responses this many bytes long or longer are stored compressed
+# with gzip, and sent compressed to the clients accepting it; None stores
+# them all uncompressed
+CACHE_COMPRESS_MIN_BYTES = 2048
+
+# seconds an authentication token and its user stay in the shared cache
+TOKEN_CACHE_TIMEOUT = 60
+# seconds and number of tokens kept in the cache of each process, which
+# other processes cannot evict
+TOKEN_LOCAL_CACHE_TIMEOUT = 5
+TOKEN_LOCAL_CACHE_SIZE = 1024
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -146,3 +171,93 @@ CACHES = {
         }
     }
 }
+
+# how vendor performance metrics are updated when purchase orders change:
+# 'sync' recomputes them on every save, 'coalesced' queues the vendor and
+# the flush_vendor_metrics worker recomputes it once per flush interval
+VENDOR_METRICS_MODE = 'sync'
+# seconds between two flushes of the flush_vendor_metrics worker
+VENDOR_METRICS_FLUSH_INTERVAL = 5
+
+# seconds the vendor and purchase order details stay cached, the entries
+# are evicted whenever the underlying rows change
+VENDOR_CACHE_TIMEOUT = 60 * 60 * 6
+PURCHASE_ORDER_CACHE_TIMEOUT = 60 * 60 * 6
+# seconds the row counts of the unfiltered list endpoints are cached,
+# they are also evicted whenever a row is inserted or deleted
+LIST_COUNT_CACHE_TIMEOUT = 60 * 60 * 6
+
+# days the historical performance records are kept before the
+# compact_vendor_history command folds them into hourly, daily and weekly
+# rollups
+PERFORMANCE_RAW_RETENTION_DAYS = 30
+
+# time the SQL queries, cache calls and signal handlers of every request,
+# reported in a Server-Timing header and logged to the
+# vendor_management.requests logger
+REQUEST_TIMING = False
+# requests slower than this many milliseconds are logged with their SQL
+REQUEST_TIMING_SLOW_MS = 500
+# share of the requests whose SQL is kept for the slow request log
+REQUEST_TIMING_SLOW_SAMPLE_RATE = 0.1
+
+# how the performance changes reach the streams of every worker: 'local'
+# for a single process, 'redis' to relay them with Redis pub/sub
+BROADCAST_BACKEND = 'local'
+BROADCAST_REDIS_URL = 'redis://127.0.0.1:6379/2'
+BROADCAST_CHANNEL_PREFIX = 'vendor_management:'
+# events a stream may fall behind by before the oldest are dropped
+BROADCAST_QUEUE_SIZE = 100
+# seconds between two keepalive comments of an idle stream
+SSE_KEEPALIVE_SECONDS = 15
+# seconds a stream stays open before the client is asked to reconnect
+SSE_MAX_SECONDS = 300
+# milliseconds the clients wait before reconnecting
+SSE_RETRY_MS = 3000
+# seconds a ticket may be used to open a stream after it is issued
+SSE_TICKET_SECONDS = 60
+
+# where the vendors are kept sorted by each metric for the leaderboard:
+# 'redis' in sorted sets shared by the workers, 'local' in every process;
+# 'redis' falls back to 'local' when RANKING_REDIS_URL is empty or Redis
+# cannot be reached
+RANKING_BACKEND = 'redis'
+RANKING_REDIS_URL = 'redis://127.0.0.1:6379/3'
+RANKING_KEY_PREFIX = 'vendor_management:ranking:'
+# seconds after which the 'local' rankings are read again, for the vendors
+# written without signals
+RANKING_LOCAL_TTL = 300
+# most vendors a page of the leaderboard returns
+LEADERBOARD_MAX_LIMIT = 1000
+
+# serve the GET requests of the details, the listings and the performance
+# metrics with coroutines; asgi.py turns it on, WSGI keeps the sync views
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false') == 'true'
+
+# collect request, signal and cache metrics, served at /metrics in the
+# Prometheus text format
+PROMETHEUS_METRICS = False
+# directory shared by the worker processes, each writes its metrics there
+# so that /metrics reports them all; unset with a single process
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+# seconds between two writes of the metrics of a worker to its file
+PROMETHEUS_FLUSH_INTERVAL = 1
+# addresses or networks /metrics is served to; others need the bearer
+# token, when set, in the Authorization header of their scrapes
+PROMETHEUS_ALLOWED_IPS = ('127.0.0.1', '::1')
+PROMETHEUS_BEARER_TOKEN = os.environ.get('PROMETHEUS_BEARER_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'vendor_management.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,123 @@
+'''
+This module provides helpers shared by the tests of the apps
+'''
+import re
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connections
+from django.test import AsyncRequestFactory
+
+# headers the async views must send as the sync views do
+COMPARED_HEADERS = (
+    'Content-Type', 'ETag', 'Last-Modified', 'Vary', 'Allow',
+    'Content-Encoding', 'WWW-Authenticate')
+
+
+class QueryPlanTestMixin:
+    '''
+    Assertions on the query plan SQLite chooses for a queryset, so that a
+        change of model, index or query which turns an index search into
+        a table scan or an extra sort is caught by the tests.
+
+    Usage Example:
+        ```python
+        class PlanTest(QueryPlanTestMixin, TestCase):
+            def test_plan(self):
+                self.assertUsesIndex(
+                    Model.objects.filter(field=1), 'model_field_idx')
+        ```
+    '''
+
+    def query_plan(self, queryset):
+        '''
+        Returns:
+            str: The output of EXPLAIN QUERY PLAN for the queryset.
+        '''
+        if connections[queryset.db].vendor != 'sqlite':
+            self.skipTest('query plans are only checked on SQLite')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index=None):
+        '''
+        Assert that the queryset searches its tables through an index,
+            without scanning a table or sorting its rows.
+
+        Parameters:
+            queryset: The query to check.
+            index (str): The name of the index that must be used,
+                any index will do when None.
+        '''
+        plan = self.query_plan(queryset)
+        if index:
+            expected = rf'USING (COVERING )?INDEX {re.escape(index)}\b'
+        else:
+            expected = r'USING ((COVERING )?INDEX|INTEGER PRIMARY KEY)'
+        self.assertRegex(plan, expected, f'Index not used:\n{plan}')
+        self.assertNotRegex(plan, r'\bSCAN\b', f'Table scan:\n{plan}')
+        self.assertNotIn('TEMP B-TREE', plan, f'Rows sorted:\n{plan}')
+
+
+class AsyncViewTestMixin:
+    '''
+    Comparison of the responses of an async view with those of the sync
+        view it stands in for, see vendor_management/async_api.py.
+
+    Usage Example:
+        ```python
+        class AsyncTest(AsyncViewTestMixin, TestCase):
+            def test_detail(self):
+                self.assertSameResponse(
+                    async_views.get_or_update_vendor, '/api/vendor/1/',
+                    headers={'Authorization': 'Token ...'}, vendor_id=1)
+        ```
+    '''
+
+    def async_request(self, view, path, data=None, headers=None,
+                      method='get', **kwargs):
+        '''
+        Call an async view the way the ASGI handler does.
+
+        Returns:
+            HttpResponse: The response of the view, rendered.
+        '''
+        factory = AsyncRequestFactory()
+        if method == 'get':
+            request = factory.get(path, data, headers=headers)
+        else:
+            request = getattr(factory, method)(
+                path, data, content_type='application/json', headers=headers)
+        response = async_to_sync(view)(request, **kwargs)
+        if hasattr(response, 'render'):
+            # the responses of the sync views the view handed over to
+            response.render()
+        return response
+
+    def assertSameResponse(self, view, path, data=None, headers=None,
+                           evict=(), **kwargs):
+        '''
+        Assert that an async view answers a GET request with the status,
+            the body and the headers of the sync view of the URL.
+
+        Parameters:
+            view: The async view.
+            path (str): The URL of the endpoint, routed to the sync view.
+            data (dict): The query parameters.
+            headers (dict): The headers of the request.
+            evict (iterable): Cache keys deleted before each request, so
+                that both views load the entries.
+            kwargs: The arguments of the URL, passed to the view.
+
+        Returns:
+            HttpResponse: The response of the async view.
+        '''
+        cache.delete_many(list(evict))
+        expected = self.client.get(path, data, headers=headers)
+        cache.delete_many(list(evict))
+        response = self.async_request(view, path, data, headers, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        for header in COMPARED_HEADERS:
+            self.assertEqual(
+                response.headers.get(header), expected.headers.get(header),
+                header)
+        return response
@@ -16,6 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from vendor_management.prometheus import metrics_view
 
 
 urlpatterns = [
@@ -23,4 +24,5 @@ urlpatterns = [
     path('api/user/', include('users.urls')),
     path('api/vendor/', include('vendors.urls')),
     path('api/purchase_orders/', include('purchase.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
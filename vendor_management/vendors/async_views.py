@@ -0,0 +1,111 @@
+'''
+This module serves the GET requests of the vendor endpoints with
+coroutines under ASGI, see vendor_management/async_api.py
+
+The requests are parsed and the responses built by the helpers of
+views.py, only the database and the cache are read differently.
+'''
+from django.conf import settings
+from django.http import Http404
+from functools import partial
+from rest_framework import status
+from vendor_management.async_api import (
+    async_get, anot_modified, cached_response, json_response)
+from vendor_management.cache import (
+    vendor_key, performance_key, aget_or_load, acurrent_version)
+from vendor_management.pagination import (
+    wants_cursor, acursor_page, wants_exact_count, atotal_count,
+    anumbered_page)
+from .models import Vendor
+from . import views
+
+
+@async_get(views.create_or_list_vendor)
+async def create_or_list_vendor(request):
+    '''
+    List the vendors, see views.create_or_list_vendor.
+    '''
+    try:
+        all_vendors, rows, includes = views.listing_rows(request)
+        if wants_cursor(request):
+            page, pagination = await acursor_page(request, rows)
+        else:
+            count = await atotal_count(
+                all_vendors, wants_exact_count(request))
+            page, pagination = await anumbered_page(request, rows, count)
+    except ValueError as error:
+        return json_response(f'Error : {error}', status.HTTP_400_BAD_REQUEST)
+    return json_response(views.listing_page(page, pagination, includes))
+
+
+async def aload_vendor(vendor_id):
+    '''
+    Coroutine version of views.load_vendor.
+    '''
+    key = vendor_key(vendor_id)
+    # read before the row, a change made meanwhile bumps it again
+    version = await acurrent_version(key)
+    return views.vendor_payload(
+        await Vendor.objects.filter(id=vendor_id).afirst(), key, version)
+
+
+async def aload_performance(vendor_id):
+    '''
+    Coroutine version of views.load_performance.
+    '''
+    key = performance_key(vendor_id)
+    version = await acurrent_version(key)
+    return views.performance_payload(
+        await views.performance_query(vendor_id).afirst(), key, version)
+
+
+@async_get(views.get_or_update_vendor)
+async def get_or_update_vendor(request, vendor_id):
+    '''
+    Retrieve the details of a vendor, see views.get_or_update_vendor.
+    '''
+    key = vendor_key(vendor_id)
+    # the client already holds the current version
+    response = await anot_modified(request, key)
+    if response is not None:
+        return response
+    payload = await aget_or_load(
+        key, partial(aload_vendor, vendor_id),
+        settings.VENDOR_CACHE_TIMEOUT)
+    if payload is None:
+        raise Http404
+    return cached_response(request, payload)
+
+
+@async_get(views.view_performance, delegate_if=views.wants_range)
+async def view_performance(request, vendor_id):
+    '''
+    Retrieve the performance metrics of a vendor, see
+        views.view_performance. The ranges of the history are read by
+        the sync view.
+    '''
+    try:
+        if request.query_params.get('live') != 'true':
+            key = performance_key(vendor_id)
+            response = await anot_modified(request, key)
+            if response is not None:
+                return response
+            payload = await aget_or_load(
+                key, partial(aload_performance, vendor_id),
+                settings.VENDOR_CACHE_TIMEOUT)
+            if payload is None:
+                return json_response(
+                    views.missing_vendor(vendor_id),
+                    status.HTTP_404_NOT_FOUND)
+            return cached_response(request, payload)
+
+        vendor = await Vendor.objects.filter(
+            id=vendor_id).with_live_metrics().afirst()
+        if not vendor:
+            return json_response(
+                views.missing_vendor(vendor_id), status.HTTP_404_NOT_FOUND)
+        return json_response(views.live_performance(vendor))
+    except Exception as e:
+        # Handle any unexpected errors
+        return json_response(
+            str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,37 @@
+'''
+This module publishes the changes of the vendor performance metrics to
+the streams of vendor_management.broadcast
+'''
+from django.db import transaction
+from vendor_management import broadcast
+from vendor_management.encoders import format_value
+
+# channel of the performance changes
+PERFORMANCE_CHANNEL = 'performance'
+
+
+def performance_event(snapshot):
+    '''
+    Returns:
+        dict: The event of a new historical performance record.
+    '''
+    return {
+        'vendor_id': snapshot.vendor_id,
+        'date': format_value(snapshot.date),
+        **snapshot.metrics()}
+
+
+def publish_performance(snapshot):
+    '''
+    Publish a change of the metrics of a vendor once the transaction
+        recording it commits.
+
+    Parameters:
+        snapshot (HistoricalPerformance): The record of the new metrics,
+            None when no metric changed.
+    '''
+    if snapshot is None:
+        return
+    event = performance_event(snapshot)
+    transaction.on_commit(
+        lambda: broadcast.publish(PERFORMANCE_CHANNEL, event))
@@ -0,0 +1,269 @@
+'''
+This module keeps the performance history of the vendors compact
+
+A historical performance record is only written when a metric changed.
+Records older than PERFORMANCE_RAW_RETENTION_DAYS are compacted into
+hourly, daily and weekly PerformanceRollup buckets holding the lowest,
+the highest and the last value of each metric, and ranges of the history
+are read at the finest resolution that keeps the response small.
+'''
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from vendor_management.encoders import format_value
+from .models import HistoricalPerformance, PerformanceRollup
+
+RAW = 'raw'
+RESOLUTIONS = (
+    RAW, PerformanceRollup.HOUR, PerformanceRollup.DAY,
+    PerformanceRollup.WEEK)
+METRIC_FIELDS = HistoricalPerformance.METRIC_FIELDS
+# longest range read at each resolution when none is asked for
+MAX_SPAN = {
+    RAW: timedelta(days=2),
+    PerformanceRollup.HOUR: timedelta(days=14),
+    PerformanceRollup.DAY: timedelta(days=366),
+}
+
+
+def record_snapshot(vendor, **values):
+    '''
+    Record the performance of a vendor unless all four metrics are
+        those of its last record.
+
+    Parameters:
+        vendor (Vendor): The vendor.
+        **values: The metrics to record, those missing or at 0.0 are
+            carried forward from the last record.
+
+    Returns:
+        HistoricalPerformance: The new record, or None if nothing changed.
+    '''
+    snapshot = HistoricalPerformance(vendor=vendor, **values)
+    previous = HistoricalPerformance.last_snapshot(vendor.id)
+    snapshot.carry_forward(previous)
+    if snapshot.same_metrics(previous):
+        return None
+    snapshot.save()
+    return snapshot
+
+
+def raw_retention():
+    '''
+    Returns:
+        timedelta: How long historical records are kept before
+            being compacted.
+    '''
+    return timedelta(days=settings.PERFORMANCE_RAW_RETENTION_DAYS)
+
+
+def bucket_start(date, resolution):
+    '''
+    Returns:
+        datetime: The start of the bucket of this resolution the date
+            falls in, buckets following the current time zone.
+    '''
+    start = timezone.localtime(date).replace(
+        minute=0, second=0, microsecond=0)
+    if resolution != PerformanceRollup.HOUR:
+        start = start.replace(hour=0)
+    if resolution == PerformanceRollup.WEEK:
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def point_bucket(date, values):
+    '''
+    Returns:
+        dict: A bucket holding a single record.
+    '''
+    bucket = {'last_date': date}
+    for field, value in zip(METRIC_FIELDS, values):
+        bucket[f'{field}_min'] = value
+        bucket[f'{field}_max'] = value
+        bucket[f'{field}_last'] = value
+    return bucket
+
+
+def merge_buckets(bucket, other):
+    '''
+    Merge two buckets of the same period, the result does not depend on
+        how many times a record was merged.
+
+    Parameters:
+        bucket (dict): A bucket, or None.
+        other (dict): Another bucket.
+
+    Returns:
+        dict: The merged bucket.
+    '''
+    if bucket is None:
+        return dict(other)
+    latest = other if other['last_date'] >= bucket['last_date'] else bucket
+    merged = {'last_date': latest['last_date']}
+    for field in METRIC_FIELDS:
+        merged[f'{field}_min'] = min(
+            bucket[f'{field}_min'], other[f'{field}_min'])
+        merged[f'{field}_max'] = max(
+            bucket[f'{field}_max'], other[f'{field}_max'])
+        merged[f'{field}_last'] = latest[f'{field}_last']
+    return merged
+
+
+def stored_bucket(rollup):
+    '''
+    Returns:
+        dict: The bucket of a PerformanceRollup row.
+    '''
+    bucket = {'last_date': rollup.last_date}
+    for field in METRIC_FIELDS:
+        for suffix in ('min', 'max', 'last'):
+            name = f'{field}_{suffix}'
+            bucket[name] = getattr(rollup, name)
+    return bucket
+
+
+def write_buckets(buckets):
+    '''
+    Merge buckets into the stored rollups.
+
+    Parameters:
+        buckets (dict): The buckets keyed by
+            (vendor id, resolution, bucket start).
+    '''
+    if not buckets:
+        return
+    starts = [key[2] for key in buckets]
+    stored = PerformanceRollup.objects.filter(
+        vendor_id__in={key[0] for key in buckets},
+        bucket_start__gte=min(starts),
+        bucket_start__lte=max(starts))
+    for rollup in stored:
+        key = (rollup.vendor_id, rollup.resolution, rollup.bucket_start)
+        if key in buckets:
+            buckets[key] = merge_buckets(stored_bucket(rollup), buckets[key])
+    PerformanceRollup.objects.bulk_create(
+        [PerformanceRollup(
+            vendor_id=vendor_id, resolution=resolution, bucket_start=start,
+            **bucket)
+         for (vendor_id, resolution, start), bucket in buckets.items()],
+        update_conflicts=True,
+        unique_fields=['vendor', 'resolution', 'bucket_start'],
+        update_fields=list(next(iter(buckets.values()))))
+
+
+def compact(days=None, batch_size=1000):
+    '''
+    Fold the historical records older than `days` into the hourly, daily
+        and weekly rollups and delete them.
+
+    The last record of each vendor is kept whatever its age, since the
+        next record carries its values forward.
+
+    Parameters:
+        days (int): Age in days of the records to compact, defaults to
+            PERFORMANCE_RAW_RETENTION_DAYS.
+        batch_size (int): Number of records compacted per transaction.
+
+    Returns:
+        int: The number of records compacted.
+    '''
+    if days is None:
+        days = settings.PERFORMANCE_RAW_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    kept = set(HistoricalPerformance.objects.values('vendor').annotate(
+        latest=Max('id')).values_list('latest', flat=True))
+    compacted = 0
+    last_id = 0
+    while True:
+        rows = list(HistoricalPerformance.objects.filter(
+            date__lt=cutoff, id__gt=last_id).order_by('id').values_list(
+            'id', 'vendor_id', 'date', *METRIC_FIELDS)[:batch_size])
+        if not rows:
+            return compacted
+        last_id = rows[-1][0]
+        buckets = {}
+        for row_id, vendor_id, date, *values in rows:
+            for resolution in RESOLUTIONS[1:]:
+                key = (vendor_id, resolution, bucket_start(date, resolution))
+                buckets[key] = merge_buckets(
+                    buckets.get(key), point_bucket(date, values))
+        with transaction.atomic():
+            write_buckets(buckets)
+            HistoricalPerformance.objects.filter(
+                id__in=[row[0] for row in rows if row[0] not in kept]
+            ).delete()
+        compacted += len(rows)
+
+
+def choose_resolution(start, end):
+    '''
+    Returns:
+        str: The finest resolution available for the range that keeps
+            the number of points small.
+    '''
+    span = end - start
+    if span <= MAX_SPAN[RAW] and start >= timezone.now() - raw_retention():
+        return RAW
+    for resolution in (PerformanceRollup.HOUR, PerformanceRollup.DAY):
+        if span <= MAX_SPAN[resolution]:
+            return resolution
+    return PerformanceRollup.WEEK
+
+
+def bucket_point(start, bucket):
+    '''
+    Returns:
+        dict: A point of the series, each metric with its last value
+            and its lowest and highest values over the bucket.
+    '''
+    point = {'date': format_value(start)}
+    for field in METRIC_FIELDS:
+        point[field] = bucket[f'{field}_last']
+        point[f'{field}_min'] = bucket[f'{field}_min']
+        point[f'{field}_max'] = bucket[f'{field}_max']
+    return point
+
+
+def series(vendor_id, start, end, resolution=None):
+    '''
+    Read the performance history of a vendor over a range.
+
+    The rollups are merged with the records not compacted yet, so the
+        series also covers the recent history.
+
+    Parameters:
+        vendor_id (int): The vendor.
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+        resolution (str): 'raw', 'hour', 'day' or 'week', chosen from
+            the range when None.
+
+    Returns:
+        tuple: The resolution used and the points of the series,
+            oldest first.
+    '''
+    if resolution is None:
+        resolution = choose_resolution(start, end)
+    rows = HistoricalPerformance.objects.filter(
+        vendor_id=vendor_id, date__gte=start, date__lte=end).order_by(
+        'date', 'id').values_list('date', *METRIC_FIELDS)
+    if resolution == RAW:
+        return resolution, [
+            bucket_point(date, point_bucket(date, values))
+            for date, *values in rows]
+
+    buckets = {
+        rollup.bucket_start: stored_bucket(rollup)
+        for rollup in PerformanceRollup.objects.filter(
+            vendor_id=vendor_id, resolution=resolution,
+            bucket_start__gte=bucket_start(start, resolution),
+            bucket_start__lte=end)}
+    for date, *values in rows:
+        key = bucket_start(date, resolution)
+        buckets[key] = merge_buckets(
+            buckets.get(key), point_bucket(date, values))
+    return resolution, [
+        bucket_point(key, buckets[key]) for key in sorted(buckets)]
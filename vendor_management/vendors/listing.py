@@ -0,0 +1,163 @@
+'''
+This module builds the query of the vendor listing from its parameters
+
+`include=metrics,order_counts` embeds the current performance metrics and
+the number of orders of every vendor by status in the page. Both are read
+with the vendors, in the same query, from their performance counters
+(see purchase/metrics.py) rather than aggregated from the purchase
+orders or requested vendor by vendor.
+
+`ordering` sorts the vendors and `min_<field>`/`max_<field>` filter them
+on their stored metrics, which the indexes of Vendor serve, or on their
+order counts. Every change of the orders writes the stored metrics from
+the same counters `include=metrics` reads (see
+purchase.metrics.write_vendor_metrics), rounded, and in coalesced mode
+once the queued vendors are flushed.
+'''
+from .models import Vendor, HistoricalPerformance
+
+METRIC_FIELDS = HistoricalPerformance.METRIC_FIELDS
+ORDER_COUNT_FIELDS = (
+    'total_orders', 'open_orders', 'completed_orders', 'canceled_orders')
+# key in the listing -> key in the row -> annotation of the query
+INCLUDES = {
+    'metrics': {
+        field: f'current_{field}' for field in METRIC_FIELDS},
+    'order_counts': {
+        field.removesuffix('_orders'): field
+        for field in ORDER_COUNT_FIELDS},
+}
+ORDERING_FIELDS = ('id', 'name', *METRIC_FIELDS, *ORDER_COUNT_FIELDS)
+FILTER_FIELDS = (*METRIC_FIELDS, *ORDER_COUNT_FIELDS)
+BOUNDS = (('min_', 'gte'), ('max_', 'lte'))
+
+
+def parse_includes(value):
+    '''
+    Parameters:
+        value (str): The `include` parameter, comma separated.
+
+    Returns:
+        list: The data to embed, without duplicates.
+
+    Raises:
+        ValueError: An unknown include.
+    '''
+    includes = []
+    for name in (value or '').split(','):
+        name = name.strip()
+        if not name or name in includes:
+            continue
+        if name not in INCLUDES:
+            raise ValueError(
+                f'Unknown include {name}, expected one of '
+                f'{", ".join(INCLUDES)}')
+        includes.append(name)
+    return includes
+
+
+def parse_filters(params):
+    '''
+    Parameters:
+        params (QueryDict): The query parameters.
+
+    Returns:
+        dict: The lookups of the `min_<field>`/`max_<field>` parameters.
+
+    Raises:
+        ValueError: A bound which is not a number.
+    '''
+    lookups = {}
+    for field in FILTER_FIELDS:
+        for prefix, lookup in BOUNDS:
+            value = params.get(f'{prefix}{field}')
+            if value is None:
+                continue
+            try:
+                lookups[f'{field}__{lookup}'] = float(value)
+            except ValueError:
+                raise ValueError(f'Invalid {prefix}{field} {value}')
+    return lookups
+
+
+def parse_ordering(value):
+    '''
+    Parameters:
+        value (str): The `ordering` parameter, such as
+            `-on_time_delivery_rate`.
+
+    Returns:
+        list: The order_by of the listing, the id breaking the ties in
+            the same direction.
+
+    Raises:
+        ValueError: A field the listing is not sorted by.
+    '''
+    value = value or 'id'
+    field = value.removeprefix('-')
+    if field not in ORDERING_FIELDS:
+        raise ValueError(
+            f'Invalid ordering {value}, expected one of '
+            f'{", ".join(ORDERING_FIELDS)}')
+    if field == 'id':
+        return [value]
+    return [value, value.removesuffix(field) + 'id']
+
+
+def vendor_listing(params):
+    '''
+    Build the vendors of the listing.
+
+    Parameters:
+        params (QueryDict): The query parameters.
+
+    Returns:
+        tuple: The queryset of the vendors, filtered and sorted, the
+            data to embed (see nest) and whether the order is not the
+            default one.
+
+    Raises:
+        ValueError: An invalid include, ordering or bound.
+    '''
+    includes = parse_includes(params.get('include'))
+    lookups = parse_filters(params)
+    ordering = parse_ordering(params.get('ordering'))
+    vendors = Vendor.objects.all()
+    counted = {ordering[0].lstrip('-')} | {
+        lookup.split('__')[0] for lookup in lookups}
+    if 'order_counts' in includes or counted & set(ORDER_COUNT_FIELDS):
+        vendors = vendors.with_order_counts()
+    if 'metrics' in includes:
+        vendors = vendors.with_current_metrics()
+    return (
+        vendors.filter(**lookups).order_by(*ordering), includes,
+        ordering != ['id'])
+
+
+def annotations(includes):
+    '''
+    Returns:
+        list: The annotations the rows of the listing read for `includes`.
+    '''
+    return [
+        annotation for include in includes
+        for annotation in INCLUDES[include].values()]
+
+
+def nest(rows, includes):
+    '''
+    Move the embedded data of encoded rows under their include.
+
+    Parameters:
+        rows (list): The rows, read with their annotations.
+        includes (list): The data embedded.
+
+    Returns:
+        list: The rows.
+    '''
+    for row in rows:
+        for include in includes:
+            row[include] = {
+                key: row.pop(annotation)
+                for key, annotation in INCLUDES[include].items()}
+    return rows
@@ -0,0 +1,40 @@
+'''
+Management command compacting the vendor performance history
+'''
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from vendors import history
+
+
+class Command(BaseCommand):
+    '''
+    Fold the historical performance records older than a number of days
+        into hourly, daily and weekly rollups and delete them.
+
+    The last record of each vendor is kept. Run it periodically, for
+        instance once a day from cron.
+
+    Usage Example:
+        ```
+        python manage.py compact_vendor_history
+        python manage.py compact_vendor_history --days 7
+        ```
+    '''
+    help = 'Compact old vendor performance history into rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.PERFORMANCE_RAW_RETENTION_DAYS,
+            help='Age in days of the records to compact')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of records compacted per transaction')
+
+    def handle(self, *args, **options):
+        compacted = history.compact(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted {compacted} performance records'))
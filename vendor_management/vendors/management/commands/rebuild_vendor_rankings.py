@@ -0,0 +1,31 @@
+'''
+Management command rebuilding the vendor rankings
+'''
+from django.core.management.base import BaseCommand
+from vendors import ranking
+
+
+class Command(BaseCommand):
+    '''
+    Read the rankings of the vendors by each metric again from the
+        database, after vendors were written without sending signals,
+        such as with bulk_create or update().
+
+    With RANKING_BACKEND 'redis' the sorted sets shared by the workers
+        are replaced; with 'local' the version of the rankings changes,
+        so that every process reads its rankings again on its next use.
+
+    Usage Example:
+        ```
+        python manage.py rebuild_vendor_rankings
+        ```
+    '''
+    help = 'Rebuild the rankings of the vendors by their metrics'
+
+    def handle(self, *args, **options):
+        rankings = ranking.get_ranking()
+        rankings.rebuild()
+        if isinstance(rankings, ranking.LocalRanking):
+            rankings.publish()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ranked {rankings.size()} vendors'))
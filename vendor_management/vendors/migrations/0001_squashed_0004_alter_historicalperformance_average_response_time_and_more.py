@@ -0,0 +1,48 @@
+# Generated by Django 4.2.10 on 2026-10-17 21:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    replaces = [
+        ('vendors', '0001_initial'),
+        ('vendors', '0002_alter_vendor_address_and_more'),
+        ('vendors', '0003_alter_vendor_contact_details'),
+        ('vendors', '0004_alter_historicalperformance_average_response_time_and_more'),
+    ]
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vendor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=70)),
+                ('contact_details', models.TextField()),
+                ('address', models.TextField()),
+                ('vendor_code', models.CharField(editable=False, max_length=100, unique=True)),
+                ('on_time_delivery_rate', models.FloatField(default=0.0)),
+                ('quality_rating_avg', models.FloatField(default=0.0)),
+                ('average_response_time', models.FloatField(default=0.0)),
+                ('fulfillment_rate', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HistoricalPerformance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('on_time_delivery_rate', models.FloatField(default=0.0)),
+                ('quality_rating_avg', models.FloatField(default=0.0)),
+                ('average_response_time', models.FloatField(default=0.0)),
+                ('fulfillment_rate', models.FloatField(default=0.0)),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='vendors.vendor')),
+            ],
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.10 on 2026-10-17 21:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0001_squashed_0004_alter_historicalperformance_average_response_time_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPerformanceUpdate',
+            fields=[
+                ('vendor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pending_performance_update', serialize=False, to='vendors.vendor')),
+                ('marked_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PerformanceCounter',
+            fields=[
+                ('vendor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='performance_counter', serialize=False, to='vendors.vendor')),
+                ('total_orders', models.IntegerField(default=0)),
+                ('completed_orders', models.IntegerField(default=0)),
+                ('on_time_orders', models.IntegerField(default=0)),
+                ('canceled_orders', models.IntegerField(default=0)),
+                ('rating_sum', models.FloatField(default=0.0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('acknowledged_orders', models.IntegerField(default=0)),
+                ('response_seconds_sum', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PerformanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('week', 'Week')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('last_date', models.DateTimeField()),
+                ('on_time_delivery_rate_min', models.FloatField()),
+                ('on_time_delivery_rate_max', models.FloatField()),
+                ('on_time_delivery_rate_last', models.FloatField()),
+                ('quality_rating_avg_min', models.FloatField()),
+                ('quality_rating_avg_max', models.FloatField()),
+                ('quality_rating_avg_last', models.FloatField()),
+                ('average_response_time_min', models.FloatField()),
+                ('average_response_time_max', models.FloatField()),
+                ('average_response_time_last', models.FloatField()),
+                ('fulfillment_rate_min', models.FloatField()),
+                ('fulfillment_rate_max', models.FloatField()),
+                ('fulfillment_rate_last', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='historicalperformance',
+            index=models.Index(fields=['vendor', 'date'], name='history_vendor_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='performancerollup',
+            name='vendor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='performance_rollups', to='vendors.vendor'),
+        ),
+        migrations.AddIndex(
+            model_name='pendingperformanceupdate',
+            index=models.Index(fields=['marked_at'], name='pending_marked_at_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='performancerollup',
+            constraint=models.UniqueConstraint(fields=('vendor', 'resolution', 'bucket_start'), name='unique_performance_rollup_bucket'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+'''
+Index the stored metrics of the vendors, which the listing sorts and
+filters by, and write them again from the performance counters.
+
+The metrics stored before the metric writers were unified may have been
+left behind by the status of the last order saved; they are computed
+from the counters as purchase.metrics.write_vendor_metrics does.
+'''
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# metric -> numerator, denominator and digits of PerformanceCounter
+RATIOS = {
+    'on_time_delivery_rate': ('on_time_orders', 'completed_orders', 2),
+    'quality_rating_avg': ('rating_sum', 'rating_count', 1),
+    'average_response_time': (
+        'response_seconds_sum', 'acknowledged_orders', None),
+    'fulfillment_rate': ('completed_orders', 'total_orders', 2),
+}
+
+
+def write_stored_metrics(apps, schema_editor):
+    Vendor = apps.get_model('vendors', 'Vendor')
+    PerformanceCounter = apps.get_model('vendors', 'PerformanceCounter')
+    using = schema_editor.connection.alias
+    counters = PerformanceCounter.objects.using(using).select_related(
+        'vendor').order_by('vendor_id')
+    vendors = []
+    for counter in counters.iterator(chunk_size=BATCH_SIZE):
+        vendor = counter.vendor
+        for metric, (numerator, denominator, digits) in RATIOS.items():
+            # left as it is when there is nothing to compute it from
+            if getattr(counter, denominator):
+                value = (
+                    getattr(counter, numerator) /
+                    getattr(counter, denominator))
+                setattr(vendor, metric, value if digits is None else round(
+                    value, digits))
+        vendors.append(vendor)
+    Vendor.objects.using(using).bulk_update(
+        vendors, list(RATIOS), batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0005_performance_tables'),
+        ('purchase', '0004_backfill_performance_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vendor',
+            index=models.Index(
+                fields=['on_time_delivery_rate', 'id'],
+                name='vendor_on_time_rate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendor',
+            index=models.Index(
+                fields=['quality_rating_avg', 'id'],
+                name='vendor_quality_avg_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendor',
+            index=models.Index(
+                fields=['average_response_time', 'id'],
+                name='vendor_response_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendor',
+            index=models.Index(
+                fields=['fulfillment_rate', 'id'],
+                name='vendor_fulfillment_rate_idx'),
+        ),
+        migrations.RunPython(
+            write_stored_metrics, migrations.RunPython.noop, elidable=True),
+    ]
@@ -1,8 +1,130 @@
 '''
 defines models for vendor
 '''
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models import (
+    F, Q, Avg, Count, Sum, DurationField, ExpressionWrapper, FloatField)
+from django.db.models.functions import Cast, Coalesce, NullIf
 import uuid
+from vendor_management import prometheus
+from vendor_management.cache import MISSING, history_key, store
+
+
+class VendorQuerySet(models.QuerySet):
+    '''
+    QuerySet for the Vendor model.
+    '''
+
+    def with_live_metrics(self):
+        '''
+        Annotate each vendor with its performance metrics computed from
+            its purchase orders, for any number of vendors in a single
+            grouped query.
+
+        Counters:
+            live_total_orders, live_completed_orders, live_on_time_orders,
+            live_canceled_orders, live_rating_sum, live_rating_count,
+            live_acknowledged_orders (int or float) and
+            live_response_time_sum (timedelta).
+
+        Metrics (None when there is nothing to compute them from):
+            live_on_time_delivery_rate (float): Share of the completed
+                orders acknowledged on or before their delivery date.
+            live_fulfillment_rate (float): Share of the orders completed.
+            live_quality_rating_avg (float): Average quality rating.
+            live_average_response_time (timedelta): Average time taken
+                to acknowledge an order.
+
+        The metrics are not rounded.
+
+        Usage Example:
+            ```python
+            vendor = Vendor.objects.with_live_metrics().get(id=1)
+            vendor.live_fulfillment_rate
+            ```
+        '''
+        completed = Q(purchaseorder__status='Completed')
+        response_time = ExpressionWrapper(
+            F('purchaseorder__acknowledgment_date') -
+            F('purchaseorder__issue_date'),
+            output_field=DurationField())
+        return self.annotate(
+            live_total_orders=Count('purchaseorder'),
+            live_completed_orders=Count('purchaseorder', filter=completed),
+            live_on_time_orders=Count('purchaseorder', filter=completed & Q(
+                purchaseorder__acknowledgment_date__lte=F(
+                    'purchaseorder__delivery_date'))),
+            live_canceled_orders=Count(
+                'purchaseorder', filter=Q(purchaseorder__status='Canceled')),
+            live_rating_sum=Sum(
+                'purchaseorder__quality_rating', default=0.0),
+            live_rating_count=Count('purchaseorder__quality_rating'),
+            live_acknowledged_orders=Count(
+                'purchaseorder__acknowledgment_date'),
+            live_response_time_sum=Sum(response_time),
+            live_quality_rating_avg=Avg('purchaseorder__quality_rating'),
+            live_average_response_time=Avg(response_time),
+        ).annotate(
+            live_on_time_delivery_rate=Cast(
+                'live_on_time_orders', FloatField()) / NullIf(
+                'live_completed_orders', 0),
+            live_fulfillment_rate=Cast(
+                'live_completed_orders', FloatField()) / NullIf(
+                'live_total_orders', 0),
+        )
+
+    def with_order_counts(self):
+        '''
+        Annotate each vendor with the number of its orders by status,
+            read from its performance counter in the same query, 0 for a
+            vendor without one.
+
+        Counters:
+            total_orders, open_orders, completed_orders and
+            canceled_orders (int).
+        '''
+        total = Coalesce(F('performance_counter__total_orders'), 0)
+        completed = Coalesce(F('performance_counter__completed_orders'), 0)
+        canceled = Coalesce(F('performance_counter__canceled_orders'), 0)
+        return self.annotate(
+            total_orders=total,
+            open_orders=total - completed - canceled,
+            completed_orders=completed,
+            canceled_orders=canceled)
+
+    def with_current_metrics(self):
+        '''
+        Annotate each vendor with its performance metrics derived from
+            its performance counter in the same query: the metrics of
+            `with_live_metrics` without aggregating the purchase orders.
+
+        Metrics (the stored metric when there is nothing to compute them
+        from, as purchase.metrics.write_vendor_metrics leaves it):
+            current_on_time_delivery_rate, current_quality_rating_avg,
+            current_average_response_time (in seconds) and
+            current_fulfillment_rate (float).
+
+        The metrics are not rounded.
+        '''
+        def ratio(numerator, denominator, stored):
+            return Coalesce(
+                Cast(f'performance_counter__{numerator}', FloatField()) /
+                NullIf(f'performance_counter__{denominator}', 0),
+                stored, output_field=FloatField())
+
+        return self.annotate(
+            current_on_time_delivery_rate=ratio(
+                'on_time_orders', 'completed_orders',
+                'on_time_delivery_rate'),
+            current_quality_rating_avg=ratio(
+                'rating_sum', 'rating_count', 'quality_rating_avg'),
+            current_average_response_time=ratio(
+                'response_seconds_sum', 'acknowledged_orders',
+                'average_response_time'),
+            current_fulfillment_rate=ratio(
+                'completed_orders', 'total_orders', 'fulfillment_rate'))
 
 
 class Vendor(models.Model):
@@ -36,6 +158,26 @@ class Vendor(models.Model):
     average_response_time = models.FloatField(default=0.0)
     fulfillment_rate = models.FloatField(default=0.0)
 
+    objects = VendorQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # vendors sorted or filtered by a metric in the listing, the
+            # id breaking the ties in the same direction
+            models.Index(
+                fields=['on_time_delivery_rate', 'id'],
+                name='vendor_on_time_rate_idx'),
+            models.Index(
+                fields=['quality_rating_avg', 'id'],
+                name='vendor_quality_avg_idx'),
+            models.Index(
+                fields=['average_response_time', 'id'],
+                name='vendor_response_time_idx'),
+            models.Index(
+                fields=['fulfillment_rate', 'id'],
+                name='vendor_fulfillment_rate_idx'),
+        ]
+
     def __str__(self):
         '''
         Returns a string representation of the vendor.
@@ -96,6 +238,14 @@ class HistoricalPerformance(models.Model):
     average_response_time = models.FloatField(default=0.0)
     fulfillment_rate = models.FloatField(default=0.0)
 
+    class Meta:
+        indexes = [
+            # last record of a vendor and ranges of its history, ascending
+            # so that the id tie-break of the ranges needs no sort either
+            models.Index(
+                fields=['vendor', 'date'], name='history_vendor_date_idx'),
+        ]
+
     def __str__(self):
         '''
         Returns a string representation of the historical performance record.
@@ -106,21 +256,267 @@ class HistoricalPerformance(models.Model):
         '''
         return f"Historical Performance for {self.vendor.name} on {self.date}"
 
+    METRIC_FIELDS = (
+        'on_time_delivery_rate',
+        'quality_rating_avg',
+        'average_response_time',
+        'fulfillment_rate',
+    )
+
+    @classmethod
+    def last_snapshot(cls, vendor_id):
+        '''
+        Read the metrics of the last record of a vendor.
+
+        The metrics are kept in the cache by `save`, the database is only
+            queried when the entry expired.
+
+        Parameters:
+            vendor_id (int): The vendor.
+
+        Returns:
+            dict: The four metrics, or None if the vendor has no record.
+        '''
+        key = history_key(vendor_id)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = cls.objects.filter(vendor_id=vendor_id).order_by(
+                '-date').values(*cls.METRIC_FIELDS).first() or MISSING
+            store(key, snapshot, settings.VENDOR_CACHE_TIMEOUT)
+        return None if snapshot == MISSING else snapshot
+
+    def carry_forward(self, previous):
+        '''
+        Fill the metrics left at 0.0 with those of the previous record
+            of the vendor.
+
+        Parameters:
+            previous (dict): The metrics of the most recent record of
+                the vendor, or None if there is none.
+        '''
+        self._carried_forward = True
+        if previous:
+            for field in self.METRIC_FIELDS:
+                if getattr(self, field) == 0.0:
+                    setattr(self, field, previous[field])
+
+    def metrics(self):
+        '''
+        Returns:
+            dict: The four metrics of the record.
+        '''
+        return {field: getattr(self, field) for field in self.METRIC_FIELDS}
+
+    def same_metrics(self, other):
+        '''
+        Returns:
+            bool: True if the other metrics are the four of this record.
+        '''
+        return other is not None and self.metrics() == other
+
     def save(self, *args, **kwargs):
-        # Retrieve the most recent record for the same vendor
-        previous_record = HistoricalPerformance.objects.filter(
-            vendor=self.vendor).order_by('-date').first()
-        if previous_record:
-            # Iterate over the attributes of the current instance
-            for attr in self._meta.get_fields():
-                # Check if the attribute is a field (excluding ForeignKey,
-                # ManyToManyField, etc.)
-                if isinstance(
-                        attr, models.Field) and getattr(
-                        self, attr.name) == 0.0:
-                    setattr(
-                        self, attr.name, getattr(
-                            previous_record, attr.name))
+        if not getattr(self, '_carried_forward', False):
+            # carry forward from the last record of the vendor,
+            # cached rather than queried on every insert
+            self.carry_forward(self.last_snapshot(self.vendor_id))
 
+        inserting = self._state.adding
         # Call the parent class's save method to save the updated instance
         super().save(*args, **kwargs)
+        if inserting:
+            prometheus.inc('historical_performance_inserts_total')
+        store(
+            history_key(self.vendor_id), self.metrics(),
+            settings.VENDOR_CACHE_TIMEOUT)
+
+
+class PerformanceRollup(models.Model):
+    '''
+    Downsampled performance history of a vendor.
+
+    Each row summarises the historical performance records of a vendor
+        over an hour, a day or a week with the lowest, the highest and the
+        last value of every metric. Merging records into a bucket twice
+        gives the same bucket, so buckets can be updated incrementally.
+
+    Attributes:
+        vendor (ForeignKey): Link to the Vendor model.
+        resolution (str): The length of the bucket (hour, day or week).
+        bucket_start (DateTime): Start of the bucket.
+        last_date (DateTime): Date of the record the last values come from.
+        <metric>_min, <metric>_max, <metric>_last (float): For each of
+            on_time_delivery_rate, quality_rating_avg,
+            average_response_time and fulfillment_rate.
+    '''
+    HOUR = 'hour'
+    DAY = 'day'
+    WEEK = 'week'
+    RESOLUTION_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+        (WEEK, 'Week'),
+    ]
+
+    vendor = models.ForeignKey(
+        Vendor, on_delete=models.CASCADE, related_name='performance_rollups')
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    last_date = models.DateTimeField()
+    on_time_delivery_rate_min = models.FloatField()
+    on_time_delivery_rate_max = models.FloatField()
+    on_time_delivery_rate_last = models.FloatField()
+    quality_rating_avg_min = models.FloatField()
+    quality_rating_avg_max = models.FloatField()
+    quality_rating_avg_last = models.FloatField()
+    average_response_time_min = models.FloatField()
+    average_response_time_max = models.FloatField()
+    average_response_time_last = models.FloatField()
+    fulfillment_rate_min = models.FloatField()
+    fulfillment_rate_max = models.FloatField()
+    fulfillment_rate_last = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['vendor', 'resolution', 'bucket_start'],
+                name='unique_performance_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        '''
+        Returns a string representation of the rollup.
+
+        Returns:
+            str: The string representation of the rollup.
+        '''
+        return (
+            f"Performance of vendor {self.vendor_id} for the "
+            f"{self.resolution} starting on {self.bucket_start}")
+
+
+class PerformanceCounter(models.Model):
+    '''
+    Running totals behind a vendor's performance metrics.
+
+    The counters are adjusted with the difference between the old and the
+    new state of a purchase order every time one is saved, so the metrics
+    can be derived without scanning all the orders of the vendor.
+
+    Attributes:
+        vendor (OneToOneField): Link to the Vendor model.
+        total_orders (int): Number of purchase orders of the vendor.
+        completed_orders (int): Number of completed purchase orders.
+        on_time_orders (int): Number of completed purchase orders
+            acknowledged on or before their delivery date.
+        canceled_orders (int): Number of canceled purchase orders.
+        rating_sum (float): Sum of the quality ratings given.
+        rating_count (int): Number of purchase orders with a quality rating.
+        acknowledged_orders (int): Number of acknowledged purchase orders.
+        response_seconds_sum (float): Sum of the seconds taken to
+            acknowledge the acknowledged purchase orders.
+    '''
+    COUNTER_FIELDS = (
+        'total_orders',
+        'completed_orders',
+        'on_time_orders',
+        'canceled_orders',
+        'rating_sum',
+        'rating_count',
+        'acknowledged_orders',
+        'response_seconds_sum',
+    )
+
+    vendor = models.OneToOneField(
+        Vendor,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='performance_counter')
+    total_orders = models.IntegerField(default=0)
+    completed_orders = models.IntegerField(default=0)
+    on_time_orders = models.IntegerField(default=0)
+    canceled_orders = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0.0)
+    rating_count = models.IntegerField(default=0)
+    acknowledged_orders = models.IntegerField(default=0)
+    response_seconds_sum = models.FloatField(default=0.0)
+
+    def __str__(self):
+        '''
+        Returns a string representation of the performance counter.
+
+        Returns:
+            str: The string representation of the performance counter.
+        '''
+        return f"Performance counters for vendor {self.vendor_id}"
+
+    def on_time_delivery_rate(self):
+        '''
+        Returns:
+            float: The share of completed orders delivered on time,
+                or None when no order has been completed.
+        '''
+        if self.completed_orders:
+            return round(self.on_time_orders / self.completed_orders, 2)
+
+    def fulfillment_rate(self):
+        '''
+        Returns:
+            float: The share of orders that were completed,
+                or None when the vendor has no orders.
+        '''
+        if self.total_orders:
+            return round(self.completed_orders / self.total_orders, 2)
+
+    def quality_rating_avg(self):
+        '''
+        Returns:
+            float: The average quality rating,
+                or None when no order has been rated.
+        '''
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 1)
+
+    def average_response_time(self):
+        '''
+        Returns:
+            float: The average acknowledgment time in seconds,
+                or None when no order has been acknowledged.
+        '''
+        if self.acknowledged_orders:
+            return self.response_seconds_sum / self.acknowledged_orders
+
+
+class PendingPerformanceUpdate(models.Model):
+    '''
+    Queue of vendors whose performance metrics are waiting to be
+        recomputed when the metrics are updated in coalesced mode.
+
+    A vendor appears at most once however many of its purchase orders
+        changed, so the metrics are written once per flush.
+
+    Attributes:
+        vendor (OneToOneField): Link to the Vendor model.
+        marked_at (DateTime): When an order of the vendor last changed.
+    '''
+    vendor = models.OneToOneField(
+        Vendor,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pending_performance_update')
+    marked_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # oldest entries first for the flush
+            models.Index(
+                fields=['marked_at'], name='pending_marked_at_idx'),
+        ]
+
+    def __str__(self):
+        '''
+        Returns a string representation of the pending update.
+
+        Returns:
+            str: The string representation of the pending update.
+        '''
+        return f"Pending performance update for vendor {self.vendor_id}"
@@ -0,0 +1,582 @@
+'''
+This module ranks the vendors by each of their performance metrics
+
+Sorting every vendor on each request to find the best ones, or the rank
+of one vendor, costs as much as the table is large. The vendors are kept
+sorted by each metric instead, and updated one vendor at a time whenever
+a vendor is saved (update_performance and the flush of the coalesced
+metrics save the vendor they write) or deleted, once the transaction
+commits. The best vendors and the rank of a vendor are then searched in
+O(log n).
+
+RANKING_BACKEND picks where the sorted vendors live: 'redis', the
+default, keeps one sorted set per metric at RANKING_REDIS_URL, shared by
+every worker, and falls back to 'local' when RANKING_REDIS_URL is empty
+or Redis cannot be reached when the process first ranks. 'local' keeps
+them in sorted lists of the process, read from the database on first
+use. A process moves the vendors it saves itself and logs the move in
+the cache under a version number counted up by every move; the other
+processes (other workers, the flush of the coalesced metrics) replay the
+moves logged since their own version on their next use, so a write costs
+them the O(log n) move of one vendor rather than reading the table
+again. They read the table again only when they fall behind by more than
+MAX_REPLAYED_MOVES, when the cache lost the version, and every
+RANKING_LOCAL_TTL seconds for the vendors written without signals
+(bulk_create, update()). The rebuild_vendor_rankings command has every
+process read them again at once.
+
+Vendors with the same value share a rank, the next one is ranked after
+all of them (1, 2, 2, 4). The percentile of a vendor is the share of the
+other vendors ranked below it, 100 for the best one. A vendor without
+acknowledged orders keeps the 0.0 default of its average response time,
+which is not a measure: it is not ranked by the response time until an
+order is acknowledged.
+'''
+import bisect
+import logging
+import math
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import Vendor, HistoricalPerformance
+
+logger = logging.getLogger(__name__)
+
+METRIC_FIELDS = HistoricalPerformance.METRIC_FIELDS
+# metrics the vendors are ranked by from the lowest value, the others
+# from the highest
+ASCENDING_FIELDS = ('average_response_time',)
+# rows read per query when the rankings are rebuilt
+REBUILD_CHUNK_SIZE = 5000
+# moves of other processes replayed by a local ranking, behind by more it
+# reads the rankings again
+MAX_REPLAYED_MOVES = 1000
+# the version counter starts at a random number below this, so that a
+# counter lost by the cache and counted again from elsewhere cannot be
+# mistaken for the previous one
+VERSION_BASE_RANGE = 1 << 48
+# seconds to wait for Redis to accept a connection
+REDIS_CONNECT_TIMEOUT = 1
+
+
+def sort_key(metric, value):
+    '''
+    Returns:
+        float: The value of a metric, negated for the metrics ranked from
+            the highest value, so that the best vendor sorts first.
+    '''
+    value = float(value)
+    return value if metric in ASCENDING_FIELDS else -value
+
+
+def ranked_values(values, acknowledged_orders):
+    '''
+    Parameters:
+        values (dict): The value of each metric of a vendor.
+        acknowledged_orders (int): The number of acknowledged orders of
+            the vendor, None when it has no counters.
+
+    Returns:
+        dict: The values the vendor is ranked by, the average response
+            time is None when no order was acknowledged, the vendor is
+            then left out of its ranking.
+    '''
+    if not acknowledged_orders:
+        values = {**values, 'average_response_time': None}
+    return values
+
+
+def metric_value(metric, key):
+    '''
+    Returns:
+        float: The value of a metric from its sort key.
+    '''
+    return key if metric in ASCENDING_FIELDS else -key
+
+
+def percentile(below, total):
+    '''
+    Parameters:
+        below (int): The number of vendors ranked below the vendor.
+        total (int): The number of vendors ranked.
+
+    Returns:
+        float: The share of the other vendors ranked below the vendor,
+            in percent.
+    '''
+    if total <= 1:
+        return 100.0
+    return round(100 * below / (total - 1), 2)
+
+
+def version_key():
+    '''
+    Returns:
+        str: The key of the cache holding the version of the rankings.
+    '''
+    return f'{settings.RANKING_KEY_PREFIX}version'
+
+
+def move_key(version):
+    '''
+    Returns:
+        str: The key of the cache holding the move of a version.
+    '''
+    return f'{settings.RANKING_KEY_PREFIX}move:{version}'
+
+
+def read_version():
+    '''
+    Returns:
+        int: The version of the rankings, None when the cache lost it.
+    '''
+    return cache.get(version_key())
+
+
+def start_version():
+    '''
+    Start counting the versions of the rankings unless they are counted.
+
+    Returns:
+        int: The version of the rankings.
+    '''
+    cache.add(
+        version_key(), random.randrange(VERSION_BASE_RANGE), timeout=None)
+    return read_version()
+
+
+def publish_move(vendor_id, values):
+    '''
+    Log the move of a vendor under a new version of the rankings, for the
+        processes holding local rankings to replay it.
+
+    Parameters:
+        vendor_id (int): The vendor, None to have every process read its
+            rankings again.
+        values (dict): The values the vendor is ranked by, None for the
+            metrics it is no longer ranked by.
+
+    Returns:
+        int: The version of the move.
+    '''
+    start_version()
+    version = cache.incr(version_key())
+    # a process whose rankings are older than RANKING_LOCAL_TTL reads them
+    # again, the move is not needed longer
+    cache.set(
+        move_key(version), (vendor_id, values),
+        timeout=settings.RANKING_LOCAL_TTL)
+    return version
+
+
+def stored_metrics():
+    '''
+    Read the metrics of every vendor from the database, in chunks.
+
+    Yields:
+        tuple: The id of a vendor and the values it is ranked by, see
+            ranked_values.
+    '''
+    last_id = 0
+    while True:
+        rows = list(Vendor.objects.filter(id__gt=last_id).order_by(
+            'id').values_list(
+            'id', 'performance_counter__acknowledged_orders',
+            *METRIC_FIELDS)[:REBUILD_CHUNK_SIZE])
+        for vendor_id, acknowledged_orders, *values in rows:
+            yield vendor_id, ranked_values(
+                dict(zip(METRIC_FIELDS, values)), acknowledged_orders)
+        if len(rows) < REBUILD_CHUNK_SIZE:
+            return
+        last_id = rows[-1][0]
+
+
+def ranked_entries(metric, entries, offset, first_rank):
+    '''
+    Rank consecutive entries of a ranking.
+
+    Parameters:
+        metric (str): The metric.
+        entries (list): The sort keys and vendor ids, in order.
+        offset (int): The position of the first entry in the ranking.
+        first_rank (int): The rank of the first entry.
+
+    Returns:
+        list: The rank, vendor id and value of every entry.
+    '''
+    ranked = []
+    rank = first_rank
+    for position, (key, vendor_id) in enumerate(entries):
+        if position and key != entries[position - 1][0]:
+            rank = offset + position + 1
+        ranked.append({
+            'rank': rank,
+            'vendor_id': vendor_id,
+            'value': metric_value(metric, key)})
+    return ranked
+
+
+class LocalRanking:
+    '''
+    The rankings of the process, in memory.
+
+    Attributes:
+        entries (dict): For each metric, the sort keys and vendor ids
+            sorted from the best vendor.
+        keys (dict): For each metric, the sort key of every vendor.
+        built (bool): False until the vendors are read from the database.
+        version (int): The version of the last move in the rankings.
+        built_at (float): The monotonic time they were read at.
+    '''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries = {metric: [] for metric in METRIC_FIELDS}
+        self.keys = {metric: {} for metric in METRIC_FIELDS}
+        self.built = False
+        self.version = None
+        self.built_at = 0.0
+
+    def rebuild(self):
+        '''
+        Read the rankings from the metrics stored in the database.
+        '''
+        # read first, so that a vendor moved during the rebuild is
+        # replayed, which leaves a vendor read with its move as it is
+        version = start_version()
+        built_at = time.monotonic()
+        entries = {metric: [] for metric in METRIC_FIELDS}
+        keys = {metric: {} for metric in METRIC_FIELDS}
+        for vendor_id, values in stored_metrics():
+            for metric, value in values.items():
+                if value is None:
+                    continue
+                key = sort_key(metric, value)
+                entries[metric].append((key, vendor_id))
+                keys[metric][vendor_id] = key
+        for metric_entries in entries.values():
+            metric_entries.sort()
+        with self.lock:
+            self.entries, self.keys, self.built = entries, keys, True
+            self.version, self.built_at = version, built_at
+
+    def is_expired(self):
+        '''
+        Returns:
+            bool: Whether the rankings were not read yet, or were read
+                more than RANKING_LOCAL_TTL seconds ago.
+        '''
+        return (
+            not self.built or
+            time.monotonic() - self.built_at >= settings.RANKING_LOCAL_TTL)
+
+    def ensure_built(self):
+        '''
+        Bring the rankings up to date: read them when they expired,
+            replay the moves of the other processes otherwise.
+        '''
+        if not self.is_expired() and read_version() == self.version:
+            return
+        with self.lock:
+            if self.is_expired() or not self.replay(read_version()):
+                self.rebuild()
+
+    def replay(self, version):
+        '''
+        Move the vendors the other processes moved since the version of
+            the rankings, up to a version.
+
+        A move not logged yet is replayed on the next use.
+
+        Returns:
+            bool: False when the moves cannot be replayed and the
+                rankings must be read again: the cache lost the version,
+                they are too many or one asks for a rebuild.
+        '''
+        if version == self.version:
+            return True
+        if (version is None or self.version is None or
+                not 0 < version - self.version <= MAX_REPLAYED_MOVES):
+            return False
+        keys = [
+            move_key(logged)
+            for logged in range(self.version + 1, version + 1)]
+        moves = cache.get_many(keys)
+        for key in keys:
+            if key not in moves:
+                break
+            vendor_id, values = moves[key]
+            if vendor_id is None:
+                return False
+            self.move(vendor_id, values)
+            self.version += 1
+        return True
+
+    def publish(self, vendor_id=None, values=None):
+        '''
+        Log a move of the process for the other processes, by default a
+            rebuild, keeping its own rankings when they were current.
+        '''
+        version = publish_move(vendor_id, values)
+        with self.lock:
+            if self.built and self.version == version - 1:
+                self.version = version
+
+    def update(self, vendor_id, values):
+        '''
+        Move a vendor to the place of its new metrics.
+
+        Parameters:
+            vendor_id (int): The vendor.
+            values (dict): The value of each metric, None for the
+                metrics the vendor is not ranked by.
+        '''
+        with self.lock:
+            # when not built, read with the change once the rankings are
+            # used
+            if self.built:
+                self.move(vendor_id, values)
+        self.publish(vendor_id, values)
+
+    def move(self, vendor_id, values):
+        '''
+        Move a vendor in the rankings of the process, a move replayed
+            again leaves them as they are.
+        '''
+        for metric, value in values.items():
+            key = None if value is None else sort_key(metric, value)
+            previous = self.keys[metric].get(vendor_id)
+            if previous == key:
+                continue
+            entries = self.entries[metric]
+            if previous is not None:
+                del entries[bisect.bisect_left(
+                    entries, (previous, vendor_id))]
+            if key is None:
+                del self.keys[metric][vendor_id]
+            else:
+                bisect.insort(entries, (key, vendor_id))
+                self.keys[metric][vendor_id] = key
+
+    def remove(self, vendor_id):
+        '''
+        Take a deleted vendor out of the rankings.
+        '''
+        self.update(vendor_id, dict.fromkeys(METRIC_FIELDS))
+
+    def top(self, metric, limit, offset=0):
+        '''
+        Parameters:
+            metric (str): The metric the vendors are ranked by.
+            limit (int): The number of vendors.
+            offset (int): The number of better vendors skipped.
+
+        Returns:
+            tuple: The number of vendors ranked, and the rank, vendor id
+                and value of the vendors from the offset.
+        '''
+        self.ensure_built()
+        with self.lock:
+            entries = self.entries[metric]
+            page = entries[offset:offset + limit]
+            if not page:
+                return len(entries), []
+            first_rank = bisect.bisect_left(entries, (page[0][0],)) + 1
+            return len(entries), ranked_entries(
+                metric, page, offset, first_rank)
+
+    def rank(self, metric, vendor_id):
+        '''
+        Returns:
+            dict: The value, rank and percentile of a vendor for a
+                metric, None if the vendor is not ranked.
+        '''
+        self.ensure_built()
+        with self.lock:
+            key = self.keys[metric].get(vendor_id)
+            if key is None:
+                return None
+            entries = self.entries[metric]
+            better = bisect.bisect_left(entries, (key,))
+            below = len(entries) - bisect.bisect_right(
+                entries, (key, math.inf))
+            return {
+                'value': metric_value(metric, key),
+                'rank': better + 1,
+                'percentile': percentile(below, len(entries))}
+
+    def size(self):
+        '''
+        Returns:
+            int: The number of vendors ranked.
+        '''
+        self.ensure_built()
+        with self.lock:
+            return len(self.keys[METRIC_FIELDS[0]])
+
+
+class RedisRanking:
+    '''
+    The rankings in Redis, one sorted set per metric scored by the sort
+        key of the vendors, shared by every process.
+
+    The sorted sets are rebuilt by the first read that does not find
+        them, such as after Redis lost its data.
+    '''
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(
+            url, socket_connect_timeout=REDIS_CONNECT_TIMEOUT)
+        self.prefix = settings.RANKING_KEY_PREFIX
+        self.built_key = f'{self.prefix}built'
+
+    def key(self, metric):
+        return f'{self.prefix}{metric}'
+
+    def rebuild(self):
+        '''
+        Read the rankings from the metrics stored in the database into
+            new sorted sets, which then replace the current ones.
+        '''
+        building = {
+            metric: f'{self.key(metric)}:building'
+            for metric in METRIC_FIELDS}
+        self.client.delete(*building.values())
+        pipeline = self.client.pipeline(transaction=False)
+        for count, (vendor_id, values) in enumerate(stored_metrics(), 1):
+            for metric, value in values.items():
+                if value is not None:
+                    pipeline.zadd(building[metric], {
+                        vendor_id: sort_key(metric, value)})
+            if count % REBUILD_CHUNK_SIZE == 0:
+                pipeline.execute()
+        pipeline.execute()
+        pipeline = self.client.pipeline()
+        for metric, key in building.items():
+            # RENAME fails on a missing key, when there is no vendor
+            pipeline.delete(self.key(metric))
+            pipeline.zunionstore(self.key(metric), [key])
+            pipeline.delete(key)
+        pipeline.set(self.built_key, 1)
+        pipeline.execute()
+
+    def ensure_built(self):
+        if not self.client.exists(self.built_key):
+            self.rebuild()
+
+    def update(self, vendor_id, values):
+        pipeline = self.client.pipeline(transaction=False)
+        for metric, value in values.items():
+            if value is None:
+                pipeline.zrem(self.key(metric), vendor_id)
+            else:
+                pipeline.zadd(
+                    self.key(metric), {vendor_id: sort_key(metric, value)})
+        pipeline.execute()
+
+    def remove(self, vendor_id):
+        pipeline = self.client.pipeline(transaction=False)
+        for metric in METRIC_FIELDS:
+            pipeline.zrem(self.key(metric), vendor_id)
+        pipeline.execute()
+
+    def top(self, metric, limit, offset=0):
+        self.ensure_built()
+        key = self.key(metric)
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.zcard(key)
+        pipeline.zrange(key, offset, offset + limit - 1, withscores=True)
+        total, page = pipeline.execute()
+        if not page:
+            return total, []
+        entries = [(score, int(member)) for member, score in page]
+        better = self.client.zcount(key, '-inf', f'({entries[0][0]!r}')
+        return total, ranked_entries(metric, entries, offset, better + 1)
+
+    def rank(self, metric, vendor_id):
+        self.ensure_built()
+        key = self.key(metric)
+        score = self.client.zscore(key, vendor_id)
+        if score is None:
+            return None
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.zcard(key)
+        pipeline.zcount(key, '-inf', f'({score!r}')
+        pipeline.zcount(key, f'({score!r}', '+inf')
+        total, better, below = pipeline.execute()
+        return {
+            'value': metric_value(metric, score),
+            'rank': better + 1,
+            'percentile': percentile(below, total)}
+
+    def size(self):
+        self.ensure_built()
+        return self.client.zcard(self.key(METRIC_FIELDS[0]))
+
+
+_ranking = None
+_lock = threading.Lock()
+
+
+def get_ranking():
+    '''
+    Returns:
+        LocalRanking: The rankings of the process, of the type set by
+            RANKING_BACKEND.
+    '''
+    global _ranking
+    with _lock:
+        if _ranking is None:
+            _ranking = create_ranking()
+        return _ranking
+
+
+def create_ranking():
+    '''
+    Returns:
+        LocalRanking: The rankings of the type set by RANKING_BACKEND,
+            local when Redis has no url or cannot be reached.
+    '''
+    if settings.RANKING_BACKEND == 'redis':
+        if not settings.RANKING_REDIS_URL:
+            logger.warning(
+                'RANKING_REDIS_URL is not set, the rankings are kept in '
+                'each process')
+            return LocalRanking()
+        try:
+            ranking = RedisRanking(settings.RANKING_REDIS_URL)
+            ranking.client.ping()
+            return ranking
+        except Exception:
+            logger.warning(
+                'Redis cannot be reached at RANKING_REDIS_URL, the '
+                'rankings are kept in each process', exc_info=True)
+    return LocalRanking()
+
+
+def update_vendor(vendor_id, values):
+    '''
+    Rank a vendor by its new metrics, failures are logged rather than
+        raised so that the change of the vendor is not affected.
+
+    Parameters:
+        vendor_id (int): The vendor.
+        values (dict): The values it is ranked by, see ranked_values.
+    '''
+    try:
+        get_ranking().update(vendor_id, values)
+    except Exception:
+        logger.exception('Could not rank the vendor %s', vendor_id)
+
+
+def remove_vendor(vendor_id):
+    '''
+    Take a deleted vendor out of the rankings, failures are logged.
+    '''
+    try:
+        get_ranking().remove(vendor_id)
+    except Exception:
+        logger.exception('Could not unrank the vendor %s', vendor_id)
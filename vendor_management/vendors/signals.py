@@ -0,0 +1,69 @@
+'''
+signals keeping the cached vendor data fresh
+'''
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from vendor_management.cache import (
+    invalidate, vendor_key, performance_key, count_key, history_key)
+from vendors.models import Vendor
+from vendors import ranking
+
+
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Vendor)
+def evict_vendor(sender, instance, **kwargs):
+    '''
+    Evict the cached details and performance of a vendor that was saved
+        or deleted, including when its metrics are written by
+        update_performance, and the vendor count and the last
+        history snapshot when one is created or deleted.
+
+    Parameters:
+        sender: The sender of the signal.
+        instance (Vendor): The vendor that changed.
+    '''
+    keys = [vendor_key(instance.pk), performance_key(instance.pk)]
+    # post_delete sends no created flag
+    if kwargs.get('created', True):
+        keys += [count_key(Vendor), history_key(instance.pk)]
+    invalidate(keys)
+
+
+@receiver(post_save, sender=Vendor)
+def rank_vendor(sender, instance, **kwargs):
+    '''
+    Move a saved vendor to the place of its metrics in the rankings once
+        the transaction commits, see ranking.py.
+
+    Parameters:
+        sender: The sender of the signal.
+        instance (Vendor): The vendor that was saved.
+    '''
+    vendor_id = instance.pk
+    values = {
+        field: getattr(instance, field) for field in ranking.METRIC_FIELDS}
+    # the metric writers attach the counters of the vendor
+    if Vendor.performance_counter.is_cached(instance):
+        values = ranking.ranked_values(
+            values, instance.performance_counter.acknowledged_orders)
+    elif kwargs.get('created'):
+        values = ranking.ranked_values(values, 0)
+    else:
+        # saved outside the metric writers, the response time is unchanged
+        del values['average_response_time']
+    transaction.on_commit(lambda: ranking.update_vendor(vendor_id, values))
+
+
+@receiver(post_delete, sender=Vendor)
+def unrank_vendor(sender, instance, **kwargs):
+    '''
+    Take a deleted vendor out of the rankings once the transaction
+        commits.
+
+    Parameters:
+        sender: The sender of the signal.
+        instance (Vendor): The vendor that was deleted.
+    '''
+    vendor_id = instance.pk
+    transaction.on_commit(lambda: ranking.remove_vendor(vendor_id))
@@ -0,0 +1,171 @@
+'''
+This module streams the changes of the vendor performance metrics as
+Server-Sent Events
+
+The stream is an async view served through ASGI (vendor_management/asgi.py)
+so that an open stream costs a queue rather than a worker. A dashboard
+keeps one stream open instead of polling view_performance.
+
+Browsers cannot set headers on an EventSource, so rather than the API
+token, which would be written to the access logs with the URL, the
+stream accepts a ticket: a signed user id valid for SSE_TICKET_SECONDS
+and only for the streams, which the client asks for with its token.
+'''
+import asyncio
+import json
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse)
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from users.authentication import CachedTokenAuthentication
+from vendor_management import broadcast
+from .events import PERFORMANCE_CHANNEL
+
+# the tickets of the streams are not valid for anything else signed
+TICKET_SALT = 'vendors.streams.ticket'
+
+
+async def authenticate(request):
+    '''
+    Authenticate a stream with the token of the Authorization header,
+        or with the `ticket` query parameter.
+
+    Returns:
+        User: The user, or None if the token or the ticket is missing,
+            invalid or expired.
+    '''
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(header) == 2 and header[0].lower() == 'token':
+        try:
+            user, token = await (
+                CachedTokenAuthentication().aauthenticate_credentials(
+                    header[1]))
+        except AuthenticationFailed:
+            return None
+        return user
+    ticket = request.GET.get('ticket')
+    if not ticket:
+        return None
+    try:
+        user_id = signing.TimestampSigner(salt=TICKET_SALT).unsign(
+            ticket, max_age=settings.SSE_TICKET_SECONDS)
+    except signing.BadSignature:
+        return None
+    return await get_user_model().objects.filter(
+        pk=user_id, is_active=True).afirst()
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def stream_ticket(request):
+    '''
+    Issue a ticket opening the performance stream, since an EventSource
+        cannot send the token.
+
+    Parameters:
+    - request: The HTTP request object.
+
+    Returns:
+    - Response: The ticket and the seconds it is valid for. It is
+        checked when a stream opens, a client reconnecting later asks
+        for a new one.
+    '''
+    ticket = signing.TimestampSigner(salt=TICKET_SALT).sign(
+        str(request.user.pk))
+    return Response(
+        {'ticket': ticket, 'expires_in': settings.SSE_TICKET_SECONDS})
+
+
+def server_event(name, data):
+    '''
+    Returns:
+        str: An event in the text/event-stream format.
+    '''
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+async def performance_events(subscription, vendor_ids):
+    '''
+    Yield the performance changes until the stream has been open for
+        SSE_MAX_SECONDS, then let the client reconnect, so that streams
+        of clients gone are not kept forever.
+
+    Parameters:
+        subscription (Subscription): The performance channel.
+        vendor_ids (set): Only stream the changes of these vendors,
+            all of them when empty.
+
+    Yields:
+        str: The events, and a comment every SSE_KEEPALIVE_SECONDS
+            without change so that proxies keep the connection open.
+    '''
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SSE_MAX_SECONDS
+    try:
+        yield f'retry: {settings.SSE_RETRY_MS}\n\n'
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(),
+                    min(settings.SSE_KEEPALIVE_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if vendor_ids and event['vendor_id'] not in vendor_ids:
+                continue
+            yield server_event('performance', event)
+    finally:
+        subscription.close()
+
+
+async def stream_performance(request):
+    '''
+    Stream the changes of the performance metrics of the vendors.
+
+    Each change is a `performance` event whose data holds the vendor id,
+        the date and the four metrics. `vendor_id=1,2` restricts the
+        stream to some vendors.
+
+    Parameters:
+    - request: The HTTP request object.
+
+    Returns:
+    - A text/event-stream response, 401 without a valid token or
+        ticket, or 501
+        when the application is not served through ASGI.
+    '''
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if await authenticate(request) is None:
+        return JsonResponse(
+            {'detail': 'Invalid or missing token.'}, status=401)
+    try:
+        vendor_ids = {
+            int(vendor_id)
+            for vendor_id in request.GET.get('vendor_id', '').split(',')
+            if vendor_id}
+    except ValueError:
+        return JsonResponse(
+            {'detail': 'vendor_id must be a list of ids.'}, status=400)
+    if not isinstance(request, ASGIRequest):
+        # WSGI reads a streamed body to its end before sending it
+        return JsonResponse(
+            {'detail': 'Streams are only served through ASGI.'}, status=501)
+
+    subscription = broadcast.get_broadcaster().subscribe(PERFORMANCE_CHANNEL)
+    response = StreamingHttpResponse(
+        performance_events(subscription, vendor_ids),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would buffer the events otherwise
+    response['X-Accel-Buffering'] = 'no'
+    return response
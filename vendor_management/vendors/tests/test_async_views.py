@@ -0,0 +1,150 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+import redis.asyncio as aioredis
+from vendor_management import async_cache
+from vendor_management.cache import vendor_key, performance_key
+from vendor_management.testing import AsyncViewTestMixin
+from vendors.models import Vendor
+from vendors import async_views, history
+
+
+class VendorAsyncViewsTest(AsyncViewTestMixin, TestCase):
+    '''
+    test that the async views answer as the sync views
+    '''
+
+    def setUp(self):
+        """Set up non-modified objects used by all test methods."""
+        cache.clear()
+        for index in range(3):
+            self.vendor = Vendor.objects.create(
+                name=f"Test Vendor {index}",
+                contact_details="test@example.com",
+                address="123 Test Street",
+            )
+        history.record_snapshot(self.vendor, on_time_delivery_rate=0.5)
+        user = User.objects.create_user(username='bon', password='pass')
+        token = Token.objects.create(user=user).key
+        self.headers = {'Authorization': f'Token {token}'}
+
+    def test_list(self):
+        """Test the page numbered and the keyset listings."""
+        url = reverse('create_or_list_vendor')
+        for params in (
+                {}, {'page': 2, 'page_size': 1}, {'page': 9, 'page_size': 2},
+                {'page': 'a'}, {'exact_count': 'false'},
+                {'cursor': 'true', 'page_size': 2}, {'after': 'wrong'},
+                {'include': 'metrics,order_counts', 'page_size': 2},
+                {'ordering': '-name', 'min_total_orders': 0},
+                {'include': 'unknown'}, {'page_size': 'abc'},
+                {'page_size': 0}):
+            self.assertSameResponse(
+                async_views.create_or_list_vendor, url, params, self.headers)
+        next_cursor = self.client.get(
+            url, {'cursor': 'true', 'page_size': 2},
+            headers=self.headers).json()['next_cursor']
+        self.assertSameResponse(
+            async_views.create_or_list_vendor, url,
+            {'after': next_cursor, 'page_size': 2}, self.headers)
+
+    def test_detail(self):
+        """Test the details, their conditional requests and errors."""
+        url = reverse('get_or_update_vendor', args=[self.vendor.id])
+        response = self.assertSameResponse(
+            async_views.get_or_update_vendor, url, headers=self.headers,
+            evict=[vendor_key(self.vendor.id)], vendor_id=self.vendor.id)
+        self.assertEqual(response.status_code, 200)
+        # served from the cache
+        with self.assertNumQueries(0):
+            self.assertSameResponse(
+                async_views.get_or_update_vendor, url, headers=self.headers,
+                vendor_id=self.vendor.id)
+        conditional = dict(
+            self.headers, **{'If-None-Match': response['ETag']})
+        response = self.assertSameResponse(
+            async_views.get_or_update_vendor, url, headers=conditional,
+            vendor_id=self.vendor.id)
+        self.assertEqual(response.status_code, 304)
+
+        missing = reverse('get_or_update_vendor', args=[0])
+        response = self.assertSameResponse(
+            async_views.get_or_update_vendor, missing, headers=self.headers,
+            vendor_id=0)
+        self.assertEqual(response.status_code, 404)
+        response = self.assertSameResponse(
+            async_views.get_or_update_vendor, url, vendor_id=self.vendor.id)
+        self.assertEqual(response.status_code, 401)
+        self.assertSameResponse(
+            async_views.get_or_update_vendor, url,
+            headers={'Authorization': 'Token wrong'},
+            vendor_id=self.vendor.id)
+
+    def test_performance(self):
+        """Test the cached and the live metrics."""
+        url = reverse('view_performance', args=[self.vendor.id])
+        key = performance_key(self.vendor.id)
+        response = self.assertSameResponse(
+            async_views.view_performance, url, headers=self.headers,
+            evict=[key], vendor_id=self.vendor.id)
+        self.assertIn('Last-Modified', response)
+        for params in ({'live': 'true'}, {'resolution': 'raw'}):
+            self.assertSameResponse(
+                async_views.view_performance, url, params, self.headers,
+                vendor_id=self.vendor.id)
+        missing = reverse('view_performance', args=[0])
+        for params in (None, {'live': 'true'}):
+            response = self.assertSameResponse(
+                async_views.view_performance, missing, params, self.headers,
+                vendor_id=0)
+            self.assertEqual(response.status_code, 404)
+
+    def test_other_methods_are_delegated(self):
+        """Test that the changes and the browsable API are left to the
+        sync views."""
+        url = reverse('get_or_update_vendor', args=[self.vendor.id])
+        response = self.async_request(
+            async_views.get_or_update_vendor, url, {'name': 'Renamed'},
+            self.headers, method='put', vendor_id=self.vendor.id)
+        self.assertEqual(response.status_code, 201)
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.name, 'Renamed')
+        response = self.async_request(
+            async_views.get_or_update_vendor, url,
+            headers=dict(self.headers, Accept='text/html'),
+            vendor_id=self.vendor.id)
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+
+
+class AsyncCacheClientTest(SimpleTestCase):
+    '''
+    test the redis.asyncio client of the async views
+    '''
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'rediss://cache.example.com:6380/1,'
+                    'rediss://replica.example.com:6380/1',
+        'OPTIONS': {
+            'PASSWORD': 'secret',
+            'SOCKET_TIMEOUT': 2,
+            'CONNECTION_POOL_KWARGS': {
+                'max_connections': 5, 'ssl_cert_reqs': 'none'},
+        },
+    }})
+    def test_cache_options(self):
+        """Test that the client connects to the primary server with the
+        options of the cache."""
+        redis = async_cache.redis_client()
+        pool = redis.connection_pool
+        self.assertIs(pool.connection_class, aioredis.SSLConnection)
+        self.assertEqual(pool.max_connections, 5)
+        kwargs = pool.connection_kwargs
+        self.assertEqual(kwargs['host'], 'cache.example.com')
+        self.assertEqual(kwargs['port'], 6380)
+        self.assertEqual(kwargs['db'], 1)
+        self.assertEqual(kwargs['password'], 'secret')
+        self.assertEqual(kwargs['socket_timeout'], 2)
+        self.assertEqual(kwargs['ssl_cert_reqs'], 'none')
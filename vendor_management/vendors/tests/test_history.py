@@ -0,0 +1,119 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import APIClient
+from datetime import timedelta
+from io import StringIO
+from vendors.models import Vendor, HistoricalPerformance, PerformanceRollup
+from vendors import history
+
+
+class PerformanceHistoryTest(TestCase):
+    '''
+    test the change-only recording and the compaction of the history
+    '''
+
+    def setUp(self):
+        """Set up non-modified objects used by all test methods."""
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            contact_details="test@example.com",
+            address="123 Test Street",
+        )
+        # midday, so that minutes apart records share their hour and day
+        self.old = timezone.localtime(
+            timezone.now() - timedelta(days=60)).replace(
+            hour=12, minute=0, second=0, microsecond=0)
+
+    def record(self, date, rate):
+        record = HistoricalPerformance.objects.create(
+            vendor=self.vendor,
+            on_time_delivery_rate=rate,
+            quality_rating_avg=4.0,
+            average_response_time=10.0,
+            fulfillment_rate=0.5)
+        HistoricalPerformance.objects.filter(id=record.id).update(date=date)
+        return record
+
+    def test_unchanged_metrics_are_not_recorded(self):
+        """Test that a snapshot equal to the last one is not written."""
+        self.assertIsNotNone(history.record_snapshot(
+            self.vendor, on_time_delivery_rate=0.5))
+        self.assertIsNone(history.record_snapshot(
+            self.vendor, on_time_delivery_rate=0.5))
+        # the values missing are carried forward
+        self.assertIsNone(history.record_snapshot(self.vendor))
+        self.assertIsNotNone(history.record_snapshot(
+            self.vendor, fulfillment_rate=1.0))
+        self.assertEqual(HistoricalPerformance.objects.count(), 2)
+
+    def test_compact(self):
+        """Test that old records are folded into the rollups
+        and deleted, except the last one of the vendor."""
+        for minutes, rate in ((1, 0.5), (2, 0.25), (3, 0.75)):
+            self.record(self.old + timedelta(minutes=minutes), rate)
+        out = StringIO()
+        call_command('compact_vendor_history', '--days', '30', stdout=out)
+        self.assertIn('Compacted 3', out.getvalue())
+        self.assertEqual(HistoricalPerformance.objects.count(), 1)
+        self.assertEqual(PerformanceRollup.objects.filter(
+            vendor=self.vendor).count(), 3)
+        hour = PerformanceRollup.objects.get(resolution='hour')
+        self.assertEqual(hour.on_time_delivery_rate_min, 0.25)
+        self.assertEqual(hour.on_time_delivery_rate_max, 0.75)
+        self.assertEqual(hour.on_time_delivery_rate_last, 0.75)
+
+        # compacting the kept record again does not change the buckets
+        history.compact(30)
+        hour.refresh_from_db()
+        self.assertEqual(hour.on_time_delivery_rate_min, 0.25)
+        self.assertEqual(PerformanceRollup.objects.count(), 3)
+
+    def test_series_resolution(self):
+        """Test that a range is read at the best resolution and merges
+        the rollups with the records not compacted yet."""
+        self.record(self.old, 0.5)
+        self.record(self.old + timedelta(minutes=1), 0.25)
+        history.compact(30)
+        self.record(timezone.now(), 1.0)
+
+        end = timezone.now() + timedelta(minutes=1)
+        resolution, points = history.series(
+            self.vendor.id, end - timedelta(hours=1), end)
+        self.assertEqual(resolution, history.RAW)
+        self.assertEqual(len(points), 1)
+        self.assertEqual(points[0]['on_time_delivery_rate'], 1.0)
+
+        resolution, points = history.series(
+            self.vendor.id, self.old - timedelta(days=1), end)
+        self.assertEqual(resolution, PerformanceRollup.DAY)
+        self.assertEqual(len(points), 2)
+        self.assertEqual(points[0]['on_time_delivery_rate_min'], 0.25)
+        self.assertEqual(points[0]['on_time_delivery_rate_max'], 0.5)
+        self.assertEqual(points[-1]['on_time_delivery_rate'], 1.0)
+
+    def test_view_performance_range(self):
+        """Test the range reads of the performance endpoints."""
+        client = APIClient()
+        client.post(
+            reverse('user-registration'),
+            {'username': 'bon', 'password': 'firefox123'}, format='json')
+        token = client.post(
+            reverse('user-login'),
+            {'username': 'bon', 'password': 'firefox123'},
+            format='json').data['token']
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.record(timezone.now(), 0.5)
+
+        for name in ('view_performance', 'get_performance'):
+            url = reverse(name, kwargs={'vendor_id': self.vendor.id})
+            response = client.get(url, {'resolution': 'week'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['resolution'], 'week')
+            self.assertEqual(len(response.data['data']), 1)
+
+            response = client.get(url, {'start': 'yesterday'})
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST)
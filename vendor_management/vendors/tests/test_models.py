@@ -4,6 +4,7 @@ from django.db.utils import IntegrityError
 from django.utils import timezone
 from datetime import datetime
 from vendors.models import Vendor, HistoricalPerformance
+from purchase.models import PurchaseOrder
 
 
 class VendorModelTest(TestCase):
@@ -120,6 +121,18 @@ class HistoricalPerformanceModelTest(TestCase):
         self.assertEqual(performance.average_response_time, 1.5)
         self.assertEqual(performance.fulfillment_rate, 0.85)
 
+    def test_carry_forward_without_lookup(self):
+        """Test that the values are carried forward from the cached
+        last record, without querying it."""
+        with self.captureOnCommitCallbacks(execute=True):
+            HistoricalPerformance.objects.create(
+                vendor=self.vendor, fulfillment_rate=0.5)
+        with self.assertNumQueries(1):
+            performance = HistoricalPerformance.objects.create(
+                vendor=self.vendor)
+        self.assertEqual(performance.fulfillment_rate, 0.5)
+        self.assertEqual(performance.quality_rating_avg, 4.5)
+
     def test_date_auto_now(self):
         """Test that the date field is automatically set to the
             current date and time."""
@@ -160,3 +173,51 @@ class HistoricalPerformanceModelTest(TestCase):
         self.assertTrue(
             self.performance in self.vendor.historicalperformance_set.all())
         self.assertEqual(self.vendor, self.performance.vendor)
+
+
+class VendorLiveMetricsTest(TestCase):
+    def setUp(self):
+        """Set up non-modified objects used by all test methods."""
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            contact_details="test@example.com",
+            address="123 Test Street",
+        )
+        self.idle_vendor = Vendor.objects.create(
+            name="Idle Vendor",
+            contact_details="idle@example.com",
+            address="456 Idle Street",
+        )
+        now = timezone.now()
+        for status_, delivery, rating in (
+                ('Completed', now + timezone.timedelta(days=1), 4.0),
+                ('Completed', now - timezone.timedelta(days=1), 2.0),
+                ('Canceled', now, None),
+                ('Pending', now, None)):
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                delivery_date=delivery,
+                items={"item1": 10},
+                quantity=10,
+                status=status_,
+                quality_rating=rating,
+            )
+
+    def test_all_metrics_in_one_query(self):
+        """Test that the four metrics of every vendor come
+        from a single query."""
+        with self.assertNumQueries(1):
+            vendors = list(
+                Vendor.objects.with_live_metrics().order_by('id'))
+        vendor, idle_vendor = vendors
+        self.assertEqual(vendor.live_total_orders, 4)
+        self.assertEqual(vendor.live_on_time_delivery_rate, 0.5)
+        self.assertEqual(vendor.live_fulfillment_rate, 0.5)
+        self.assertEqual(vendor.live_quality_rating_avg, 3.0)
+        self.assertEqual(vendor.live_acknowledged_orders, 3)
+        self.assertIsNotNone(vendor.live_average_response_time)
+
+        self.assertEqual(idle_vendor.live_total_orders, 0)
+        self.assertIsNone(idle_vendor.live_fulfillment_rate)
+        self.assertIsNone(idle_vendor.live_quality_rating_avg)
+        self.assertIsNone(idle_vendor.live_average_response_time)
@@ -0,0 +1,53 @@
+from django.http import QueryDict
+from django.test import TestCase
+from django.utils import timezone
+from vendors.listing import vendor_listing
+from vendors.models import HistoricalPerformance, PendingPerformanceUpdate
+from vendor_management.testing import QueryPlanTestMixin
+
+
+class VendorQueryPlanTest(QueryPlanTestMixin, TestCase):
+    '''
+    test that the hot history and listing queries search an index
+    '''
+
+    def test_last_snapshot(self):
+        """Test the last record of a vendor is read from the index."""
+        self.assertUsesIndex(
+            HistoricalPerformance.objects.filter(vendor_id=1).order_by(
+                '-date').values(*HistoricalPerformance.METRIC_FIELDS)[:1],
+            'history_vendor_date_idx')
+
+    def test_history_range(self):
+        """Test a range of the history is read in order from the index."""
+        now = timezone.now()
+        self.assertUsesIndex(
+            HistoricalPerformance.objects.filter(
+                vendor_id=1, date__gte=now, date__lte=now).order_by(
+                'date', 'id'),
+            'history_vendor_date_idx')
+
+    def test_pending_flush(self):
+        """Test the flush reads the oldest queued vendors from the index."""
+        self.assertUsesIndex(
+            PendingPerformanceUpdate.objects.filter(
+                marked_at__lte=timezone.now()).order_by(
+                'marked_at').values_list('vendor_id', flat=True)[:1000],
+            'pending_marked_at_idx')
+
+    def test_listing_sorted_by_metric(self):
+        """Test the listing sorted by a metric is read in the order of its
+        index, without sorting the vendors, with the metrics embedded."""
+        vendors = vendor_listing(QueryDict(
+            'ordering=-on_time_delivery_rate&include=metrics'))[0]
+        plan = self.query_plan(vendors.values('id', 'name')[:10])
+        self.assertIn('USING INDEX vendor_on_time_rate_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_listing_filtered_by_metric(self):
+        """Test the vendors within bounds of a metric are searched in
+        its index."""
+        vendors = vendor_listing(QueryDict(
+            'min_fulfillment_rate=0.9&max_fulfillment_rate=1'
+            '&ordering=fulfillment_rate'))[0]
+        self.assertUsesIndex(vendors[:10], 'vendor_fulfillment_rate_idx')
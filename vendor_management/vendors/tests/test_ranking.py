@@ -0,0 +1,305 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from purchase.models import PurchaseOrder
+from vendors.models import Vendor, PerformanceCounter
+from vendors import ranking
+
+
+class LocalRankingTest(TestCase):
+    '''
+    test the rankings kept in the process
+    '''
+
+    def setUp(self):
+        self.rates = [0.5, 0.9, 0.5, 0.1]
+        self.vendors = [
+            Vendor.objects.create(
+                name=f"Vendor {index}",
+                contact_details="test@example.com",
+                address="123 Test Street",
+                on_time_delivery_rate=rate,
+                average_response_time=rate * 100)
+            for index, rate in enumerate(self.rates)]
+        PerformanceCounter.objects.bulk_create(
+            PerformanceCounter(vendor=vendor, acknowledged_orders=1)
+            for vendor in self.vendors)
+        self.ranking = ranking.LocalRanking()
+
+    def test_top(self):
+        """Test the best vendors are ranked, the ties sharing a rank."""
+        total, entries = self.ranking.top('on_time_delivery_rate', 3)
+        self.assertEqual(total, 4)
+        self.assertEqual(
+            [(entry['rank'], entry['vendor_id'], entry['value'])
+             for entry in entries],
+            [(1, self.vendors[1].id, 0.9), (2, self.vendors[0].id, 0.5),
+             (2, self.vendors[2].id, 0.5)])
+        total, entries = self.ranking.top('on_time_delivery_rate', 2, 2)
+        self.assertEqual(
+            [entry['rank'] for entry in entries], [2, 4])
+        # the lowest response time ranks first
+        total, entries = self.ranking.top('average_response_time', 1)
+        self.assertEqual(entries[0]['vendor_id'], self.vendors[3].id)
+        self.assertEqual(entries[0]['value'], 10.0)
+        self.assertEqual(
+            self.ranking.top('on_time_delivery_rate', 5, 10), (4, []))
+
+    def test_rank(self):
+        """Test the rank and percentile of a vendor."""
+        self.assertEqual(
+            self.ranking.rank('on_time_delivery_rate', self.vendors[1].id),
+            {'value': 0.9, 'rank': 1, 'percentile': 100.0})
+        self.assertEqual(
+            self.ranking.rank('on_time_delivery_rate', self.vendors[2].id),
+            {'value': 0.5, 'rank': 2, 'percentile': 33.33})
+        self.assertEqual(
+            self.ranking.rank('on_time_delivery_rate', self.vendors[3].id),
+            {'value': 0.1, 'rank': 4, 'percentile': 0.0})
+        self.assertIsNone(self.ranking.rank('on_time_delivery_rate', 0))
+
+    def test_update_and_remove(self):
+        """Test a vendor moves with its metrics and leaves when deleted."""
+        self.ranking.ensure_built()
+        self.ranking.update(
+            self.vendors[3].id, {'on_time_delivery_rate': 1.0})
+        self.assertEqual(
+            self.ranking.rank('on_time_delivery_rate', self.vendors[3].id),
+            {'value': 1.0, 'rank': 1, 'percentile': 100.0})
+        self.ranking.remove(self.vendors[1].id)
+        self.assertEqual(self.ranking.size(), 3)
+        total, entries = self.ranking.top('on_time_delivery_rate', 10)
+        self.assertEqual(
+            [entry['vendor_id'] for entry in entries],
+            [self.vendors[3].id, self.vendors[0].id, self.vendors[2].id])
+        self.assertEqual(
+            self.ranking.entries['on_time_delivery_rate'],
+            sorted(self.ranking.entries['on_time_delivery_rate']))
+
+    def test_unmeasured_response_time(self):
+        """Test a vendor without acknowledged orders is not ranked by
+        the response time until one is acknowledged."""
+        PerformanceCounter.objects.filter(vendor=self.vendors[3]).update(
+            acknowledged_orders=0)
+        total, entries = self.ranking.top('average_response_time', 1)
+        self.assertEqual(total, 3)
+        self.assertEqual(entries[0]['vendor_id'], self.vendors[0].id)
+        self.assertIsNone(
+            self.ranking.rank('average_response_time', self.vendors[3].id))
+        self.assertEqual(self.ranking.size(), 4)
+
+        values = {
+            'on_time_delivery_rate': 0.1, 'quality_rating_avg': 0.0,
+            'average_response_time': 1.0, 'fulfillment_rate': 0.0}
+        self.ranking.update(
+            self.vendors[3].id, ranking.ranked_values(values, 1))
+        self.assertEqual(self.ranking.rank(
+            'average_response_time', self.vendors[3].id)['rank'], 1)
+        self.ranking.update(
+            self.vendors[3].id, ranking.ranked_values(values, 0))
+        self.assertEqual(
+            self.ranking.top('average_response_time', 10)[0], 3)
+
+    def test_changes_of_other_processes(self):
+        """Test the vendors moved by another process, such as the flush
+        of the coalesced metrics, are moved in the rankings of a process
+        without reading them again, and the process keeps the vendors it
+        moved itself."""
+        self.assertEqual(self.ranking.size(), 4)
+        other_process = ranking.LocalRanking()
+        other_process.ensure_built()
+        other_process.update(
+            self.vendors[3].id, {'on_time_delivery_rate': 1.0})
+        other_process.remove(self.vendors[1].id)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.ranking.rank(
+                    'on_time_delivery_rate', self.vendors[3].id),
+                {'value': 1.0, 'rank': 1, 'percentile': 100.0})
+            self.assertEqual(self.ranking.size(), 3)
+        self.assertEqual(self.ranking.version, other_process.version)
+        self.assertEqual(self.ranking.entries, other_process.entries)
+
+        version = other_process.version
+        with self.assertNumQueries(0):
+            other_process.ensure_built()
+        self.assertEqual(other_process.version, version)
+
+    def test_rebuild_of_other_processes(self):
+        """Test the rankings are read again when another process asks
+        for it, or when a process fell behind by too many moves."""
+        self.ranking.ensure_built()
+        Vendor.objects.filter(id=self.vendors[3].id).update(
+            on_time_delivery_rate=1.0)
+        other_process = ranking.LocalRanking()
+        other_process.rebuild()
+        other_process.publish()
+        self.assertEqual(self.ranking.rank(
+            'on_time_delivery_rate', self.vendors[3].id)['rank'], 1)
+
+        Vendor.objects.filter(id=self.vendors[3].id).update(
+            on_time_delivery_rate=0.0)
+        for _ in range(ranking.MAX_REPLAYED_MOVES + 1):
+            other_process.update(
+                self.vendors[0].id, {'on_time_delivery_rate': 0.5})
+        self.assertEqual(self.ranking.rank(
+            'on_time_delivery_rate', self.vendors[3].id)['rank'], 4)
+
+    @override_settings(RANKING_LOCAL_TTL=0)
+    def test_expired(self):
+        """Test the rankings are read again after RANKING_LOCAL_TTL, for
+        the vendors written without signals."""
+        self.ranking.ensure_built()
+        Vendor.objects.filter(id=self.vendors[3].id).update(
+            on_time_delivery_rate=1.0)
+        self.assertEqual(
+            self.ranking.rank(
+                'on_time_delivery_rate', self.vendors[3].id)['rank'], 1)
+
+
+class CreateRankingTest(TestCase):
+    '''
+    test the backend of the rankings
+    '''
+
+    @override_settings(RANKING_BACKEND='local')
+    def test_local(self):
+        self.assertIsInstance(
+            ranking.create_ranking(), ranking.LocalRanking)
+
+    @override_settings(RANKING_BACKEND='redis', RANKING_REDIS_URL='')
+    def test_redis_without_url(self):
+        """Test the rankings are kept in the process when Redis has
+        no url."""
+        with self.assertLogs('vendors.ranking', 'WARNING'):
+            self.assertIsInstance(
+                ranking.create_ranking(), ranking.LocalRanking)
+
+    @override_settings(
+        RANKING_BACKEND='redis', RANKING_REDIS_URL='redis://127.0.0.1:1/0')
+    def test_unreachable_redis(self):
+        """Test the rankings are kept in the process when Redis
+        cannot be reached."""
+        with self.assertLogs('vendors.ranking', 'WARNING'):
+            self.assertIsInstance(
+                ranking.create_ranking(), ranking.LocalRanking)
+
+
+class RankingAPITest(TestCase):
+    '''
+    test the leaderboard and rank endpoints
+    '''
+
+    def setUp(self):
+        self.vendors = [
+            Vendor.objects.create(
+                name=f"Vendor {index}",
+                contact_details="test@example.com",
+                address="123 Test Street",
+                fulfillment_rate=index / 10)
+            for index in range(3)]
+        ranking.get_ranking().rebuild()
+        user = User.objects.create_user(username='bon', password='pass')
+        token = Token.objects.create(user=user).key
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def test_leaderboard(self):
+        url = reverse('leaderboard')
+        response = self.client.get(
+            url, {'metric': 'fulfillment_rate', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(response.data['next_offset'], 2)
+        self.assertEqual(response.data['data'][0], {
+            'rank': 1, 'vendor_id': self.vendors[2].id,
+            'value': 0.2, 'name': 'Vendor 2'})
+        response = self.client.get(
+            url, {'metric': 'fulfillment_rate', 'offset': 2})
+        self.assertEqual(
+            [entry['rank'] for entry in response.data['data']], [3])
+        self.assertIsNone(response.data['next_offset'])
+        for params in (
+                {'metric': 'name'}, {'limit': 0}, {'limit': 'ten'},
+                {'offset': -1}):
+            response = self.client.get(url, params)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_vendor_rank(self):
+        url = reverse('vendor_rank', args=[self.vendors[0].id])
+        with self.assertNumQueries(1):
+            # the token only
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(
+            set(response.data['ranks']), set(ranking.METRIC_FIELDS))
+        self.assertEqual(response.data['ranks']['fulfillment_rate'], {
+            'value': 0.0, 'rank': 3, 'percentile': 0.0})
+        response = self.client.get(url, {'metric': 'on_time_delivery_rate'})
+        self.assertEqual(
+            list(response.data['ranks']), ['on_time_delivery_rate'])
+        response = self.client.get(url, {'metric': 'unknown'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('vendor_rank', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_vendor_without_acknowledged_orders(self):
+        """Test a vendor without acknowledged orders does not lead the
+        response time leaderboard with its 0.0 default."""
+        with self.captureOnCommitCallbacks(execute=True):
+            order = PurchaseOrder.objects.create(
+                vendor=self.vendors[1],
+                delivery_date=timezone.now() + timezone.timedelta(1),
+                items={"item1": 10},
+                quantity=10,
+                acknowledgment_date=timezone.now())
+        self.vendors[1].refresh_from_db()
+        self.assertEqual(
+            self.vendors[1].average_response_time,
+            (order.acknowledgment_date - order.issue_date).total_seconds())
+        response = self.client.get(
+            reverse('leaderboard'), {'metric': 'average_response_time'})
+        self.assertEqual(response.data['total'], 1)
+        self.assertEqual(
+            [entry['vendor_id'] for entry in response.data['data']],
+            [self.vendors[1].id])
+        response = self.client.get(
+            reverse('vendor_rank', args=[self.vendors[0].id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['ranks']['average_response_time'])
+
+    def test_rankings_follow_the_vendors(self):
+        """Test the rankings are updated when update_performance writes
+        a vendor and when a vendor is created or deleted."""
+        url = reverse('vendor_rank', args=[self.vendors[0].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            PurchaseOrder.objects.create(
+                vendor=self.vendors[0],
+                delivery_date=timezone.now() + timezone.timedelta(1),
+                items={"item1": 10},
+                quantity=10,
+                status='Completed')
+        response = self.client.get(url, {'metric': 'fulfillment_rate'})
+        self.assertEqual(response.data['ranks']['fulfillment_rate'], {
+            'value': 1.0, 'rank': 1, 'percentile': 100.0})
+
+        deleted_id = self.vendors[2].id
+        with self.captureOnCommitCallbacks(execute=True):
+            created = Vendor.objects.create(
+                name="New Vendor",
+                contact_details="test@example.com",
+                address="123 Test Street")
+            self.vendors[2].delete()
+        response = self.client.get(url)
+        self.assertEqual(response.data['total'], 3)
+        response = self.client.get(reverse('vendor_rank', args=[created.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(
+            reverse('vendor_rank', args=[deleted_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,153 @@
+from django.core import signing
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from django.contrib.auth.models import User
+from datetime import timedelta
+from unittest import mock
+from vendor_management import broadcast
+from vendors.models import Vendor
+from vendors import events, history
+from purchase.models import PurchaseOrder
+import asyncio
+import json
+
+
+class PerformanceStreamTest(TestCase):
+    '''
+    test the publication and the stream of the performance changes
+    '''
+
+    def setUp(self):
+        """Set up non-modified objects used by all test methods."""
+        self.vendor = Vendor.objects.create(
+            name="Test Vendor",
+            contact_details="test@example.com",
+            address="123 Test Street",
+        )
+        self.user = User.objects.create_user(username='bon', password='pass')
+        self.token = Token.objects.create(user=self.user).key
+        self.ticket = self.client.post(
+            reverse('stream_ticket'),
+            headers={'Authorization': f'Token {self.token}'}).data['ticket']
+
+    def test_publish_on_commit(self):
+        """Test that the changes are published once committed."""
+        with mock.patch.object(broadcast, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                events.publish_performance(history.record_snapshot(
+                    self.vendor, on_time_delivery_rate=0.5))
+                # no metric changed, nothing is published
+                events.publish_performance(history.record_snapshot(
+                    self.vendor, on_time_delivery_rate=0.5))
+                publish.assert_not_called()
+            publish.assert_called_once()
+            channel, event = publish.call_args.args
+            self.assertEqual(channel, events.PERFORMANCE_CHANNEL)
+            self.assertEqual(event['vendor_id'], self.vendor.id)
+            self.assertEqual(event['on_time_delivery_rate'], 0.5)
+
+            publish.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                PurchaseOrder.objects.create(
+                    vendor=self.vendor,
+                    delivery_date=timezone.now() + timedelta(days=1),
+                    items={'item1': 'item'},
+                    quantity=1,
+                    status='Completed',
+                    quality_rating=4.0)
+            publish.assert_called_once()
+
+    def test_local_broadcaster(self):
+        """Test that the subscribers of a channel receive its events,
+        the oldest being dropped when they fall behind."""
+        async def receive():
+            broadcaster = broadcast.LocalBroadcaster()
+            subscription = broadcaster.subscribe('channel')
+            for number in range(3):
+                broadcaster.publish('channel', {'number': number})
+            broadcaster.publish('other', {'number': 4})
+            received = [await subscription.get() for number in range(2)]
+            subscription.close()
+            self.assertEqual(broadcaster.subscriptions, {})
+            return received
+
+        with override_settings(BROADCAST_QUEUE_SIZE=2):
+            self.assertEqual(
+                asyncio.run(receive()), [{'number': 1}, {'number': 2}])
+
+    async def test_stream(self):
+        """Test the events of the stream and their filter."""
+        response = await self.async_client.get(
+            reverse('stream_performance'),
+            {'ticket': self.ticket, 'vendor_id': self.vendor.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry: '))
+
+        broadcast.publish(
+            events.PERFORMANCE_CHANNEL, {'vendor_id': self.vendor.id + 1})
+        broadcast.publish(
+            events.PERFORMANCE_CHANNEL,
+            {'vendor_id': self.vendor.id, 'fulfillment_rate': 1.0})
+        chunk = await asyncio.wait_for(anext(stream), 5)
+        name, data = chunk.decode().strip().split('\n')
+        self.assertEqual(name, 'event: performance')
+        self.assertEqual(
+            json.loads(data.removeprefix('data: ')),
+            {'vendor_id': self.vendor.id, 'fulfillment_rate': 1.0})
+        await stream.aclose()
+
+    @override_settings(SSE_KEEPALIVE_SECONDS=0.01, SSE_MAX_SECONDS=0.05)
+    async def test_stream_keepalive_and_end(self):
+        """Test that an idle stream is kept alive and ends."""
+        response = await self.async_client.get(
+            reverse('stream_performance'),
+            headers={'Authorization': f'token {self.token}'})
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertIn(b': keepalive\n\n', chunks)
+        self.assertEqual(broadcast.get_broadcaster().subscriptions, {})
+
+    async def test_stream_errors(self):
+        """Test the errors of the stream."""
+        url = reverse('stream_performance')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(url, {'ticket': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(
+            url, {'ticket': self.ticket, 'vendor_id': 'a'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_stream_tickets(self):
+        """Test that the streams only accept valid tickets, not the
+        tokens, nor the values signed for another purpose."""
+        url = reverse('stream_performance')
+        response = await self.async_client.get(url, {'token': self.token})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(
+            url, {'ticket': signing.TimestampSigner().sign(
+                str(self.user.pk))})
+        self.assertEqual(response.status_code, 401)
+        with override_settings(SSE_TICKET_SECONDS=-1):
+            response = await self.async_client.get(
+                url, {'ticket': self.ticket})
+        self.assertEqual(response.status_code, 401)
+        self.user.is_active = False
+        await self.user.asave()
+        response = await self.async_client.get(url, {'ticket': self.ticket})
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_ticket_needs_token(self):
+        """Test that a ticket is only issued with a token."""
+        response = self.client.post(reverse('stream_ticket'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_needs_asgi(self):
+        """Test that WSGI, which cannot stream the events, is refused."""
+        response = self.client.get(
+            reverse('stream_performance'), {'ticket': self.ticket})
+        self.assertEqual(response.status_code, 501)
@@ -1,9 +1,19 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from vendors.models import Vendor
-from vendors.serializer import VendorSerializer
+from django.utils import timezone
+from vendors.models import Vendor, HistoricalPerformance, PerformanceCounter
+from purchase.models import PurchaseOrder
+from purchase import metrics
+from vendors.serializer import (
+    VendorSerializer, HistoricalPerformanceSerializer)
+from vendor_management.cache import invalidate
+from vendor_management.encoders import encode_values, serializer_fields
+from unittest import mock
 import json
 
 
@@ -168,6 +178,28 @@ class VendorAPITestCase(TestCase):
         self.assertEqual(response.data['average_response_time'], 0)
         self.assertEqual(response.data['fulfillment_rate'], 0)
 
+    def test_view_live_performance(self):
+        PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            delivery_date=timezone.now(),
+            items={"item1": 10},
+            quantity=10,
+            status='Completed',
+            quality_rating=3.5)
+        PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            delivery_date=timezone.now(),
+            items={"item1": 10},
+            quantity=10)
+        response = self.client.get(
+            reverse(
+                'view_performance', kwargs={
+                    'vendor_id': self.vendor.id}), {'live': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['vendor_id'], self.vendor.id)
+        self.assertEqual(response.data['quality_rating_avg'], 3.5)
+        self.assertEqual(response.data['fulfillment_rate'], 0.5)
+
     def test_view_performance(self):
 
         response = self.client.get(
@@ -177,3 +209,263 @@ class VendorAPITestCase(TestCase):
                     'vendor_id': 333}))
         # Assert that the response status code is 200 OK
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_vendor_is_evicted(self):
+        url = reverse(
+            'get_or_update_vendor', kwargs={'vendor_id': self.vendor.id})
+        self.assertEqual(self.client.get(url).data['fulfillment_rate'], 0.0)
+        # the metrics written by update_performance evict the vendor
+        PurchaseOrder.objects.create(
+            vendor=self.vendor,
+            delivery_date=timezone.now(),
+            items={"item1": 10},
+            quantity=10,
+            status='Completed')
+        self.assertEqual(self.client.get(url).data['fulfillment_rate'], 1.0)
+
+        self.client.put(url, {'name': 'Updated Vendor'})
+        self.assertEqual(self.client.get(url).data['name'], 'Updated Vendor')
+
+    def test_retrieve_vendor_from_cache(self):
+        for name in ('get_or_update_vendor', 'view_performance'):
+            url = reverse(name, kwargs={'vendor_id': self.vendor.id})
+            self.client.get(url)
+            # the token and the row are both cached
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            missing = reverse(name, kwargs={'vendor_id': 4545})
+            self.client.get(missing)
+            with self.assertNumQueries(0):
+                response = self.client.get(missing)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_entries_of_an_earlier_format(self):
+        """Test that the entries cached by a release writing another
+        payload format are not read."""
+        for name, key in (
+                ('get_or_update_vendor', f'Vendor_{self.vendor.id}'),
+                ('view_performance', f'Performance_{self.vendor.id}')):
+            cache.set(key, ('"etag"', None, b'{}'))
+            response = self.client.get(
+                reverse(name, kwargs={'vendor_id': self.vendor.id}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['fulfillment_rate'], 0.0)
+
+    def test_list_vendors_cursor(self):
+        for _ in range(4):
+            Vendor.objects.create(**self.vendor_data)
+        url = reverse('create_or_list_vendor')
+        response = self.client.get(url, {'cursor': 'true', 'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['page_size'], 2)
+        self.assertNotIn('total_pages', response.data)
+        seen = [vendor['id'] for vendor in response.data['data']]
+        while response.data['next_cursor']:
+            response = self.client.get(url, {
+                'after': response.data['next_cursor'], 'page_size': 2})
+            seen += [vendor['id'] for vendor in response.data['data']]
+        self.assertEqual(
+            seen, list(Vendor.objects.order_by('id').values_list(
+                'id', flat=True)))
+
+        response = self.client.get(url, {'after': 'not a cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_vendors_total_count(self):
+        url = reverse('create_or_list_vendor')
+        Vendor.objects.create(**self.vendor_data)
+        response = self.client.get(url, {'page_size': 1})
+        total_pages = response.data['total_pages']
+        self.assertEqual(total_pages, Vendor.objects.count())
+        # the count and the token are cached: page
+        with self.assertNumQueries(1):
+            self.client.get(url, {'page_size': 1})
+        Vendor.objects.first().delete()
+        response = self.client.get(url, {'page_size': 1})
+        self.assertEqual(response.data['total_pages'], total_pages - 1)
+
+    def test_export_performance(self):
+        vendor = Vendor.objects.create(**self.vendor_data)
+        for rate in (0.5, 0.75):
+            HistoricalPerformance.objects.create(
+                vendor=vendor, fulfillment_rate=rate)
+        url = reverse('export_performance', kwargs={'vendor_id': vendor.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        expected = HistoricalPerformanceSerializer(
+            HistoricalPerformance.objects.filter(
+                vendor=vendor).order_by('date', 'id'), many=True).data
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+        response = self.client.get(url, {'export_format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+        url = reverse('export_performance', kwargs={'vendor_id': 0})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_encoding_matches_serializer(self):
+        Vendor.objects.create(
+            name="Vendeur ünicode",
+            address="1 Rue",
+            contact_details="",
+            on_time_delivery_rate=0.333333333333)
+        vendors = Vendor.objects.order_by('id')
+        expected = JSONRenderer().render(
+            VendorSerializer(vendors, many=True).data)
+        encoded = JSONRenderer().render(encode_values(
+            VendorSerializer,
+            vendors.values(*serializer_fields(VendorSerializer))))
+        self.assertEqual(encoded, expected)
+
+        response = self.client.get(
+            reverse('create_or_list_vendor'), {'cursor': 'true'})
+        self.assertEqual(
+            response.data['data'],
+            VendorSerializer(vendors, many=True).data)
+
+    def test_view_performance_conditional(self):
+        url = reverse('view_performance', kwargs={'vendor_id': self.vendor.id})
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # update_performance saves the vendor, which bumps the version
+        with self.captureOnCommitCallbacks(execute=True):
+            PurchaseOrder.objects.create(
+                vendor=self.vendor,
+                delivery_date=timezone.now(),
+                items={"item1": 10},
+                quantity=10,
+                status='Completed')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Last-Modified', response)
+
+    def test_list_vendors_include(self):
+        other = Vendor.objects.create(**self.vendor_data)
+        with self.captureOnCommitCallbacks(execute=True):
+            for status_, rating in (
+                    ('Completed', 4.0), ('Completed', None),
+                    ('Canceled', None), ('Pending', None)):
+                PurchaseOrder.objects.create(
+                    vendor=self.vendor,
+                    delivery_date=timezone.now() + timezone.timedelta(1),
+                    items={"item1": 10},
+                    quantity=10,
+                    status=status_,
+                    quality_rating=rating)
+        url = reverse('create_or_list_vendor')
+        # the token is read by the first request
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, {'include': 'order_counts,metrics', 'cursor': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first, second = response.data['data']
+        self.assertEqual(first['order_counts'], {
+            'total': 4, 'open': 1, 'completed': 2, 'canceled': 1})
+        self.assertEqual(second['order_counts'], {
+            'total': 0, 'open': 0, 'completed': 0, 'canceled': 0})
+        self.assertEqual(second['id'], other.id)
+        self.assertEqual(set(second['metrics'].values()), {0.0})
+
+        live = self.client.get(
+            reverse('view_performance', args=[self.vendor.id]),
+            {'live': 'true'}).data
+        for field, value in first['metrics'].items():
+            self.assertAlmostEqual(value, live[field], places=2)
+        self.assertEqual(first['name'], self.vendor.name)
+        self.assertNotIn('total_orders', first)
+
+        response = self.client.get(url, {'include': 'metrics'})
+        self.assertNotIn('order_counts', response.data['data'][0])
+
+    def test_list_vendors_ordering_and_filters(self):
+        url = reverse('create_or_list_vendor')
+        rates = [0.9, 0.5, 0.9, 1.0]
+        vendors = [self.vendor] + [
+            Vendor.objects.create(**self.vendor_data) for _ in rates[1:]]
+        for vendor, rate in zip(vendors, rates):
+            PerformanceCounter.objects.create(
+                vendor=vendor, total_orders=10,
+                completed_orders=int(rate * 10),
+                on_time_orders=int(rate * 10) if rate < 1 else 0)
+        # the stored metrics are written from the counters
+        metrics.refresh_vendor_metrics([vendor.id for vendor in vendors])
+        response = self.client.get(
+            url, {'ordering': '-fulfillment_rate'})
+        self.assertEqual(
+            [vendor['id'] for vendor in response.data['data']],
+            [vendors[3].id, vendors[2].id, vendors[0].id, vendors[1].id])
+
+        response = self.client.get(url, {
+            'min_fulfillment_rate': '0.9', 'max_fulfillment_rate': 0.95,
+            'ordering': 'fulfillment_rate', 'include': 'metrics'})
+        self.assertEqual(
+            [vendor['id'] for vendor in response.data['data']],
+            [vendors[0].id, vendors[2].id])
+        self.assertEqual(response.data['total_pages'], 1)
+        for vendor in response.data['data']:
+            self.assertAlmostEqual(vendor['metrics']['fulfillment_rate'], 0.9)
+            self.assertEqual(vendor['fulfillment_rate'], 0.9)
+
+        response = self.client.get(url, {
+            'max_on_time_delivery_rate': 0.1, 'include': 'metrics'})
+        self.assertEqual(
+            [vendor['id'] for vendor in response.data['data']],
+            [vendors[3].id])
+        self.assertEqual(
+            response.data['data'][0]['metrics']['on_time_delivery_rate'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PurchaseOrder.objects.create(
+                vendor=vendors[1],
+                delivery_date=timezone.now(),
+                items={"item1": 10},
+                quantity=10)
+        response = self.client.get(url, {'ordering': '-open_orders'})
+        self.assertEqual(response.data['data'][0]['id'], vendors[1].id)
+        response = self.client.get(
+            url, {'min_total_orders': 11, 'cursor': 'true'})
+        self.assertEqual(
+            [vendor['id'] for vendor in response.data['data']],
+            [vendors[1].id])
+
+    def test_list_vendors_invalid_parameters(self):
+        url = reverse('create_or_list_vendor')
+        for params in (
+                {'include': 'orders'}, {'ordering': 'address'},
+                {'min_fulfillment_rate': 'high'},
+                {'ordering': 'name', 'cursor': 'true'}):
+            response = self.client.get(url, params)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class InvalidateTest(TransactionTestCase):
+    '''
+    test the eviction of the cached entries
+    '''
+
+    def test_autocommit(self):
+        """Test that the keys are evicted once outside a transaction."""
+        with mock.patch('vendor_management.cache.cache') as cache:
+            invalidate(['Vendor_1'])
+        cache.delete_many.assert_called_once_with(['Vendor_1'])
+
+    def test_transaction(self):
+        """Test that the keys are evicted again once the transaction
+        commits."""
+        with mock.patch('vendor_management.cache.cache') as cache:
+            with transaction.atomic():
+                invalidate(['Vendor_1'])
+                self.assertEqual(cache.delete_many.call_count, 1)
+            self.assertEqual(cache.delete_many.call_count, 2)
@@ -2,20 +2,48 @@
 This module regiister endpoints to view fuctions
 '''
 
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, streams, views
+
+# the GET requests are served by coroutines under ASGI
+api = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # list all vendors or create vendors
-    path('', views.create_or_list_vendor, name='create_or_list_vendor'),
+    path('', api.create_or_list_vendor, name='create_or_list_vendor'),
+    # stream the performance changes as server-sent events
+    path(
+        'performance/stream',
+        streams.stream_performance,
+        name='stream_performance'),
+    # a short-lived ticket opening the stream without the token
+    path(
+        'performance/stream/ticket',
+        streams.stream_ticket,
+        name='stream_ticket'),
+    # the best vendors by a metric
+    path('leaderboard', views.leaderboard, name='leaderboard'),
     # update, delete or get  a vendor with a given id
     path(
         '<int:vendor_id>/',
-        views.get_or_update_vendor,
+        api.get_or_update_vendor,
         name='get_or_update_vendor'),
     # view performance
     path(
         '<int:vendor_id>/performance',
-        views.view_performance,
+        api.view_performance,
         name='view_performance'),
+    # rank of a vendor by its metrics
+    path('<int:vendor_id>/rank', views.vendor_rank, name='vendor_rank'),
+    # performance history
+    path(
+        '<int:vendor_id>/performance/history',
+        views.get_performance,
+        name='get_performance'),
+    # stream the performance history
+    path(
+        '<int:vendor_id>/performance/export',
+        views.export_performance,
+        name='export_performance'),
 ]
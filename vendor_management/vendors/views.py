@@ -7,10 +7,35 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from .serializer import VendorSerializer, HistoricalPerformanceSerializer
 import uuid
-from django.core.cache import cache
+from django.conf import settings
+from vendor_management.pagination import (
+    wants_cursor, cursor_page, wants_exact_count, total_count,
+    numbered_page)
+from vendor_management.cache import (
+    vendor_key, performance_key, get_or_load, rendered, current_version,
+    version_etag)
+from vendor_management.conditional import cached_response, not_modified
+from django.db.models import OuterRef, Subquery
+from django.http import Http404
+from functools import partial
+from vendor_management.encoders import (
+    CONTENT_TYPES, export_response, encode_values, serializer_fields)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
+from . import history, listing, ranking
+
+# number of rows read per query by the export endpoint
+EXPORT_CHUNK_SIZE = 2000
+# leaderboard page when the request does not ask for a size
+DEFAULT_LEADERBOARD_LIMIT = 50
+# columns of the export, in the order of HistoricalPerformanceSerializer
+EXPORT_FIELDS = (
+    'id', 'date', 'on_time_delivery_rate', 'quality_rating_avg',
+    'average_response_time', 'fulfillment_rate', 'vendor')
+
 # Create your views here.
 
 
@@ -24,6 +49,17 @@ def create_or_list_vendor(request):
     - GET: Lists vendors, with pagination support.
             The number of vendors per page can be specified using
             the 'page_size' query parameter.
+            With `cursor=true`, or `after=<next_cursor of the previous
+            page>`, keyset pagination is used instead: no count is made
+            and every page costs the same whatever its depth.
+            The total is cached until a vendor is created or deleted,
+            `exact_count=false` accepts an estimate.
+            `include=metrics,order_counts` embeds the current metrics
+            and the order counts of every vendor, read in the same
+            query; `ordering` and `min_<field>`/`max_<field>` sort and
+            filter the vendors by their stored metrics, written from the
+            same counters, or by their order counts (see listing.py),
+            the keyset pagination keeping the order of the ids.
     - POST: Creates a new vendor with the data provided in the request body.
 
     Parameters:
@@ -50,34 +86,17 @@ def create_or_list_vendor(request):
     """
     # if the request is GET, list all the vendors
     if request.method == 'GET':
-        all_vendors = Vendor.objects.all().order_by('id')
-    
         try:
-            page_number = request.query_params.get('page', 1)
-            page_size = request.query_params.get('page_size', 10)
-            p = Paginator(all_vendors, page_size)
-
-            page_obj = p.get_page(int(page_number))
-
-        # if page is empty then return last page
-        except EmptyPage:
-            page_obj = p.page(p.num_pages)
-        # if page_number is not an integer then assign the first page
-        except (PageNotAnInteger, Exception):
-            page_obj = p.page(1)
-        finally:
-            serialise = VendorSerializer(page_obj, many=True)
-            results = {
-                'data': serialise.data,
-                "next_page": page_obj.next_page_number() if
-                page_obj.has_next() else None,
-                "page": page_obj.number,
-                "page_size": len(
-                    page_obj.object_list),
-                "prev_page": page_obj.previous_page_number() if
-                page_obj.has_previous() else None,
-                "total_pages": p.num_pages}
-            return Response(results, status.HTTP_200_OK)
+            all_vendors, rows, includes = listing_rows(request)
+            if wants_cursor(request):
+                page, pagination = cursor_page(request, rows)
+            else:
+                count = total_count(all_vendors, wants_exact_count(request))
+                page, pagination = numbered_page(request, rows, count)
+        except ValueError as error:
+            return Response(f'Error : {error}', status.HTTP_400_BAD_REQUEST)
+        return Response(
+            listing_page(page, pagination, includes), status.HTTP_200_OK)
     # if the request method is POST
     # deserialiser from pyhton to django object with exception set to true
     serializer = VendorSerializer(data=request.data)
@@ -89,6 +108,157 @@ def create_or_list_vendor(request):
     return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
 
+def listing_rows(request):
+    '''
+    Build the vendors of the listing, for the sync and the async views.
+
+    Parameters:
+    - request: The HTTP request object.
+
+    Returns:
+    - The vendors, the rows read for a page of them and the data to
+        embed.
+
+    Raises:
+    - ValueError: If an include, the ordering or a bound is not valid,
+        or the ordering is asked for with the cursor pagination.
+    '''
+    all_vendors, includes, sorted_ = listing.vendor_listing(
+        request.query_params)
+    if sorted_ and wants_cursor(request):
+        raise ValueError(
+            'ordering is not supported with the cursor pagination')
+    # the page is read as dicts and encoded without the serializer
+    rows = all_vendors.values(
+        *serializer_fields(VendorSerializer),
+        *listing.annotations(includes))
+    return all_vendors, rows, includes
+
+
+def listing_page(page, pagination, includes):
+    '''
+    Returns:
+    - The body of a page of the listing, from its rows and its
+        pagination information.
+    '''
+    return {
+        'data': listing.nest(encode_values(VendorSerializer, page), includes),
+        **pagination}
+
+
+def missing_vendor(vendor_id):
+    '''
+    Returns:
+    - The message of the responses for a vendor which does not exist.
+    '''
+    return f'Vendor with ID {vendor_id} does not exist.'
+
+
+def vendor_payload(vendor, key, version):
+    '''
+    Render a vendor for the cache.
+
+    Parameters:
+    - vendor: The vendor, None if it does not exist.
+    - key: Its cache key.
+    - version: The version of the key, read before the vendor.
+
+    Returns:
+    - The rendered vendor (see cache.rendered),
+        or None if it does not exist.
+    '''
+    if vendor:
+        return rendered(
+            VendorSerializer(vendor).data, version_etag(key, version))
+
+
+def load_vendor(vendor_id):
+    '''
+    Serialize a vendor for the cache.
+
+    Parameters:
+    - vendor_id: The unique identifier of the vendor.
+
+    Returns:
+    - The rendered vendor (see cache.rendered),
+        or None if it does not exist.
+    '''
+    key = vendor_key(vendor_id)
+    # read before the row, a change made meanwhile bumps it again
+    version = current_version(key)
+    return vendor_payload(
+        Vendor.objects.filter(id=vendor_id).first(), key, version)
+
+
+def performance_query(vendor_id):
+    '''
+    Returns:
+    - The query of a vendor with the date of its last history record,
+        which gives the Last-Modified date of its metrics.
+    '''
+    return Vendor.objects.filter(id=vendor_id).annotate(
+        last_recorded=Subquery(HistoricalPerformance.objects.filter(
+            vendor=OuterRef('pk')).order_by('-date').values('date')[:1]))
+
+
+def performance_payload(vendor, key, version):
+    '''
+    Render the performance metrics of a vendor for the cache.
+
+    Parameters:
+    - vendor: The vendor read by performance_query, None if it does not
+        exist.
+    - key: Its cache key.
+    - version: The version of the key, read before the vendor.
+
+    Returns:
+    - The rendered performance metrics (see cache.rendered),
+        or None if the vendor does not exist.
+    '''
+    if vendor:
+        return rendered({
+            'vendor_id': vendor.id,
+            'on_time_delivery_rate': vendor.on_time_delivery_rate,
+            'quality_rating_avg': vendor.quality_rating_avg,
+            'average_response_time': vendor.average_response_time,
+            'fulfillment_rate': vendor.fulfillment_rate
+        }, version_etag(key, version), vendor.last_recorded)
+
+
+def load_performance(vendor_id):
+    '''
+    Read the performance metrics of a vendor for the cache.
+
+    Parameters:
+    - vendor_id: The unique identifier of the vendor.
+
+    Returns:
+    - The rendered performance metrics (see cache.rendered),
+        or None if the vendor does not exist.
+    '''
+    key = performance_key(vendor_id)
+    version = current_version(key)
+    return performance_payload(
+        performance_query(vendor_id).first(), key, version)
+
+
+def live_performance(vendor):
+    '''
+    Returns:
+    - The metrics of a vendor read with_live_metrics, 0 when there is
+        nothing to compute them from.
+    '''
+    response_time = vendor.live_average_response_time
+    return {
+        'vendor_id': vendor.id,
+        'on_time_delivery_rate': vendor.live_on_time_delivery_rate or 0.0,
+        'quality_rating_avg': vendor.live_quality_rating_avg or 0.0,
+        'average_response_time':
+            response_time.total_seconds() if response_time else 0.0,
+        'fulfillment_rate': vendor.live_fulfillment_rate or 0.0
+    }
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def get_or_update_vendor(request, vendor_id):
@@ -110,22 +280,31 @@ def get_or_update_vendor(request, vendor_id):
         a success message upon update or deletion,
         or an error message if the operation fails.
 
+    The details are served from the cache without querying the
+    database, missing ids included. They carry an ETag, and requests
+    with the current one in If-None-Match get a 304.
+
     Raises:
     - Http404: If the specified vendor does not exist.
     - PermissionDenied: If the user does not have the
         required permissions to perform the operation.
     """
-    vendor = get_object_or_404(Vendor, id=str(vendor_id))
     if request.method == 'GET':
-        cached_data = cache.get(f'Vendor_{vendor_id}')
-        if cached_data:
-            return Response(cached_data, status.HTTP_200_OK)
-        # retrive the data of that vendor
-        serialise = VendorSerializer(vendor)
-        data = serialise.data
-        cache.set(f'Vendor_{vendor_id}', data, timeout=60)
-        return Response(data, status.HTTP_200_OK)
-    elif request.method == 'PUT':
+        # retrive the data of that vendor, from the cache when possible
+        key = vendor_key(vendor_id)
+        # the client already holds the current version
+        response = not_modified(request, key)
+        if response is not None:
+            return response
+        payload = get_or_load(
+            key, partial(load_vendor, vendor_id),
+            settings.VENDOR_CACHE_TIMEOUT)
+        if payload is None:
+            raise Http404
+        return cached_response(request, payload)
+
+    vendor = get_object_or_404(Vendor, id=str(vendor_id))
+    if request.method == 'PUT':
         # update the object
         serialise = VendorSerializer(vendor, data=request.data, partial=True)
         if serialise.is_valid():
@@ -141,12 +320,83 @@ def get_or_update_vendor(request, vendor_id):
     return Response(f'Vendor: {name} created sucesfully deleted')
 
 
+def parse_range_date(value, default):
+    '''
+    Parse a bound of a history range.
+
+    Parameters:
+    - value: The ISO 8601 date from the query, naive dates are taken in
+        the current time zone.
+    - default: The date used when the value is missing.
+
+    Returns:
+    - The aware datetime.
+
+    Raises:
+    - ValueError: If the value is not a valid date.
+    '''
+    if not value:
+        return default
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Invalid date {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def performance_range(request, vendor_id):
+    '''
+    Read the performance history of a vendor over the range asked for
+        with `start` and `end`, at the resolution asked for with
+        `resolution` or else at the best one for the range.
+
+    Parameters:
+    - request: The HTTP request object.
+    - vendor_id: The unique identifier of the vendor.
+
+    Returns:
+    - The response with the series of the range.
+    '''
+    params = request.query_params
+    resolution = params.get('resolution')
+    try:
+        end = parse_range_date(params.get('end'), timezone.now())
+        start = parse_range_date(
+            params.get('start'), end - timedelta(days=1))
+        if resolution is not None and resolution not in history.RESOLUTIONS:
+            raise ValueError(f'Invalid resolution {resolution}')
+    except ValueError as error:
+        return Response(f'Error : {error}', status.HTTP_400_BAD_REQUEST)
+    if not Vendor.objects.filter(id=vendor_id).exists():
+        return Response(
+            missing_vendor(vendor_id), status=status.HTTP_404_NOT_FOUND)
+    resolution, points = history.series(vendor_id, start, end, resolution)
+    return Response({
+        'vendor_id': vendor_id,
+        'resolution': resolution,
+        'data': points})
+
+
+def wants_range(request):
+    '''
+    Returns:
+    - True if the request asks for a range of the performance history.
+    '''
+    params = request.query_params
+    return any(name in params for name in ('start', 'end', 'resolution'))
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_performance(request, vendor_id):
     '''
     Retrieve performance metrics for a specific vendor.
 
+    With `start`, `end` or `resolution`, the history over the range is
+        read at the best resolution for it instead, see
+        `performance_range`.
+
     Parameters:
         request (HttpRequest): The request object sent by the client.
         vendor_id (int): The ID of the vendor whose performance metrics are t
@@ -156,6 +406,8 @@ def get_performance(request, vendor_id):
         HttpResponse: A JSON response containing the performance
         metrics for the specified vendor.
     '''
+    if wants_range(request):
+        return performance_range(request, vendor_id)
     vendor = get_object_or_404(Vendor, id=vendor_id)
     performance = HistoricalPerformance.objects.filter(vendor=vendor).values()
 
@@ -172,6 +424,17 @@ def view_performance(request, vendor_id):
         records for a vendor specified by `vendor_id`.
     It supports pagination through query parameters `page` and `page_size`.
 
+    The stored metrics are served from the cache without querying the
+        database, missing ids included. They carry an ETag and the date
+        of the last history record as Last-Modified, and conditional
+        requests get a 304 when the metrics did not change.
+    With `live=true` the metrics are computed from the purchase orders
+        of the vendor in a single aggregate query instead of being read
+        from the stored values, and are not rounded.
+    With `start`, `end` (ISO 8601 dates) or `resolution` (raw, hour, day
+        or week), the history of the metrics over the range is returned,
+        by default at the finest resolution keeping the series short.
+
     Parameters:
     - request: The HTTP request object.
     - vendor_id: The ID of the vendor for which to
@@ -181,23 +444,165 @@ def view_performance(request, vendor_id):
     - A JSON response containing the paginated historical performance data,
         along with pagination information.
     """
+    if wants_range(request):
+        return performance_range(request, vendor_id)
     try:
-        # Correctly use .only() with field names as strings
-        vendor = Vendor.objects.filter(id=vendor_id).first()
+        if request.query_params.get('live') != 'true':
+            key = performance_key(vendor_id)
+            response = not_modified(request, key)
+            if response is not None:
+                return response
+            payload = get_or_load(
+                key, partial(load_performance, vendor_id),
+                settings.VENDOR_CACHE_TIMEOUT)
+            if payload is None:
+                return Response(
+                    missing_vendor(vendor_id),
+                    status=status.HTTP_404_NOT_FOUND)
+            return cached_response(request, payload)
 
+        vendor = Vendor.objects.filter(
+            id=vendor_id).with_live_metrics().first()
         if not vendor:
             return Response(
-                f'Vendor with ID {vendor_id} does not exist.',
-                status=status.HTTP_404_NOT_FOUND)
-        data = {
-            'vendor_id': vendor.id,
-            'on_time_delivery_rate': vendor.on_time_delivery_rate,
-            'quality_rating_avg': vendor.quality_rating_avg,
-            'average_response_time': vendor.average_response_time,
-            'fulfillment_rate': vendor.fulfillment_rate
-        }
-
-        return Response(data)
+                missing_vendor(vendor_id), status=status.HTTP_404_NOT_FOUND)
+        return Response(live_performance(vendor))
     except Exception as e:
         # Handle any unexpected errors
         return Response(str(e), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_performance(request, vendor_id):
+    '''
+    Stream the whole performance history of a vendor, oldest first,
+        for loads into the data warehouse.
+
+    The rows are read in chunks of EXPORT_CHUNK_SIZE and encoded while
+        they are sent, so memory does not grow with the history.
+
+    Parameters:
+    - request: The HTTP request object, with the optional `export_format`
+        query parameter (`ndjson`, the default, or `csv`).
+    - vendor_id: The ID of the vendor.
+
+    Returns:
+    - A streamed file with one historical performance record per line,
+        with the same fields as HistoricalPerformanceSerializer.
+    '''
+    export_format = request.query_params.get('export_format', 'ndjson')
+    if export_format not in CONTENT_TYPES:
+        return Response(
+            f'Error : Unsupported export format {export_format}',
+            status.HTTP_400_BAD_REQUEST)
+    if not Vendor.objects.filter(id=vendor_id).exists():
+        return Response(
+            missing_vendor(vendor_id), status=status.HTTP_404_NOT_FOUND)
+    rows = HistoricalPerformance.objects.filter(
+        vendor_id=vendor_id).order_by('date', 'id').values_list(
+        *EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return export_response(
+        export_format, EXPORT_FIELDS, rows, f'performance_{vendor_id}')
+
+
+def ranked_metric(request, default=None):
+    '''
+    Returns:
+    - The metric asked for with `metric`, `default` when missing.
+
+    Raises:
+    - ValueError: If the vendors are not ranked by the metric.
+    '''
+    metric = request.query_params.get('metric', default)
+    if metric is not None and metric not in ranking.METRIC_FIELDS:
+        raise ValueError(
+            f'Unknown metric {metric}, expected one of '
+            f'{", ".join(ranking.METRIC_FIELDS)}')
+    return metric
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def leaderboard(request):
+    '''
+    List the best vendors by a performance metric.
+
+    The vendors are read in order from the rankings (see ranking.py)
+        rather than sorted on each request, and their names in a single
+        query by primary key, so a page costs the same whatever the
+        number of vendors. The average response time ranks the lowest
+        value first, the other metrics the highest.
+
+    Parameters:
+    - request: The HTTP request object, with the optional `metric`
+        (on_time_delivery_rate by default), `limit` (50 by default, up
+        to LEADERBOARD_MAX_LIMIT) and `offset` query parameters.
+
+    Returns:
+    - The rank, id, name and value of the vendors of the page, the
+        number of vendors ranked and the offset of the next page.
+    '''
+    try:
+        metric = ranked_metric(request, 'on_time_delivery_rate')
+        limit = int(request.query_params.get(
+            'limit', DEFAULT_LEADERBOARD_LIMIT))
+        offset = int(request.query_params.get('offset', 0))
+        if not 0 < limit <= settings.LEADERBOARD_MAX_LIMIT or offset < 0:
+            raise ValueError(
+                f'limit must be between 1 and '
+                f'{settings.LEADERBOARD_MAX_LIMIT}, offset positive')
+    except ValueError as error:
+        return Response(f'Error : {error}', status.HTTP_400_BAD_REQUEST)
+    total, entries = ranking.get_ranking().top(metric, limit, offset)
+    names = dict(Vendor.objects.filter(
+        id__in=[entry['vendor_id'] for entry in entries]).values_list(
+        'id', 'name'))
+    data = [
+        {**entry, 'name': names[entry['vendor_id']]} for entry in entries
+        # deleted by another process since the rankings were read
+        if entry['vendor_id'] in names]
+    return Response({
+        'metric': metric,
+        'total': total,
+        'data': data,
+        'next_offset': offset + limit if offset + limit < total else None,
+    }, status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def vendor_rank(request, vendor_id):
+    '''
+    Retrieve the rank and percentile of a vendor by its metrics, read
+        from the rankings without querying the database.
+
+    Parameters:
+    - request: The HTTP request object, with the optional `metric` query
+        parameter, every metric when missing.
+    - vendor_id: The ID of the vendor.
+
+    Returns:
+    - The value, rank and percentile of the vendor for each metric,
+        None for the response time of a vendor without acknowledged
+        orders, and the number of vendors ranked.
+    '''
+    try:
+        metric = ranked_metric(request)
+    except ValueError as error:
+        return Response(f'Error : {error}', status.HTTP_400_BAD_REQUEST)
+    rankings = ranking.get_ranking()
+    ranks = {
+        field: rankings.rank(field, vendor_id)
+        for field in ([metric] if metric else ranking.METRIC_FIELDS)}
+    # every vendor is ranked by the first metric, the vendors without
+    # acknowledged orders are not ranked by the response time
+    first = ranking.METRIC_FIELDS[0]
+    if (ranks.get(first) or rankings.rank(first, vendor_id)) is None:
+        return Response(
+            missing_vendor(vendor_id), status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'vendor_id': vendor_id,
+        'total': rankings.size(),
+        'ranks': ranks,
+    }, status.HTTP_200_OK)